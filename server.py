@@ -1,57 +1,199 @@
-from server.playerHandler import PlayerHandler
+from server.playerHandler import PlayerHandler, interest_radius
+from server.chatHandler import ChatHandler
+from server.streamServer import StreamServer
+from server.udpServer import UdpServer
+from server.sharedTable import SharedPlayerHandler, SharedChatHandler, SharedRateLimiter
+from server.stateStore import StateStore, SAVE_INTERVAL
+from server.rateLimiter import RateLimiter
+from server.recorder import Recorder
+from server.protocol import BINARY_CONTENT_TYPE, encode_snapshot, decode_update
+from server.metrics import REGISTRY
 
 from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+import argparse
+import asyncio
 import json
+import math
+import multiprocessing
+import random
+import signal
+import sys
+import threading
+import time
 PORT = 8989
-MESSAGES = []
+STATE_FILE = "saves/server_state.json" # relative to where server.py is started
+DEFAULT_INTEREST_RADIUS = 0 # tiles, 0 = whole map
+ENCODINGS = ["json", "binary"] # update bodies POST /players accepts, advertised by /register
+LOG_SAMPLE_RATE = 0.0 # fraction of requests written to stderr, errors are always logged
+CHAT_HANDLER = ChatHandler()
 
 PLAYER_HANDLER = PlayerHandler()
 PLAYER_HANDLER.start()
+RATE_LIMITER = RateLimiter()
+RECORDER = None # --record
+
+# Metrics
+ROUTES = {"/", "/register", "/players", "/chat", "/sync", "/heartbeat", "/metrics"} # anything else is "other", keeps label count bounded
+REQUESTS = REGISTRY.counter("http_requests_total", "HTTP requests", ("method", "route", "code"))
+LATENCY = REGISTRY.histogram("http_request_duration_seconds", "HTTP request handling time", ("route",))
+BYTES_SENT = REGISTRY.counter("http_bytes_sent_total", "Response body bytes", ("route",))
+BYTES_RECEIVED = REGISTRY.counter("http_bytes_received_total", "Request body bytes", ("route",))
+REGISTRY.gauge("players_active", "Registered players per map", ("map",),
+               lambda: {(m,): n for m, n in PLAYER_HANDLER.players_per_map().items()})
+REGISTRY.gauge("chat_last_id", "Id of the newest chat message", (), lambda: {(): CHAT_HANDLER.last_id})
     
 class Handler(BaseHTTPRequestHandler):
     protocol_version = "HTTP/1.1" # Enable Keep-Alive
+    disable_nagle_algorithm = True # headers and body go out as two writes, Nagle + delayed ACK adds ~40ms
 
-    # def log_message(self, fmt, *args):
-    #     return
+    def log_request(self, code="-", size="-"):
+        # stderr on every request is I/O on the hot path, only log a sample
+        if LOG_SAMPLE_RATE > 0 and random.random() < LOG_SAMPLE_RATE:
+            super().log_request(code, size)
 
     def do_GET(self):
-        if self.path == "/":
+        self._measured(self.handle_get)
+
+    def do_POST(self):
+        self._measured(self.handle_post)
+
+    def _measured(self, handler) -> None:
+        self._status = 0
+        self._bytes_sent = 0
+        self._request_body = b""
+        self._reply = "" # what the client sends back later, the replay maps it
+        self._content_length = _content_length(self.headers.get("Content-Length"))
+        arrived = time.time()
+        t0 = time.perf_counter()
+        try:
+            if self._content_length is None:
+                # no telling where the body ends, so the connection can't be reused either
+                self._json(400, {"error": "invalid_content_length"}, {"Connection": "close"})
+            else:
+                handler()
+        finally:
+            if RECORDER:
+                RECORDER.record_http(arrived, self.command, self.path, self.headers, self._request_body, self._status, self._reply)
+            route = urlsplit(self.path).path
+            if route not in ROUTES:
+                route = "other"
+            REQUESTS.inc((self.command, route, self._status))
+            LATENCY.observe((route,), time.perf_counter() - t0)
+            BYTES_SENT.inc((route,), self._bytes_sent)
+            BYTES_RECEIVED.inc((route,), len(self._request_body))
+
+    def handle_get(self):
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+
+        if url.path == "/":
             self._json(200, {"status": "ok"})
             return
             
-        if self.path == "/register":
-            pid = PLAYER_HANDLER.register()
-            self._json(200, {"message": "registration successful", "id": pid})
+        if url.path == "/metrics":
+            if query.get("format") == ["json"]:
+                self._json(200, REGISTRY.to_dict())
+            else:
+                self._send(200, "text/plain; version=0.0.4", REGISTRY.render().encode("utf-8"))
+            return
+            
+        if url.path == "/register":
+            # ?token= from an earlier /register gets the same id back if the player is still resumable
+            try:
+                pid, token = PLAYER_HANDLER.register(query.get("token", [None])[0])
+            except RuntimeError: # shared table is full (--workers)
+                self._json(503, {"error": "server_full"})
+                return
+            self._reply = f"{pid} {token}"
+            # "encodings": what POST /players takes, clients only send binary once they've seen it here
+            self._json(200, {"message": "registration successful", "id": pid, "token": token, "encodings": ENCODINGS})
             return
 
-        if self.path == "/players":
-            self._json(200, {"players": PLAYER_HANDLER.list_players()})
+        if url.path == "/players":
+            try:
+                since = int(query["since"][0]) if "since" in query else None
+                pid = int(query["id"][0]) if "id" in query else None
+                radius = interest_radius(query.get("radius", [DEFAULT_INTEREST_RADIUS])[0])
+            except ValueError:
+                self._json(400, {"error": "invalid_query"})
+                return
+
+            # Conditional GET: the client's tag is the version it has, skip all the work if nothing changed
+            etag = self.headers.get("If-None-Match")
+            if pid is not None: # interest mode: caller's map, within radius tiles
+                if self._limited(pid, "poll"):
+                    return
+                if since is not None and etag == _players_etag(since) and PLAYER_HANDLER.is_current(since, pid):
+                    self._not_modified(etag)
+                    return
+                data = PLAYER_HANDLER.list_players_near(pid, radius, since if since is not None else -1)
+                if data is None:
+                    self._json(404, {"error": "player_not_found"})
+                    return
+                self._players(data)
+                return
+            if since is not None:
+                if etag == _players_etag(since) and PLAYER_HANDLER.is_current(since):
+                    self._not_modified(etag)
+                    return
+                self._players(PLAYER_HANDLER.list_players_since(since))
+                return
+            snap = PLAYER_HANDLER.snapshot() # pre-encoded, no lock and no json.dumps per poll
+            if etag == _players_etag(snap.version):
+                self._not_modified(etag)
+            elif BINARY_CONTENT_TYPE in self.headers.get("Accept", ""):
+                self._send(200, BINARY_CONTENT_TYPE, snap.binary, {"ETag": _players_etag(snap.version)})
+            else:
+                self._send(200, "application/json", snap.json, {"ETag": _players_etag(snap.version)})
             return
 
-        if self.path == "/chat":
-            self._json(200, {"messages": MESSAGES})
+        if url.path == "/chat":
+            try:
+                after = int(query.get("after", ["0"])[0])
+                wait = float(query.get("wait", ["0"])[0])
+            except ValueError:
+                self._json(400, {"error": "invalid_query"})
+                return
+            if wait > 0: # long-poll, returns as soon as something newer than `after` is posted
+                messages = CHAT_HANDLER.wait_messages(after, wait)
+            else:
+                messages = CHAT_HANDLER.list_messages(after)
+            last_id = CHAT_HANDLER.last_id
+            # The tag is what the client has after this response. Not last_id when nothing came back,
+            # a message posted after the listing above would otherwise be 304'd away forever
+            etag = _chat_etag(messages[-1]["id"] if messages else min(after, last_id))
+            if not messages and self.headers.get("If-None-Match") == etag:
+                self._not_modified(etag)
+                return
+            self._json(200, {"messages": messages, "last_id": last_id}, {"ETag": etag})
             return
 
         self._json(404, {"error": "not_found"})
 
-    def do_POST(self):
+    def handle_post(self):
         if self.path == "/chat":
             return self.handle_chat_post()
         if self.path == "/players":
             return self.handle_player_update_post()
+        if self.path == "/sync":
+            return self.handle_sync_post()
+        if self.path == "/heartbeat":
+            return self.handle_heartbeat_post()
 
         # Consuming body is important even for 404 to avoid pipeline corruption
         try:
-            length = int(self.headers.get("Content-Length", "0"))
-            self.rfile.read(length)
+            self._read_body()
         except: pass
         self._json(404, {"error": "not_found"})
 
     def handle_player_update_post(self):
-        length = int(self.headers.get("Content-Length", "0"))
         try:
-            body = self.rfile.read(length)
-            data = json.loads(body.decode("utf-8"))
+            body = self._read_body()
+            if self.headers.get("Content-Type") == BINARY_CONTENT_TYPE:
+                data = decode_update(body)
+            else:
+                data = json.loads(body.decode("utf-8"))
             # Update player data via PLAYER_HANDLER
             # 'update' method needs to exist in PlayerHandler, or we modify dict directly if exposed
             # Assuming PLAYER_HANDLER has an update method or we implement it.
@@ -59,7 +201,9 @@ class Handler(BaseHTTPRequestHandler):
             # Reigster returns ID.
             # We should probably add update method to PlayerHandler or access its store.
             # For strictness, let's call update. 
-            PLAYER_HANDLER.update(
+            if self._limited(data["id"], "update"):
+                return
+            found = PLAYER_HANDLER.update(
                 data["id"],
                 data["x"],
                 data["y"],
@@ -72,12 +216,29 @@ class Handler(BaseHTTPRequestHandler):
             self._json(400, {"error": "invalid_json"})
             return
 
+        if not found: # expired or server restarted, client re-registers on 404
+            self._json(404, {"error": "player_not_found"})
+            return
+        self._json(200, {"success": True})
+
+    def handle_heartbeat_post(self):
+        try:
+            body = self._read_body()
+            pid = int(json.loads(body.decode("utf-8"))["id"])
+        except Exception:
+            self._json(400, {"error": "invalid_json"})
+            return
+
+        if self._limited(pid, "update"):
+            return
+        if not PLAYER_HANDLER.heartbeat(pid):
+            self._json(404, {"error": "player_not_found"})
+            return
         self._json(200, {"success": True})
 
     def handle_chat_post(self):
-        length = int(self.headers.get("Content-Length", "0"))
         try:
-            body = self.rfile.read(length)
+            body = self._read_body()
             data = json.loads(body.decode("utf-8"))
             pid = int(data["id"])
             text = str(data["text"])
@@ -85,27 +246,219 @@ class Handler(BaseHTTPRequestHandler):
             self._json(400, {"error": "invalid_json"})
             return
 
-        msg = {
-            "id": len(MESSAGES) + 1,
-            "from": pid,
-            "text": text
-        }
-        MESSAGES.append(msg)
-        # Keep only last 50
-        if len(MESSAGES) > 50:
-            MESSAGES.pop(0)
+        if self._limited(pid, "chat"):
+            return
+        msg = CHAT_HANDLER.post(pid, text)
+        self._json(200, {"success": True, "id": msg["id"]})
 
-        self._json(200, {"success": True})
+    def handle_sync_post(self):
+        """
+        One round trip for everything a client does per tick:
+        body     {"id", "update": {x, y, map, direction, is_moving} | null, "chat": [text],
+                  "since", "radius", "chat_after"}
+        response {"players": <same as GET /players?id=&since=>, "chat": <same as GET /chat?after=>
+                  plus "rejected": n, "retry_after" when the last n texts were over the chat limit>}
+        429 if the player polls too fast, nothing in the body is applied then
+        """
+        try:
+            body = self._read_body()
+            data = json.loads(body.decode("utf-8"))
+            pid = int(data["id"])
+            update = data.get("update")
+            texts = [str(t) for t in data.get("chat", [])]
+            since = int(data.get("since", -1))
+            chat_after = int(data.get("chat_after", 0))
+        except Exception:
+            self._json(400, {"error": "invalid_json"})
+            return
+        try:
+            radius = interest_radius(data.get("radius", DEFAULT_INTEREST_RADIUS))
+        except (TypeError, ValueError):
+            self._json(400, {"error": "invalid_query"})
+            return
+
+        # nothing is applied if the poll is over the limit, the client resends it all
+        if self._limited(pid, "poll"):
+            return
+        if update:
+            try:
+                found = PLAYER_HANDLER.update(
+                    pid,
+                    update["x"],
+                    update["y"],
+                    update["map"],
+                    update.get("direction", "down"),
+                    update.get("is_moving", False)
+                )
+            except Exception:
+                self._json(400, {"error": "invalid_update"})
+                return
+        else:
+            found = PLAYER_HANDLER.heartbeat(pid)
+        if not found:
+            self._json(404, {"error": "player_not_found"})
+            return
+
+        # chat has a budget of its own, texts over it go back to the client instead of failing the sync
+        retry_after = 0.0
+        for i, text in enumerate(texts):
+            retry_after = RATE_LIMITER.check(pid, "chat")
+            if retry_after > 0:
+                break
+            CHAT_HANDLER.post(pid, text)
+
+        players = PLAYER_HANDLER.list_players_near(pid, radius, since)
+        if players is None: # timed out between the update and now
+            self._json(404, {"error": "player_not_found"})
+            return
+        chat = {"messages": CHAT_HANDLER.list_messages(chat_after), "last_id": CHAT_HANDLER.last_id}
+        if retry_after > 0:
+            chat.update(rejected=len(texts) - i, retry_after=round(retry_after, 3))
+        self._json(200, {"players": players, "chat": chat})
+
+    def _read_body(self) -> bytes:
+        self._request_body = self.rfile.read(self._content_length)
+        return self._request_body
+
+    def _limited(self, pid, kind: str, cost: float = 1.0) -> bool:
+        """ Answer 429 and return True if `pid` is over its `kind` budget """
+        retry_after = RATE_LIMITER.check(pid, kind, cost)
+        if retry_after <= 0:
+            return False
+        # Retry-After only takes whole seconds, the body has the precise hint
+        body = json.dumps({"error": "rate_limited", "retry_after": round(retry_after, 3)}).encode("utf-8")
+        self._send(429, "application/json", body, {"Retry-After": str(math.ceil(retry_after))})
+        return True
+
+    # Player snapshots go out binary if the client asked for it, JSON otherwise
+    def _players(self, data: dict) -> None:
+        headers = {"ETag": _players_etag(data["version"])}
+        if BINARY_CONTENT_TYPE in self.headers.get("Accept", ""):
+            self._send(200, BINARY_CONTENT_TYPE, encode_snapshot(data), headers)
+        else:
+            self._json(200, data, headers)
+
+    def _not_modified(self, etag: str) -> None:
+        self._status = 304
+        self.send_response(304)
+        self.send_header("ETag", etag)
+        self.end_headers() # no body, not even a Content-Length
 
     # Utility for JSON responses
-    def _json(self, code: int, obj: object) -> None:
-        data = json.dumps(obj).encode("utf-8")
+    def _json(self, code: int, obj: object, headers: dict | None = None) -> None:
+        self._send(code, "application/json", json.dumps(obj).encode("utf-8"), headers)
+
+    def _send(self, code: int, content_type: str, data: bytes, headers: dict | None = None) -> None:
+        self._status = code
+        self._bytes_sent += len(data)
         self.send_response(code)
-        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Type", content_type)
         self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
         self.end_headers()
         self.wfile.write(data)
 
+def _content_length(value: str | None) -> int | None:
+    """ Content-Length as an int, 0 if missing, None if it's garbage or negative """
+    try:
+        length = int(value or 0)
+    except ValueError:
+        return None
+    return length if length >= 0 else None
+
+def _players_etag(version: int) -> str:
+    return f'"p{version}"'
+
+def _chat_etag(last_id: int) -> str:
+    return f'"c{last_id}"'
+
+def run_workers(httpd: ThreadingHTTPServer, workers: int) -> None:
+    """
+    Fork `workers` processes that all accept() on httpd's socket. PLAYER_HANDLER,
+    CHAT_HANDLER and RATE_LIMITER must already be the shared-memory versions, so any worker can serve
+    any request. The parent only expires players. /metrics shows the worker that answered.
+    """
+    httpd.socket.setblocking(False) # every worker wakes up per connection, the losers get EAGAIN instead of blocking
+    ctx = multiprocessing.get_context("fork")
+    procs = [ctx.Process(target=httpd.serve_forever, name=f"HTTPWorker-{i}", daemon=True) for i in range(workers)]
+    for proc in procs:
+        proc.start()
+    PLAYER_HANDLER.start()
+    try:
+        for proc in procs:
+            proc.join()
+    finally:
+        for proc in procs:
+            proc.terminate()
+
 if __name__ == "__main__":
-    print(f"[Server] Running on localhost with port {PORT}")
-    ThreadingHTTPServer(("0.0.0.0", PORT), Handler).serve_forever()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--stream-port", type=int, default=None,
+                        help="also run the asyncio push server on this port (HTTP stays on --port)")
+    parser.add_argument("--udp-port", type=int, default=None,
+                        help="also accept position updates over UDP on this port")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="HTTP worker processes sharing one socket and a shared-memory player table")
+    parser.add_argument("--state-file", default=STATE_FILE,
+                        help="players and chat are saved here and restored on start, empty to disable")
+    parser.add_argument("--save-interval", type=float, default=SAVE_INTERVAL,
+                        help="seconds between state snapshots")
+    parser.add_argument("--log-sample", type=float, default=LOG_SAMPLE_RATE,
+                        help="fraction of requests to log, 1 = every request")
+    parser.add_argument("--record", default=None,
+                        help="append every incoming request to this file, see server/replay.py")
+    args = parser.parse_args()
+    LOG_SAMPLE_RATE = args.log_sample
+    if args.workers > 1 and (args.stream_port is not None or args.udp_port is not None):
+        parser.error("--workers only runs the HTTP server, drop --stream-port/--udp-port")
+    if args.workers > 1 and args.record:
+        parser.error("--record needs a single process, drop --workers")
+
+    if args.workers > 1: # before the state is loaded into them and the workers fork
+        PLAYER_HANDLER.stop()
+        PLAYER_HANDLER = SharedPlayerHandler()
+        CHAT_HANDLER = SharedChatHandler()
+        RATE_LIMITER = SharedRateLimiter()
+
+    store = None
+    if args.state_file:
+        store = StateStore(args.state_file, PLAYER_HANDLER, CHAT_HANDLER, interval=args.save_interval)
+        if store.load():
+            print(f"[Server] Restored {len(PLAYER_HANDLER.list_players())} players from {args.state_file}")
+        store.start()
+    if args.record:
+        RECORDER = Recorder(args.record)
+        RECORDER.start(PLAYER_HANDLER, CHAT_HANDLER) # after the restore, the replay starts from the same state
+        print(f"[Server] Recording requests to {args.record}")
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0)) # a plain kill still saves the state below
+
+    httpd = ThreadingHTTPServer(("0.0.0.0", args.port), Handler)
+    print(f"[Server] Running on localhost with port {args.port}")
+    try:
+        if args.udp_port is not None:
+            UdpServer(PLAYER_HANDLER, RATE_LIMITER, RECORDER).start("0.0.0.0", args.udp_port)
+            print(f"[Server] UDP position updates on port {args.udp_port}")
+        if args.workers > 1:
+            print(f"[Server] {args.workers} worker processes")
+            run_workers(httpd, args.workers)
+        elif args.stream_port is None:
+            httpd.serve_forever()
+        else:
+            threading.Thread(target=httpd.serve_forever, name="HTTPServer", daemon=True).start()
+            print(f"[Server] Stream server on port {args.stream_port}")
+            stream = StreamServer(PLAYER_HANDLER, CHAT_HANDLER, RATE_LIMITER, recorder=RECORDER)
+            REGISTRY.gauge("stream_connections", "Open stream connections", (), lambda: {(): len(stream.connections)})
+            asyncio.run(stream.serve("0.0.0.0", args.stream_port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if RECORDER:
+            RECORDER.stop()
+        if store:
+            store.stop()
+        if args.workers > 1:
+            PLAYER_HANDLER.close()
+            CHAT_HANDLER.close()
+            RATE_LIMITER.close()
@@ -0,0 +1,67 @@
+import threading
+from collections import deque
+
+MAX_MESSAGES = 50   # ring size, older messages fall off
+MAX_WAIT_TIME = 30.0
+
+
+class ChatHandler:
+    """
+    Ring buffer of chat messages with stable, ever increasing ids.
+    Readers pass the last id they saw and can block until something newer arrives.
+    """
+    _cond: threading.Condition
+    _messages: deque
+    _next_id: int
+
+    def __init__(self, *, max_messages: int = MAX_MESSAGES):
+        self._cond = threading.Condition()
+        self._messages = deque(maxlen=max_messages)
+        self._next_id = 1
+
+    @property
+    def last_id(self) -> int:
+        with self._cond:
+            return self._next_id - 1
+
+    def post(self, pid: int, text: str) -> dict:
+        with self._cond:
+            msg = {
+                "id": self._next_id,
+                "from": pid,
+                "text": text
+            }
+            self._next_id += 1
+            self._messages.append(msg) # deque(maxlen) drops the oldest in O(1)
+            self._cond.notify_all()
+            return msg
+
+    def list_messages(self, after: int = 0) -> list[dict]:
+        with self._cond:
+            return self._after(after)
+
+    def wait_messages(self, after: int, timeout: float) -> list[dict]:
+        """ Like list_messages, but waits up to `timeout` seconds for a message newer than `after` """
+        timeout = min(max(timeout, 0.0), MAX_WAIT_TIME)
+        with self._cond:
+            self._cond.wait_for(lambda: self._next_id - 1 > after or after >= self._next_id, timeout)
+            return self._after(after)
+
+    # Persistence (server/stateStore.py)
+    def dump(self) -> dict:
+        with self._cond:
+            return {"next_id": self._next_id, "messages": list(self._messages)}
+
+    def load(self, state: dict) -> None:
+        with self._cond:
+            self._messages.clear()
+            self._messages.extend(state["messages"])
+            self._next_id = int(state["next_id"])
+            self._cond.notify_all()
+
+    def _after(self, after: int) -> list[dict]:
+        if after >= self._next_id: # cursor from before a server restart, start over
+            after = 0
+        # ids are contiguous, so the newest (last_id - after) messages are the ones we want
+        n = min(self._next_id - 1 - after, len(self._messages))
+        return list(self._messages)[len(self._messages) - n:] if n > 0 else []
@@ -0,0 +1,354 @@
+import argparse
+import json
+import multiprocessing as mp
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import requests
+
+"""
+Headless load generator for server.py
+
+Spawns N simulated clients that talk the same protocol as OnlineManager:
+register, walk around the maps from saves/backup.json (taking teleports),
+post their position, poll /players and chat now and then.
+
+    python -m server.loadTest --clients 10,50,100 --duration 10
+    python -m server.loadTest --clients 200 --processes 4 --transport sync
+    python -m server.loadTest --url http://host:8989 --clients 50   # existing server, no CPU numbers
+
+Without --url a fresh local server is started for every step, so the
+numbers of one step don't carry players over from the previous one.
+"""
+
+ROOT = Path(__file__).resolve().parent.parent
+MAPS_FILE = ROOT / "saves" / "backup.json"
+TILE_SIZE = 64
+WALK_SPEED = 4.0        # tiles per second, roughly the player speed
+CHAT_FETCH_EVERY = 10   # ticks, like the old OnlineManager chat poll
+
+
+# ----------------------------------------------------------------------
+# Stats
+# ----------------------------------------------------------------------
+@dataclass
+class Stats:
+    latencies: dict[str, list[float]] = field(default_factory=dict)
+    errors: dict[str, int] = field(default_factory=dict)
+    bytes_in: int = 0
+
+    def record(self, route: str, seconds: float, ok: bool, size: int = 0) -> None:
+        if ok:
+            self.latencies.setdefault(route, []).append(seconds)
+            self.bytes_in += size
+        else:
+            self.errors[route] = self.errors.get(route, 0) + 1
+
+    def merge(self, other: "Stats") -> None:
+        for route, values in other.latencies.items():
+            self.latencies.setdefault(route, []).extend(values)
+        for route, n in other.errors.items():
+            self.errors[route] = self.errors.get(route, 0) + n
+        self.bytes_in += other.bytes_in
+
+    @property
+    def ok_count(self) -> int:
+        return sum(len(v) for v in self.latencies.values())
+
+    @property
+    def error_count(self) -> int:
+        return sum(self.errors.values())
+
+
+def percentile(sorted_values: list[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    idx = min(len(sorted_values) - 1, int(q * len(sorted_values)))
+    return sorted_values[idx]
+
+
+# ----------------------------------------------------------------------
+# Simulated client
+# ----------------------------------------------------------------------
+def load_maps(path: Path = MAPS_FILE) -> dict[str, dict]:
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    return {m["path"]: m for m in data["map"]}
+
+
+class SimClient:
+    def __init__(self, base: str, maps: dict[str, dict], *, transport: str, rate: float,
+                 chat_every: int, radius: float, rng: random.Random):
+        self.base = base
+        self.maps = maps
+        self.transport = transport
+        self.interval = 1.0 / rate
+        self.chat_every = chat_every
+        self.radius = radius
+        self.rng = rng
+        self.session = requests.Session()
+
+        self.pid = -1
+        self.version = 0
+        self.chat_after = 0
+        self.map = rng.choice(list(maps))
+        spawn = maps[self.map]["player"]
+        self.x, self.y = spawn["x"] * TILE_SIZE, spawn["y"] * TILE_SIZE
+        self.direction = "down"
+        self.target = self._pick_target()
+
+    def _pick_target(self) -> dict:
+        return self.rng.choice(self.maps[self.map]["teleport"])
+
+    def _step(self, dt: float) -> bool:
+        """ Walk towards the current teleport, take it on arrival. Returns True if moving """
+        tx, ty = self.target["x"] * TILE_SIZE, self.target["y"] * TILE_SIZE
+        dx, dy = tx - self.x, ty - self.y
+        step = WALK_SPEED * TILE_SIZE * dt
+        if abs(dx) <= step and abs(dy) <= step:
+            dest = self.target["destination"]
+            spawn = self.maps.get(dest, {}).get("player", {"x": 0, "y": 0})
+            self.map = dest if dest in self.maps else self.map
+            self.x = self.target.get("dest_x", spawn["x"]) * TILE_SIZE
+            self.y = self.target.get("dest_y", spawn["y"]) * TILE_SIZE
+            self.target = self._pick_target()
+            return False
+        if abs(dx) > step: # walk x first like a grid game
+            self.x += step if dx > 0 else -step
+            self.direction = "right" if dx > 0 else "left"
+        else:
+            self.y += step if dy > 0 else -step
+            self.direction = "down" if dy > 0 else "up"
+        return True
+
+    def _request(self, stats: Stats, route: str, method: str, path: str, **kwargs):
+        t0 = time.perf_counter()
+        try:
+            resp = self.session.request(method, f"{self.base}{path}", timeout=5.0, **kwargs)
+        except requests.RequestException:
+            stats.record(route, time.perf_counter() - t0, False)
+            return None
+        ok = resp.status_code == 200
+        stats.record(route, time.perf_counter() - t0, ok, len(resp.content))
+        return resp if ok else None
+
+    def register(self, stats: Stats) -> None:
+        resp = self._request(stats, "register", "GET", "/register")
+        if resp is not None:
+            self.pid = resp.json()["id"]
+
+    def tick(self, stats: Stats, n: int) -> None:
+        moving = self._step(self.interval)
+        update = {"x": self.x, "y": self.y, "map": self.map, "direction": self.direction, "is_moving": moving}
+        chat = [f"hello from {self.pid}"] if self.chat_every and n % self.chat_every == 0 else []
+
+        if self.transport == "sync":
+            body = {"id": self.pid, "update": update, "chat": chat, "since": self.version,
+                    "radius": self.radius, "chat_after": self.chat_after}
+            resp = self._request(stats, "sync", "POST", "/sync", json=body)
+            if resp is not None:
+                data = resp.json()
+                self.version = data["players"]["version"]
+                self.chat_after = data["chat"]["last_id"]
+            return
+
+        self._request(stats, "post_players", "POST", "/players", json={"id": self.pid, **update})
+        params = {"since": self.version, "id": self.pid, "radius": self.radius}
+        resp = self._request(stats, "get_players", "GET", "/players", params=params)
+        if resp is not None:
+            self.version = resp.json()["version"]
+        for text in chat:
+            self._request(stats, "post_chat", "POST", "/chat", json={"id": self.pid, "text": text})
+        if n % CHAT_FETCH_EVERY == 0:
+            resp = self._request(stats, "get_chat", "GET", "/chat", params={"after": self.chat_after})
+            if resp is not None:
+                self.chat_after = resp.json()["last_id"]
+
+    def run(self, start_at: float, deadline: float, stats: Stats) -> None:
+        time.sleep(max(0.0, start_at - time.time()))
+        self.register(stats)
+        if self.pid == -1:
+            return
+        n = 0
+        next_tick = time.perf_counter()
+        while time.time() < deadline:
+            self.tick(stats, n)
+            n += 1
+            next_tick += self.interval
+            delay = next_tick - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_tick = time.perf_counter() # fell behind, don't burst to catch up
+        self.session.close()
+
+
+def _worker(base: str, n_clients: int, opts: dict, seed: int, start_at: float, deadline: float, out) -> None:
+    maps = load_maps()
+    rng = random.Random(seed)
+    stats = [Stats() for _ in range(n_clients)]
+    clients = [
+        SimClient(base, maps, rng=random.Random(rng.random()), **opts)
+        for _ in range(n_clients)
+    ]
+    # spread registrations over the first half second so it's not one burst
+    threads = [
+        threading.Thread(target=c.run, args=(start_at + i * 0.5 / max(1, n_clients), deadline, s), daemon=True)
+        for i, (c, s) in enumerate(zip(clients, stats))
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    total = Stats()
+    for s in stats:
+        total.merge(s)
+    out.put(total)
+
+
+# ----------------------------------------------------------------------
+# Server process
+# ----------------------------------------------------------------------
+def start_server(port: int) -> subprocess.Popen:
+    proc = subprocess.Popen(
+        [sys.executable, "server.py", "--port", str(port), "--state-file", ""], # every step starts empty
+        cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    base = f"http://localhost:{port}"
+    for _ in range(100):
+        try:
+            if requests.get(base + "/", timeout=0.5).status_code == 200:
+                return proc
+        except requests.RequestException:
+            pass
+        time.sleep(0.05)
+    proc.kill()
+    raise RuntimeError("server did not come up")
+
+
+def cpu_seconds(pid: int) -> float | None:
+    """ utime + stime of a process, Linux only """
+    try:
+        with open(f"/proc/{pid}/stat", "r") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+# ----------------------------------------------------------------------
+# Driver
+# ----------------------------------------------------------------------
+def run_step(base: str, n_clients: int, args, server_pid: int | None) -> dict:
+    opts = {
+        "transport": args.transport,
+        "rate": args.rate,
+        "chat_every": args.chat_every,
+        "radius": args.radius,
+    }
+    n_proc = max(1, min(args.processes, n_clients))
+    share = [n_clients // n_proc + (1 if i < n_clients % n_proc else 0) for i in range(n_proc)]
+
+    start_at = time.time() + 0.5 # time for the workers to spawn
+    deadline = start_at + args.duration
+    out = mp.Queue()
+    procs = [
+        mp.Process(target=_worker, args=(base, n, opts, args.seed + i, start_at, deadline, out), daemon=True)
+        for i, n in enumerate(share)
+    ]
+    for p in procs:
+        p.start()
+
+    time.sleep(max(0.0, start_at + 1.0 - time.time())) # skip the registration burst for CPU
+    cpu0, wall0 = (cpu_seconds(server_pid) if server_pid else None), time.monotonic()
+
+    total = Stats()
+    for _ in procs:
+        total.merge(out.get())
+    cpu1, wall1 = (cpu_seconds(server_pid) if server_pid else None), time.monotonic()
+    for p in procs:
+        p.join()
+
+    all_lat = sorted(v for values in total.latencies.values() for v in values)
+    n_req = total.ok_count + total.error_count
+    result = {
+        "clients": n_clients,
+        "requests": n_req,
+        "throughput": n_req / args.duration,
+        "error_rate": total.error_count / n_req if n_req else 0.0,
+        "p50_ms": percentile(all_lat, 0.50) * 1000,
+        "p95_ms": percentile(all_lat, 0.95) * 1000,
+        "p99_ms": percentile(all_lat, 0.99) * 1000,
+        "kb_in_per_s": total.bytes_in / 1024 / args.duration,
+        "server_cpu": (cpu1 - cpu0) / (wall1 - wall0) * 100 if cpu0 is not None and cpu1 is not None else None,
+        "routes": {},
+    }
+    for route in sorted(set(total.latencies) | set(total.errors)):
+        lat = sorted(total.latencies.get(route, []))
+        result["routes"][route] = {
+            "ok": len(lat),
+            "errors": total.errors.get(route, 0),
+            "p50_ms": percentile(lat, 0.50) * 1000,
+            "p99_ms": percentile(lat, 0.99) * 1000,
+        }
+    return result
+
+
+def print_result(r: dict, verbose: bool) -> None:
+    cpu = f"{r['server_cpu']:6.1f}%" if r["server_cpu"] is not None else "    n/a"
+    print(f"{r['clients']:>7} {r['throughput']:>9.0f} {r['error_rate'] * 100:>6.2f}% "
+          f"{r['p50_ms']:>8.2f} {r['p95_ms']:>8.2f} {r['p99_ms']:>8.2f} {r['kb_in_per_s']:>9.1f} {cpu}")
+    if verbose:
+        for route, s in r["routes"].items():
+            print(f"          {route:<14} ok={s['ok']:<7} err={s['errors']:<5} "
+                  f"p50={s['p50_ms']:.2f}ms p99={s['p99_ms']:.2f}ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Load test server.py with simulated OnlineManager clients")
+    parser.add_argument("--clients", default="10,25,50,100", help="comma separated client counts, one step each")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per step")
+    parser.add_argument("--rate", type=float, default=60.0, help="ticks per second per client")
+    parser.add_argument("--transport", choices=["http", "sync"], default="http")
+    parser.add_argument("--radius", type=float, default=0, help="interest radius in tiles, 0 = whole map")
+    parser.add_argument("--chat-every", type=int, default=300, help="send a chat line every N ticks, 0 = never")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1, help="client processes")
+    parser.add_argument("--url", default=None, help="use a running server instead of starting one")
+    parser.add_argument("--port", type=int, default=8999, help="port for the local server")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", dest="json_out", default=None, help="also write the results to this file")
+    parser.add_argument("-v", "--verbose", action="store_true", help="per-route breakdown")
+    args = parser.parse_args()
+
+    counts = [int(c) for c in args.clients.split(",") if c.strip()]
+    results = []
+    print(f"{'clients':>7} {'req/s':>9} {'errors':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'KB/s in':>9} {'srv cpu':>7}")
+    for n in counts:
+        proc = None
+        if args.url:
+            base, server_pid = args.url.rstrip("/"), None
+        else:
+            proc = start_server(args.port)
+            base, server_pid = f"http://localhost:{args.port}", proc.pid
+        try:
+            r = run_step(base, n, args, server_pid)
+        finally:
+            if proc:
+                proc.terminate()
+                proc.wait()
+        print_result(r, args.verbose)
+        results.append(r)
+
+    if args.json_out:
+        with open(args.json_out, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+import bisect
+import threading
+import time
+from typing import Callable
+
+"""
+Tiny in-process metrics registry, rendered by GET /metrics
+
+    REQUESTS = REGISTRY.counter("http_requests_total", "Requests", ("method", "route", "code"))
+    REQUESTS.inc(("GET", "/players", 200))
+
+    LATENCY = REGISTRY.histogram("http_request_duration_seconds", "Latency", ("route",))
+    LATENCY.observe(("/players",), 0.002)
+
+    REGISTRY.gauge("players_active", "Players per map", ("map",), lambda: {("map.tmx",): 3})
+
+Output is the Prometheus text format, or JSON with GET /metrics?format=json.
+"""
+
+Labels = tuple
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LOCK_BUCKETS = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1)
+
+
+def _label_str(names: tuple[str, ...], values: Labels, extra: str = "") -> str:
+    parts = [f'{n}="{v}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    def __init__(self, name: str, doc: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.doc = doc
+        self.labelnames = labelnames
+        self._values: dict[Labels, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels: Labels = (), amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> list[str]:
+        with self._lock:
+            values = dict(self._values)
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} counter"]
+        for labels, v in sorted(values.items()):
+            lines.append(f"{self.name}{_label_str(self.labelnames, labels)} {v}")
+        return lines
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {",".join(map(str, k)) or "_": v for k, v in self._values.items()}
+
+
+class Histogram:
+    def __init__(self, name: str, doc: str, labelnames: tuple[str, ...] = (), buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.doc = doc
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self._series: dict[Labels, list] = {} # labels -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, labels: Labels, value: float) -> None:
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[i] += 1
+            series[-1] += value
+
+    def render(self) -> list[str]:
+        with self._lock:
+            series = {k: list(v) for k, v in self._series.items()}
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} histogram"]
+        for labels, counts in sorted(series.items()):
+            total = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                total += n
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                bucket_labels = _label_str(self.labelnames, labels, f'le="{le}"')
+                lines.append(f"{self.name}_bucket{bucket_labels} {total}")
+            lines.append(f"{self.name}_sum{_label_str(self.labelnames, labels)} {counts[-1]}")
+            lines.append(f"{self.name}_count{_label_str(self.labelnames, labels)} {total}")
+        return lines
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            series = {k: list(v) for k, v in self._series.items()}
+        out = {}
+        for labels, counts in series.items():
+            n = sum(counts[:-1])
+            out[",".join(map(str, labels)) or "_"] = {
+                "count": n,
+                "sum": counts[-1],
+                "avg": counts[-1] / n if n else 0.0,
+                "buckets": dict(zip(map(str, self.buckets + (float("inf"),)), counts[:-1])),
+            }
+        return out
+
+
+class Gauge:
+    """ Read at scrape time from a callback, nothing to update on the hot path """
+    def __init__(self, name: str, doc: str, labelnames: tuple[str, ...], fn: Callable[[], dict[Labels, float]]):
+        self.name = name
+        self.doc = doc
+        self.labelnames = labelnames
+        self.fn = fn
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} gauge"]
+        for labels, v in sorted(self.fn().items()):
+            lines.append(f"{self.name}{_label_str(self.labelnames, labels)} {v}")
+        return lines
+
+    def to_dict(self) -> dict:
+        return {",".join(map(str, k)) or "_": v for k, v in self.fn().items()}
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: dict[str, Counter | Histogram | Gauge] = {}
+        self._lock = threading.Lock()
+
+    def _add(self, metric):
+        with self._lock:
+            # re-registering (a second PlayerHandler, tests) hands back the existing one
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, doc: str, labelnames: tuple[str, ...] = ()) -> Counter:
+        return self._add(Counter(name, doc, labelnames))
+
+    def histogram(self, name: str, doc: str, labelnames: tuple[str, ...] = (), buckets: tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, doc, labelnames, buckets))
+
+    def gauge(self, name: str, doc: str, labelnames: tuple[str, ...], fn: Callable[[], dict[Labels, float]]) -> Gauge:
+        gauge = Gauge(name, doc, labelnames, fn)
+        with self._lock:
+            self._metrics[name] = gauge # callbacks are replaced, the newest owner wins
+        return gauge
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for m in metrics:
+            lines.extend(m.render())
+        return "\n".join(lines) + "\n"
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {m.name: m.to_dict() for m in metrics}
+
+
+REGISTRY = Registry()
+
+
+class TimedLock:
+    """ threading.Lock that records how long callers waited to get it """
+    def __init__(self, histogram: Histogram, labels: Labels = ()):
+        self._lock = threading.Lock()
+        self._histogram = histogram
+        self._labels = labels
+
+    def __enter__(self):
+        if self._lock.acquire(blocking=False): # uncontended, skip the clock
+            self._histogram.observe(self._labels, 0.0)
+            return self
+        t0 = time.perf_counter()
+        self._lock.acquire()
+        self._histogram.observe(self._labels, time.perf_counter() - t0)
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._lock.release()
+
+    def acquire(self, blocking: bool = True, timeout: float = -1) -> bool:
+        return self._lock.acquire(blocking, timeout)
+
+    def release(self) -> None:
+        self._lock.release()
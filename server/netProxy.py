@@ -0,0 +1,556 @@
+import argparse
+import asyncio
+import json
+import random
+import time
+from dataclasses import dataclass, field, fields, replace
+
+"""
+Bad network in a box, sits between OnlineManager and server.py
+
+Every TCP connection (HTTP polling/sync and the stream port) and every UDP
+datagram goes through here and gets latency, jitter, loss, a bandwidth cap
+and the odd disconnect. HTTP requests are timed one by one.
+
+    python server.py &
+    python -m server.netProxy --latency 80 --jitter 20 --loss 0.02
+    # then in settings.py point the client at the proxy:
+    #   ONLINE_SERVER_URL = "http://localhost:9989", ONLINE_STREAM_PORT = 9990, ONLINE_UDP_PORT = 9991
+
+    python -m server.netProxy --bandwidth 256 --disconnect 20 --log timings.jsonl
+    python -m server.netProxy --script lag_spike.json   # scripted, exits when the script ends
+
+A script is a JSON list of steps (or {"steps": [...], "duration": seconds}).
+Each step sets some conditions "at" seconds after start, the rest stay as they were:
+
+    [{"at": 0, "latency": 40},
+     {"at": 5, "latency": 400, "jitter": 100},
+     {"at": 10, "down": true},
+     {"at": 13, "down": false, "loss": 0.1}]
+
+Latency and jitter are one way, so the round trip gets twice of each.
+TCP can't lose data, a "lost" chunk shows up RETRANSMIT_DELAY late instead (and
+holds back everything behind it). UDP datagrams really are dropped.
+"""
+
+DEFAULT_LISTEN = "9989:8989,9990:8990"
+DEFAULT_UDP = "9991:8991"
+RETRANSMIT_DELAY = 0.2      # seconds, roughly a minimum TCP RTO
+CHUNK_SIZE = 16 * 1024      # smaller reads so a bandwidth cap spreads a big response out
+HTTP_METHODS = (b"GET ", b"POST ", b"PUT ", b"DELETE ", b"HEAD ", b"OPTIONS ", b"PATCH ")
+
+
+def percentile(sorted_values: list[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    idx = min(len(sorted_values) - 1, int(q * len(sorted_values)))
+    return sorted_values[idx]
+
+
+@dataclass
+class Conditions:
+    latency: float = 0.0      # ms, one way
+    jitter: float = 0.0       # ms, +- on top of latency
+    loss: float = 0.0         # 0..1 per chunk / datagram
+    bandwidth: float = 0.0    # kbit/s per direction, shared by all connections, 0 = unlimited
+    disconnect: float = 0.0   # mean seconds between dropped connections, 0 = never
+    down: bool = False        # drop everything and refuse new connections
+
+    def update(self, step: dict) -> "Conditions":
+        names = {f.name for f in fields(self)}
+        unknown = set(step) - names - {"at"}
+        if unknown:
+            raise ValueError(f"unknown conditions: {', '.join(sorted(unknown))}")
+        return replace(self, **{k: v for k, v in step.items() if k in names})
+
+    def describe(self) -> str:
+        if self.down:
+            return "down"
+        return (f"latency={self.latency:g}ms jitter={self.jitter:g}ms loss={self.loss:g} "
+                f"bandwidth={self.bandwidth:g}kbit/s disconnect={self.disconnect:g}s")
+
+
+# ----------------------------------------------------------------------
+# Stats
+# ----------------------------------------------------------------------
+@dataclass
+class Stats:
+    latencies: dict[str, list[float]] = field(default_factory=dict)
+    errors: dict[str, int] = field(default_factory=dict)
+    connections: int = 0
+    dropped: int = 0          # connections we cut
+    datagrams: int = 0
+    datagrams_lost: int = 0
+
+    def record(self, route: str, seconds: float, ok: bool) -> None:
+        if ok:
+            self.latencies.setdefault(route, []).append(seconds)
+        else:
+            self.errors[route] = self.errors.get(route, 0) + 1
+
+    def summary(self) -> dict:
+        routes = {}
+        for route in sorted(set(self.latencies) | set(self.errors)):
+            values = sorted(self.latencies.get(route, []))
+            routes[route] = {
+                "ok": len(values),
+                "errors": self.errors.get(route, 0),
+                "p50_ms": percentile(values, 0.50) * 1000,
+                "p95_ms": percentile(values, 0.95) * 1000,
+                "p99_ms": percentile(values, 0.99) * 1000,
+            }
+        return {"connections": self.connections, "dropped": self.dropped,
+                "datagrams": self.datagrams, "datagrams_lost": self.datagrams_lost, "routes": routes}
+
+
+# ----------------------------------------------------------------------
+# HTTP timing
+# ----------------------------------------------------------------------
+class HttpSplitter:
+    """
+    Finds where HTTP/1.1 messages end in a byte stream (Content-Length bodies only,
+    which is all server.py and requests send). feed() returns the heads of the
+    messages completed by this chunk. Gives up (ok = False) on anything else.
+    """
+    def __init__(self):
+        self.ok = True
+        self._buf = b""
+        self._body_left = 0
+        self._head: bytes | None = None
+
+    def feed(self, data: bytes) -> list[bytes]:
+        done = []
+        if not self.ok:
+            return done
+        self._buf += data
+        while True:
+            if self._head is None:
+                end = self._buf.find(b"\r\n\r\n")
+                if end < 0:
+                    if len(self._buf) > 64 * 1024:
+                        self.ok = False
+                    return done
+                self._head = self._buf[:end]
+                self._buf = self._buf[end + 4:]
+                self._body_left = self._content_length(self._head)
+            take = min(self._body_left, len(self._buf))
+            self._buf = self._buf[take:]
+            self._body_left -= take
+            if self._body_left:
+                return done
+            done.append(self._head)
+            self._head = None
+
+    @staticmethod
+    def _content_length(head: bytes) -> int:
+        for line in head.split(b"\r\n")[1:]:
+            name, _, value = line.partition(b":")
+            if name.strip().lower() == b"content-length":
+                return int(value.strip() or 0)
+        return 0
+
+
+@dataclass
+class Exchange:
+    route: str
+    received: float                 # request fully in from the client
+    forwarded: float | None = None  # request fully delivered to the server
+    answered: float | None = None   # response fully in from the server
+    status: int = 0
+    size: int = 0
+
+
+class HttpMeter:
+    """ Pairs requests with responses on one keep-alive connection, in order """
+    def __init__(self, proxy: "NetProxy", conn_id: int):
+        self.proxy = proxy
+        self.conn_id = conn_id
+        self.exchanges: list[Exchange] = []
+        # one splitter per side of each direction: what came in, what we passed on
+        self.req_in, self.req_out = HttpSplitter(), HttpSplitter()
+        self.resp_in, self.resp_out = HttpSplitter(), HttpSplitter()
+        self.n_forwarded = self.n_answered = self.n_done = 0
+
+    @property
+    def ok(self) -> bool:
+        return all(s.ok for s in (self.req_in, self.req_out, self.resp_in, self.resp_out))
+
+    def request_in(self, data: bytes, now: float) -> None:
+        for head in self.req_in.feed(data):
+            method, path = (head.split(b"\r\n", 1)[0].decode("latin-1").split(" ") + ["", ""])[:2]
+            self.exchanges.append(Exchange(f"{method} {path.split('?')[0]}", now))
+
+    def request_out(self, data: bytes, now: float) -> None:
+        for _ in self.req_out.feed(data):
+            if self.n_forwarded < len(self.exchanges):
+                self.exchanges[self.n_forwarded].forwarded = now
+            self.n_forwarded += 1
+
+    def response_in(self, data: bytes, now: float) -> None:
+        for head in self.resp_in.feed(data):
+            if self.n_answered < len(self.exchanges):
+                ex = self.exchanges[self.n_answered]
+                ex.answered = now
+                status = head.split(b" ", 2)
+                ex.status = int(status[1]) if len(status) > 1 and status[1].isdigit() else 0
+                ex.size = HttpSplitter._content_length(head)
+            self.n_answered += 1
+
+    def response_out(self, data: bytes, now: float) -> None:
+        for _ in self.resp_out.feed(data):
+            if self.n_done < len(self.exchanges):
+                self.proxy.log_exchange(self.conn_id, self.exchanges[self.n_done], now)
+            self.n_done += 1
+
+    def abort(self) -> None:
+        for ex in self.exchanges[self.n_done:]:
+            self.proxy.stats.record(ex.route, 0, False)
+        self.exchanges = self.exchanges[:self.n_done]
+
+
+# ----------------------------------------------------------------------
+# Proxy
+# ----------------------------------------------------------------------
+@dataclass
+class Link:
+    """ One direction of the simulated line, shared by every connection going that way """
+    free_at: float = 0.0    # the cap is busy sending until then
+
+
+@dataclass(eq=False)
+class Pipe:
+    """ One direction of one connection, keeps TCP's ordering when jitter would reorder """
+    writer: asyncio.StreamWriter
+    queue: asyncio.Queue = field(default_factory=asyncio.Queue)
+    last: float = 0.0
+
+
+class NetProxy:
+    """
+    Forwards listen port -> target port with impaired conditions.
+    Run it with `await proxy.serve()` or from a thread with start()/stop();
+    set() and run_script() change the conditions on the fly, which is what
+    automated tests want.
+    """
+    def __init__(self, tcp: list[tuple[int, int]], udp: list[tuple[int, int]] = (), *,
+                 host: str = "localhost", target_host: str = "localhost",
+                 conditions: Conditions | None = None, log_file=None, seed: int | None = None, verbose: bool = False):
+        self.tcp = list(tcp)
+        self.udp = list(udp)
+        self.host = host
+        self.target_host = target_host
+        self.conditions = conditions or Conditions()
+        self.log_file = log_file
+        self.verbose = verbose
+        self.rng = random.Random(seed)
+        self.stats = Stats()
+        self.started = time.perf_counter()
+        self._links = {"up": Link(), "down": Link()}
+        self._conns: dict[asyncio.StreamWriter, asyncio.StreamWriter] = {} # client side -> server side
+        self._next_conn = 0
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._stopping: asyncio.Event | None = None
+        self._thread = None
+
+    # -- conditions ----------------------------------------------------
+    def set(self, **changes) -> None:
+        """ Thread safe, e.g. proxy.set(latency=200, loss=0.05) from a test """
+        if self._loop and self._loop.is_running() and not self._in_loop():
+            self._loop.call_soon_threadsafe(self._apply, changes)
+        else:
+            self._apply(changes)
+
+    def _in_loop(self) -> bool:
+        try:
+            return asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            return False
+
+    def _apply(self, changes: dict) -> None:
+        self.conditions = self.conditions.update(changes)
+        print(f"[netProxy] {self._elapsed():7.2f}s {self.conditions.describe()}")
+        if self.conditions.down:
+            self.drop_all()
+
+    def drop_all(self, count: bool = True) -> None:
+        for client, server in list(self._conns.items()):
+            self._reset(client)
+            self._reset(server)
+            self.stats.dropped += count
+
+    async def run_script(self, steps: list[dict], duration: float | None = None) -> None:
+        """ Applies each step at its "at" time (seconds since the script started) """
+        start = time.perf_counter()
+        for step in sorted(steps, key=lambda s: s.get("at", 0)):
+            await asyncio.sleep(max(0.0, step.get("at", 0) - (time.perf_counter() - start)))
+            self._apply(step)
+        if duration is not None:
+            await asyncio.sleep(max(0.0, duration - (time.perf_counter() - start)))
+
+    # -- scheduling ----------------------------------------------------
+    def _elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def _deliver_at(self, link: Link, pipe_last: float, size: int, now: float) -> float:
+        c = self.conditions
+        ready = now
+        if c.bandwidth > 0:
+            ready = max(now, link.free_at) + size * 8 / (c.bandwidth * 1000)
+            link.free_at = ready
+        delay = max(0.0, c.latency + self.rng.uniform(-c.jitter, c.jitter)) / 1000
+        if c.loss > 0 and self.rng.random() < c.loss:
+            delay += RETRANSMIT_DELAY
+        return max(ready + delay, pipe_last)
+
+    # -- tcp -----------------------------------------------------------
+    async def _handle(self, client_reader, client_writer, target_port: int) -> None:
+        if self.conditions.down:
+            self._reset(client_writer)
+            return
+        try:
+            server_reader, server_writer = await asyncio.open_connection(self.target_host, target_port)
+        except OSError as e:
+            print(f"[netProxy] can't reach {self.target_host}:{target_port}: {e}")
+            client_writer.close()
+            return
+
+        conn_id = self._next_conn
+        self._next_conn += 1
+        self.stats.connections += 1
+        self._conns[client_writer] = server_writer
+        if self.verbose:
+            print(f"[netProxy] #{conn_id} open -> :{target_port}")
+
+        meter = HttpMeter(self, conn_id)
+        up, down = Pipe(server_writer), Pipe(client_writer)
+        tasks = [
+            asyncio.create_task(self._read(client_reader, up, self._links["up"], meter, True)),
+            asyncio.create_task(self._read(server_reader, down, self._links["down"], meter, False)),
+            asyncio.create_task(self._write(up, meter, meter.request_out)),
+            asyncio.create_task(self._write(down, meter, meter.response_out)),
+        ]
+        if self.conditions.disconnect > 0:
+            tasks.append(asyncio.create_task(self._chaos(client_writer)))
+        try:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            # let whatever is still in flight arrive before closing
+            await asyncio.wait(tasks[2:4], timeout=self._drain_time(up, down))
+        except asyncio.CancelledError:
+            pass # shutting down
+        finally:
+            for t in tasks:
+                t.cancel()
+            meter.abort()
+            self._conns.pop(client_writer, None)
+            for w in (client_writer, server_writer):
+                w.close()
+            if self.verbose:
+                print(f"[netProxy] #{conn_id} closed")
+
+    def _drain_time(self, *pipes: Pipe) -> float:
+        now = asyncio.get_running_loop().time()
+        return max([p.last - now for p in pipes] + [0.0]) + 0.05
+
+    async def _read(self, reader, pipe: Pipe, link: Link, meter: HttpMeter, is_request: bool) -> None:
+        loop = asyncio.get_running_loop()
+        first = True
+        while True:
+            try:
+                data = await reader.read(CHUNK_SIZE)
+            except OSError:
+                data = b""
+            if not data:
+                await pipe.queue.put((pipe.last, b""))
+                return
+            now = loop.time()
+            if first and is_request and not data.startswith(HTTP_METHODS):
+                meter.req_in.ok = False # stream port, no per-request timing
+            first = False
+            if meter.ok:
+                (meter.request_in if is_request else meter.response_in)(data, now)
+            pipe.last = self._deliver_at(link, pipe.last, len(data), now)
+            await pipe.queue.put((pipe.last, data))
+
+    async def _write(self, pipe: Pipe, meter: HttpMeter, observe) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            deliver_at, data = await pipe.queue.get()
+            await asyncio.sleep(max(0.0, deliver_at - loop.time()))
+            if not data:
+                if pipe.writer.can_write_eof():
+                    pipe.writer.write_eof()
+                return
+            try:
+                pipe.writer.write(data)
+                await pipe.writer.drain()
+            except OSError:
+                return
+            if meter.ok:
+                observe(data, loop.time())
+
+    async def _chaos(self, writer) -> None:
+        await asyncio.sleep(self.rng.expovariate(1.0 / self.conditions.disconnect))
+        self.stats.dropped += 1
+        if self.verbose:
+            print("[netProxy] dropping a connection")
+        self._reset(writer)
+
+    @staticmethod
+    def _reset(writer) -> None:
+        # abort() instead of close() so the peer sees a reset, like a dead route would give
+        writer.transport.abort()
+
+    def log_exchange(self, conn_id: int, ex: Exchange, now: float) -> None:
+        ok = 0 < ex.status < 500
+        total = now - ex.received
+        self.stats.record(ex.route, total, ok)
+        server = (ex.answered - ex.forwarded) if ex.answered and ex.forwarded else None
+        if self.log_file:
+            entry = {"t": round(self._elapsed(), 4), "conn": conn_id, "route": ex.route, "status": ex.status,
+                     "bytes": ex.size, "total_ms": round(total * 1000, 2),
+                     "server_ms": round(server * 1000, 2) if server is not None else None}
+            self.log_file.write(json.dumps(entry) + "\n")
+        if self.verbose:
+            print(f"[netProxy] #{conn_id} {ex.route} {ex.status} {ex.size}B "
+                  f"total={total * 1000:.1f}ms server={(server or 0) * 1000:.1f}ms")
+
+    # -- udp -----------------------------------------------------------
+    class _UdpForward(asyncio.DatagramProtocol):
+        """ One way, the game server never answers over UDP """
+        def __init__(self, proxy: "NetProxy"):
+            self.proxy = proxy
+            self.out = None # connected to the target
+
+        def datagram_received(self, data: bytes, addr) -> None:
+            proxy, c = self.proxy, self.proxy.conditions
+            proxy.stats.datagrams += 1
+            if c.down or (c.loss > 0 and proxy.rng.random() < c.loss):
+                proxy.stats.datagrams_lost += 1
+                return
+            loop = asyncio.get_running_loop()
+            now = loop.time()
+            # pipe_last=0, datagrams may arrive out of order
+            deliver_at = proxy._deliver_at(proxy._links["up"], 0.0, len(data), now)
+            loop.call_at(deliver_at, self.out.sendto, data)
+
+    # -- running -------------------------------------------------------
+    async def serve(self, ready=None) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._stopping = asyncio.Event()
+        servers, transports = [], []
+        for listen, target in self.tcp:
+            servers.append(await asyncio.start_server(
+                lambda r, w, port=target: self._handle(r, w, port), self.host, listen))
+            print(f"[netProxy] tcp {self.host}:{listen} -> {self.target_host}:{target}")
+        for listen, target in self.udp:
+            proto = self._UdpForward(self)
+            proto.out, _ = await self._loop.create_datagram_endpoint(asyncio.DatagramProtocol,
+                                                                     remote_addr=(self.target_host, target))
+            transport, _ = await self._loop.create_datagram_endpoint(lambda p=proto: p, local_addr=(self.host, listen))
+            transports += [proto.out, transport]
+            print(f"[netProxy] udp {self.host}:{listen} -> {self.target_host}:{target}")
+        print(f"[netProxy] {self.conditions.describe()}")
+        if ready:
+            ready.set()
+        try:
+            await self._stopping.wait()
+        finally:
+            for s in servers:
+                s.close()
+            self.drop_all(count=False)
+            for t in transports:
+                t.close()
+
+    def start(self) -> None:
+        """ Runs the proxy in a background thread, returns once it's listening """
+        import threading
+        ready = threading.Event()
+        self._thread = threading.Thread(target=lambda: asyncio.run(self.serve(ready)), daemon=True, name="NetProxy")
+        self._thread.start()
+        if not ready.wait(5.0):
+            raise RuntimeError("netProxy didn't start")
+
+    def stop(self) -> None:
+        if self._loop and self._stopping:
+            self._loop.call_soon_threadsafe(self._stopping.set)
+        if self._thread:
+            self._thread.join(timeout=5.0)
+            self._thread = None
+
+    def print_summary(self) -> None:
+        s = self.stats.summary()
+        print(f"[netProxy] {s['connections']} connections, {s['dropped']} dropped, "
+              f"{s['datagrams']} datagrams ({s['datagrams_lost']} lost)")
+        for route, r in s["routes"].items():
+            print(f"          {route:<16} ok={r['ok']:<7} err={r['errors']:<5} "
+                  f"p50={r['p50_ms']:.1f}ms p95={r['p95_ms']:.1f}ms p99={r['p99_ms']:.1f}ms")
+
+
+def parse_ports(spec: str) -> list[tuple[int, int]]:
+    """ "9989:8989,9990:8990" -> [(9989, 8989), (9990, 8990)] """
+    pairs = []
+    for part in spec.split(","):
+        if part.strip():
+            listen, _, target = part.partition(":")
+            pairs.append((int(listen), int(target or listen)))
+    return pairs
+
+
+def load_script(path: str) -> tuple[list[dict], float | None]:
+    with open(path, "r", encoding="utf-8") as f:
+        script = json.load(f)
+    if isinstance(script, list):
+        return script, None
+    return script["steps"], script.get("duration")
+
+
+async def run(proxy: NetProxy, script: tuple[list[dict], float | None] | None) -> None:
+    ready = asyncio.Event()
+    serving = asyncio.create_task(proxy.serve(ready))
+    if script is None:
+        await serving
+        return
+    await ready.wait()
+    await proxy.run_script(*script)
+    proxy._stopping.set()
+    await serving
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Latency / loss / bandwidth simulating proxy for server.py")
+    parser.add_argument("--listen", default=DEFAULT_LISTEN, help="tcp listen:target port pairs, comma separated")
+    parser.add_argument("--udp", default=DEFAULT_UDP, help="udp listen:target port pairs, empty = none")
+    parser.add_argument("--host", default="localhost", help="address to listen on")
+    parser.add_argument("--target-host", default="localhost", help="where server.py runs")
+    parser.add_argument("--latency", type=float, default=0.0, help="ms, one way")
+    parser.add_argument("--jitter", type=float, default=0.0, help="ms, +- on top of latency")
+    parser.add_argument("--loss", type=float, default=0.0, help="0..1, chance per chunk / datagram")
+    parser.add_argument("--bandwidth", type=float, default=0.0, help="kbit/s per direction, 0 = unlimited")
+    parser.add_argument("--disconnect", type=float, default=0.0, help="mean seconds between dropped connections, 0 = never")
+    parser.add_argument("--script", default=None, help="JSON file of timed condition changes, exits when it ends")
+    parser.add_argument("--log", default=None, help="append one JSON line per HTTP request to this file")
+    parser.add_argument("--json", dest="json_out", default=None, help="write the summary to this file on exit")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("-v", "--verbose", action="store_true", help="print every request and connection")
+    args = parser.parse_args()
+
+    conditions = Conditions(args.latency, args.jitter, args.loss, args.bandwidth, args.disconnect)
+    script = load_script(args.script) if args.script else None
+    log_file = open(args.log, "a", encoding="utf-8", buffering=1) if args.log else None
+    proxy = NetProxy(parse_ports(args.listen), parse_ports(args.udp), host=args.host, target_host=args.target_host,
+                     conditions=conditions, log_file=log_file, seed=args.seed, verbose=args.verbose)
+    try:
+        asyncio.run(run(proxy, script))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if log_file:
+            log_file.close()
+        proxy.print_summary()
+        if args.json_out:
+            with open(args.json_out, "w", encoding="utf-8") as f:
+                json.dump({"args": vars(args), "summary": proxy.stats.summary()}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
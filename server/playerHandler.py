@@ -1,11 +1,40 @@
 import threading
 import time
-import copy
+import heapq
+import math
+import json
+import secrets
+from collections import OrderedDict
 from dataclasses import dataclass
 from typing import Dict, Optional
 
-TIMEOUT_TIME = 60.0
-CHECK_INTERVAL_TIME = 10.0
+from server.protocol import TILE_SIZE, encode_snapshot
+from server.metrics import REGISTRY, LOCK_BUCKETS, TimedLock
+
+TIMEOUT_TIME = 60.0       # seconds without any contact (update, poll or heartbeat)
+CHECK_INTERVAL_TIME = 1.0 # cheap now, the cleaner only looks at due deadlines
+MAX_TOMBSTONES = 256 # removed ids kept for delta clients, older ones force a full snapshot
+RESTORE_VERSION_GAP = 1 << 20 # versions jump this far on load, see PlayerHandler.load
+SESSION_GRACE_TIME = 300.0 # a removed player can be resumed with its token for this long
+SNAPSHOT_INTERVAL = 1 / 60 # rebuild the cached snapshot at most once per tick
+CELL_TILES = 8       # interest grid cell is CELL_TILES x CELL_TILES tiles
+CELL_SIZE = TILE_SIZE * CELL_TILES
+
+LOCK_WAIT = REGISTRY.histogram("player_lock_wait_seconds", "Time spent waiting for PlayerHandler._lock", (), LOCK_BUCKETS)
+SWEEP_TIME = REGISTRY.histogram("player_cleaner_sweep_seconds", "Duration of one inactive player sweep")
+EXPIRED = REGISTRY.counter("players_expired_total", "Players removed for inactivity")
+
+Cell = tuple[int, int]
+
+def cell_of(x: float, y: float) -> Cell:
+    return (int(x // CELL_SIZE), int(y // CELL_SIZE))
+
+def interest_radius(value) -> float:
+    """ A client's radius in tiles, 0 = whole map. ValueError for nan, inf or negative, cell_of can't take those """
+    radius = float(value)
+    if not math.isfinite(radius) or radius < 0:
+        raise ValueError(f"invalid radius {value!r}")
+    return radius
 
 @dataclass
 class Player:
@@ -13,40 +42,123 @@ class Player:
     x: float
     y: float
     map: str
-    last_update: float
+    last_update: float           # last contact from the client, not last movement
     direction: str = "down"      
     is_moving: bool = False      
+    version: int = 0             # world version of the last change
+    token: str = ""              # session token, register(token) resumes this player
     
-    def update(self, x: float, y: float, map: str, direction = "down", is_moving = False) -> None:
-        if x != self.x or y != self.y or map != self.map:
-            self.last_update = time.monotonic()
+    def update(self, x: float, y: float, map: str, direction = "down", is_moving = False) -> bool:
+        changed = (
+            x != self.x or y != self.y or map != self.map
+            or direction != self.direction or is_moving != self.is_moving
+        )
+        self.last_update = time.monotonic() # standing still is still being connected
         self.x = x
         self.y = y
         self.map = map
         self.direction = direction      
         self.is_moving = is_moving      
+        return changed
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "x": self.x,
+            "y": self.y,
+            "map": self.map,
+            "direction": self.direction,      
+            "is_moving": self.is_moving                           
+        }
 
     def is_inactive(self) -> bool:
         now = time.monotonic()
         return (now - self.last_update) >= TIMEOUT_TIME
 
 
+@dataclass(frozen=True)
+class PlayerSnapshot:
+    """
+    Immutable full world state, already encoded.
+    Never mutate `players`, every reader shares the same dict.
+    """
+    version: int
+    built_at: float
+    players: Dict[int, dict]
+    json: bytes    # {"version", "full": true, "players", "removed": [], "time"}
+    binary: bytes  # protocol.encode_snapshot of the same
+
+    @classmethod
+    def build(cls, version: int, players: Dict[int, dict]) -> "PlayerSnapshot":
+        data = {"version": version, "full": True, "players": players, "removed": [], "time": time.time()}
+        return cls(
+            version=version,
+            built_at=time.monotonic(),
+            players=players,
+            json=json.dumps(data).encode("utf-8"),
+            binary=encode_snapshot(data),
+        )
+
+
 class PlayerHandler:
-    _lock: threading.Lock
+    _lock: TimedLock
     _stop_event: threading.Event
     _thread: threading.Thread | None
     
     players: Dict[int, Player]
     _next_id: int
+    
+    # Delta sync
+    _version: int
+    _changes: "OrderedDict[int, int]"     # pid -> version, oldest change first
+    _tombstones: "OrderedDict[int, int]"  # removed pid -> version
+    _tombstone_floor: int
+    
+    # Interest management
+    _grid: Dict[str, Dict[Cell, set[int]]]       # map -> cell -> pids
+    _cells: Dict[int, tuple[str, Cell]]          # pid -> (map, cell)
+    _views: Dict[int, tuple[int, frozenset[int]]] # pid -> (version served, pids it can see)
+    
+    # Sessions
+    _tokens: Dict[str, int]                                 # token -> pid, live players
+    _departed: "OrderedDict[str, tuple[float, Player]]"     # token -> (resumable until, player), oldest first
+    
+    # Copy-on-write full snapshot, swapped as a whole so readers don't need _lock
+    _snapshot: PlayerSnapshot
+    _snapshot_lock: threading.Lock
+    
+    # Expiry: one (deadline, pid) per player, refreshed lazily when it comes due
+    _expiry: list[tuple[float, int]]
+    timeout: float
+    check_interval: float
 
-    def __init__(self, *, timeout_seconds: float = 120.0, check_interval_seconds: float = 5.0):
-        self._lock = threading.Lock()
+    def __init__(self, *, timeout_seconds: float = TIMEOUT_TIME, check_interval_seconds: float = CHECK_INTERVAL_TIME):
+        self.timeout = timeout_seconds
+        self.check_interval = check_interval_seconds
+        self._lock = TimedLock(LOCK_WAIT)
         self._stop_event = threading.Event()
         self._thread = None
         
         self.players = {}
         self._next_id = 0
         
+        self._version = 0
+        self._changes = OrderedDict()
+        self._tombstones = OrderedDict()
+        self._tombstone_floor = 0
+        
+        self._grid = {}
+        self._cells = {}
+        self._views = {}
+        
+        self._tokens = {}
+        self._departed = OrderedDict()
+        
+        self._snapshot = PlayerSnapshot.build(0, {})
+        self._snapshot_lock = threading.Lock()
+        
+        self._expiry = []
+        
     # Threading
     def start(self) -> None:
         if self._thread and self._thread.is_alive():
@@ -61,23 +173,132 @@ class PlayerHandler:
             self._thread.join(timeout=2.0)
 
     def _cleaner(self) -> None:
-        while not self._stop_event.wait(CHECK_INTERVAL_TIME):
-            now = time.monotonic()
-            to_remove: list[int] = []
+        while not self._stop_event.wait(self.check_interval):
+            t0 = time.perf_counter()
             with self._lock:
-                for pid, p in list(self.players.items()):
-                    if now - p.last_update >= TIMEOUT_TIME:
-                        to_remove.append(pid)
-                for pid in to_remove:
-                    _ = self.players.pop(pid, None)
-                    
+                expired = self._expire(time.monotonic())
+            if expired:
+                EXPIRED.inc((), expired)
+            SWEEP_TIME.observe((), time.perf_counter() - t0)
+
+    def _expire(self, now: float) -> int:
+        """
+        Pop every due deadline. Players that were heard from since get pushed back
+        with their real deadline, so the work is proportional to what came due,
+        not to the number of players. Call with _lock held.
+        """
+        expired = 0
+        while self._expiry and self._expiry[0][0] <= now:
+            _, pid = heapq.heappop(self._expiry)
+            p = self.players.get(pid)
+            if p is None: # already removed
+                continue
+            deadline = p.last_update + self.timeout
+            if deadline > now:
+                heapq.heappush(self._expiry, (deadline, pid))
+            else:
+                self._remove(pid)
+                expired += 1
+        while self._departed and next(iter(self._departed.values()))[0] <= now:
+            self._departed.popitem(last=False)
+        return expired
+    
+    # Versioning (call with _lock held)
+    def _touch(self, p: Player) -> None:
+        self._version += 1
+        p.version = self._version
+        self._changes[p.id] = p.version
+        self._changes.move_to_end(p.id)
+        self._index(p)
+
+    def _add(self, p: Player) -> None:
+        self.players[p.id] = p
+        self._tokens[p.token] = p.id
+        self._tombstones.pop(p.id, None) # resumed, a delta must not list it as removed too
+        self._touch(p)
+        heapq.heappush(self._expiry, (p.last_update + self.timeout, p.id))
+
+    def _remove(self, pid: int) -> None:
+        p = self.players.pop(pid, None)
+        if p is None:
+            return
+        self._tokens.pop(p.token, None)
+        self._departed[p.token] = (time.monotonic() + SESSION_GRACE_TIME, p)
+        self._unindex(pid)
+        self._views.pop(pid, None)
+        self._changes.pop(pid, None)
+        self._version += 1
+        self._tombstones[pid] = self._version
+        while len(self._tombstones) > MAX_TOMBSTONES:
+            _, v = self._tombstones.popitem(last=False)
+            self._tombstone_floor = v
+
+    # Spatial grid (call with _lock held)
+    def _index(self, p: Player) -> None:
+        key = (p.map, cell_of(p.x, p.y))
+        if self._cells.get(p.id) == key:
+            return
+        self._unindex(p.id)
+        self._grid.setdefault(key[0], {}).setdefault(key[1], set()).add(p.id)
+        self._cells[p.id] = key
+
+    def _unindex(self, pid: int) -> None:
+        key = self._cells.pop(pid, None)
+        if key is None:
+            return
+        cells = self._grid[key[0]]
+        cells[key[1]].discard(pid)
+        if not cells[key[1]]:
+            del cells[key[1]]
+            if not cells:
+                del self._grid[key[0]]
+
+    def _query(self, map_name: str, x: float, y: float, radius: float) -> set[int]:
+        """ Pids on `map_name` within `radius` pixels of (x, y), radius <= 0 means the whole map """
+        cells = self._grid.get(map_name, {})
+        if radius <= 0:
+            return set().union(*cells.values())
+
+        cx0, cy0 = cell_of(x - radius, y - radius)
+        cx1, cy1 = cell_of(x + radius, y + radius)
+        r2 = radius * radius
+        found = set()
+        if (cx1 - cx0 + 1) * (cy1 - cy0 + 1) > len(cells): # big radius, walk what exists instead
+            candidates = [c for c in cells if cx0 <= c[0] <= cx1 and cy0 <= c[1] <= cy1]
+        else:
+            candidates = [(cx, cy) for cx in range(cx0, cx1 + 1) for cy in range(cy0, cy1 + 1)]
+        for cell in candidates:
+            for pid in cells.get(cell, ()):
+                p = self.players[pid]
+                if (p.x - x) ** 2 + (p.y - y) ** 2 <= r2:
+                    found.add(pid)
+        return found
+
     # API
-    def register(self) -> int:
+    def register(self, token: Optional[str] = None) -> tuple[int, str]:
+        """
+        Returns (pid, session token). With the token of a player that is still here or
+        was removed less than SESSION_GRACE_TIME ago, that player comes back with its
+        id and last position. Unknown tokens just get a new player.
+        """
         with self._lock:
+            now = time.monotonic()
+            if token:
+                pid = self._tokens.get(token)
+                if pid is not None: # never left, e.g. the client restarted
+                    self.players[pid].last_update = now
+                    return pid, token
+                resumable, p = self._departed.pop(token, (0.0, None))
+                if p is not None and resumable > now:
+                    p.last_update = now
+                    self._add(p)
+                    return p.id, token
+
             pid = self._next_id
             self._next_id += 1
-            self.players[pid] = Player(pid, 0.0, 0.0, "", time.monotonic())
-            return pid
+            p = Player(pid, 0.0, 0.0, "", now, token=secrets.token_hex(8))
+            self._add(p)
+            return pid, p.token
 
     def update(self, pid: int, x: float, y: float, map_name: str, direction = "down", is_moving = False) -> bool:
         with self._lock:
@@ -85,19 +306,192 @@ class PlayerHandler:
             if not p:
                 return False
             else:
-                p.update(float(x), float(y), str(map_name), direction, is_moving)
+                if p.update(float(x), float(y), str(map_name), direction, is_moving):
+                    self._touch(p)
                 return True
 
+    def exists(self, pid: int) -> bool:
+        with self._lock:
+            return pid in self.players
+
+    def token_of(self, pid: int) -> Optional[str]:
+        """ Session token of a live player, UdpServer derives its datagram key from it """
+        with self._lock:
+            p = self.players.get(pid)
+            return p.token if p else None
+
+    def heartbeat(self, pid: int) -> bool:
+        """ Keep an idle player alive. False if it's already gone (client should re-register) """
+        with self._lock:
+            p = self.players.get(pid)
+            if p is None:
+                return False
+            p.last_update = time.monotonic()
+            return True
+
+    def players_per_map(self) -> dict[str, int]:
+        with self._lock:
+            return {m: sum(len(pids) for pids in cells.values()) for m, cells in self._grid.items()}
+
+    @property
+    def version(self) -> int:
+        with self._lock:
+            return self._version
+
+    # Persistence (server/stateStore.py)
+    def dump(self) -> dict:
+        with self._lock:
+            return {
+                "next_id": self._next_id,
+                "version": self._version,
+                "players": [{**p.to_dict(), "version": p.version, "token": p.token} for p in self.players.values()],
+            }
+
+    def load(self, state: dict, *, restore_players: bool = True, version_gap: bool = True) -> None:
+        """
+        Replace everything with a dump() from an earlier run. Restored players get a
+        fresh timeout to come back. The version skips ahead so a cursor a client got
+        after the dump was written can't alias a new version, every old cursor is
+        below the tombstone floor and gets a full snapshot. server/replay.py turns
+        that off, its dump is exactly where the recording started.
+        """
+        with self._lock:
+            self.players.clear()
+            self._changes.clear()
+            self._tombstones.clear()
+            self._grid.clear()
+            self._cells.clear()
+            self._views.clear()
+            self._expiry.clear()
+            self._tokens.clear()
+            self._departed.clear()
+
+            self._next_id = int(state["next_id"])
+            self._version = int(state["version"]) + (RESTORE_VERSION_GAP if version_gap else 0)
+            self._tombstone_floor = self._version
+            now = time.monotonic()
+            for d in state["players"] if restore_players else []:
+                p = Player(int(d["id"]), float(d["x"]), float(d["y"]), str(d["map"]), now,
+                           d.get("direction", "down"), bool(d.get("is_moving", False)), self._version,
+                           d.get("token") or secrets.token_hex(8))
+                self.players[p.id] = p
+                self._tokens[p.token] = p.id
+                self._changes[p.id] = p.version
+                self._index(p)
+                heapq.heappush(self._expiry, (now + self.timeout, p.id))
+                self._next_id = max(self._next_id, p.id + 1)
+
+    def snapshot(self) -> PlayerSnapshot:
+        """
+        Cached full snapshot, at most SNAPSHOT_INTERVAL old.
+        Readers only do attribute reads, one of them rebuilds while the others keep the old one.
+        """
+        snap = self._snapshot
+        if snap.version == self._version or time.monotonic() - snap.built_at < SNAPSHOT_INTERVAL:
+            return snap
+        if not self._snapshot_lock.acquire(blocking=False):
+            return snap # someone is already rebuilding
+        try:
+            with self._lock:
+                version = self._version
+                players = {p.id: p.to_dict() for p in self.players.values()}
+            # encode outside the writer lock
+            if version != self._snapshot.version:
+                self._snapshot = PlayerSnapshot.build(version, players)
+            return self._snapshot
+        finally:
+            self._snapshot_lock.release()
+
     def list_players(self) -> dict:
         with self._lock:
-            player_list = {}
-            for p in self.players.values():
-                player_list[p.id] = {
-                    "id": p.id,
-                    "x": p.x,
-                    "y": p.y,
-                    "map": p.map,
-                    "direction": p.direction,      
-                    "is_moving": p.is_moving                           
+            return {p.id: p.to_dict() for p in self.players.values()}
+
+    def list_players_since(self, since: int) -> dict:
+        """
+        Delta against a version the client already has.
+        Falls back to a full snapshot when `since` is unknown (server restart)
+        or older than the tombstones we still remember.
+        """
+        with self._lock:
+            if since < self._tombstone_floor or since > self._version:
+                return {
+                    "version": self._version,
+                    "full": True,
+                    "players": {p.id: p.to_dict() for p in self.players.values()},
+                    "removed": [],
+                    "time": time.time(), # server clock, clients interpolate on it
+                }
+
+            changed = {}
+            for pid, v in reversed(self._changes.items()): # newest first, stop at the first old one
+                if v <= since:
+                    break
+                changed[pid] = self.players[pid].to_dict()
+
+            removed = []
+            for pid, v in reversed(self._tombstones.items()):
+                if v <= since:
+                    break
+                removed.append(pid)
+
+            return {
+                "version": self._version,
+                "full": False,
+                "players": changed,
+                "removed": removed,
+                "time": time.time(),
+            }
+
+    def is_current(self, since: int, pid: Optional[int] = None) -> bool:
+        """
+        True if a client at version `since` has nothing to catch up on (conditional GET).
+        With `pid` it's about what list_players_near served that player, and counts as contact.
+        """
+        with self._lock:
+            if since != self._version:
+                return False
+            if pid is None:
+                return True
+            me = self.players.get(pid)
+            if me is None or self._views.get(pid, (-1,))[0] != since:
+                return False
+            me.last_update = time.monotonic()
+            return True
+
+    def list_players_near(self, pid: int, radius_tiles: float, since: int) -> Optional[dict]:
+        """
+        Same shape as list_players_since, but only for players on the caller's map
+        within `radius_tiles` of the caller. Players that walk out of range show up
+        in "removed". Returns None if the caller is not registered.
+        """
+        with self._lock:
+            me = self.players.get(pid)
+            if me is None:
+                return None
+            me.last_update = time.monotonic() # polling counts as contact
+
+            visible = self._query(me.map, me.x, me.y, radius_tiles * TILE_SIZE)
+            visible.discard(pid)
+            visible = frozenset(visible)
+
+            served, seen = self._views.get(pid, (-1, frozenset()))
+            full = since < 0 or since != served
+            if full:
+                changed = {q: self.players[q].to_dict() for q in visible}
+                removed = []
+            else:
+                changed = {
+                    q: self.players[q].to_dict()
+                    for q in visible
+                    if q not in seen or self.players[q].version > since
                 }
-            return player_list
+                removed = list(seen - visible)
+
+            self._views[pid] = (self._version, visible)
+            return {
+                "version": self._version,
+                "full": full,
+                "players": changed,
+                "removed": removed,
+                "time": time.time(),
+            }
@@ -0,0 +1,239 @@
+import json
+import struct
+import asyncio
+
+"""
+Stream protocol used by the push server (server/streamServer.py)
+
+Every frame is a 4 byte big-endian length followed by a UTF-8 JSON object
+with a "type" key, or by a binary message (see below) once both sides
+agreed on "encoding": "binary".
+
+client -> server
+    {"type": "hello", "token": <from /register or welcome, or null>, "radius": <tiles>,
+     "encoding": "json" | "binary", "chat_after": <id>}   # only the token resumes a player, "id" is ignored
+    {"type": "update", "x", "y", "map", "direction", "is_moving"}
+    {"type": "chat", "text": <str>}
+    updates and chat over the rate limit (server/rateLimiter.py) are dropped without an answer
+server -> client
+    {"type": "welcome", "id": <pid>, "token": <session token>, "encoding": "json" | "binary"}
+    {"type": "snapshot", "version", "full", "players", "removed", "time"}   # same as GET /players?since=
+    {"type": "chat", "messages": [...]}                             # same as GET /chat?after=
+
+Binary messages (also used over HTTP with Content-Type/Accept BINARY_CONTENT_TYPE)
+    snapshot: u8 MSG_SNAPSHOT, u64 version, u8 flags (bit0 = full), f64 server time (unix seconds),
+              map table, u16 n + n player records, u16 n + n u32 removed ids
+    update:   u8 MSG_UPDATE, map table, one player record
+    map table: u8 n + n * (u8 len + utf-8 name)
+    player record (12 bytes): u32 id, x and y as u16 tile + u8 1/256 tile,
+              u8 flags (bit0-1 direction, bit2 is_moving), u8 map index
+"""
+
+TILE_SIZE = 64 # same as GameSettings.TILE_SIZE on the client
+
+HEADER = struct.Struct("!I")
+MAX_FRAME_SIZE = 1 << 20 # 1 MiB, anything bigger is a broken peer
+
+BINARY_CONTENT_TYPE = "application/x-monstergo"
+MSG_SNAPSHOT = 0x01
+MSG_UPDATE = 0x02
+
+DIRECTIONS = ("down", "left", "right", "up")
+_DIRECTION_INDEX = {d: i for i, d in enumerate(DIRECTIONS)}
+FLAG_MOVING = 0x04
+FLAG_FULL = 0x01
+
+SUBTILE = 256 # coordinates are quantized to 1/256 of a tile (0.25px at 64px tiles)
+MAX_QUANTIZED = 0xFFFF * SUBTILE + 0xFF
+
+SNAPSHOT_HEADER = struct.Struct("!BQBd")
+RECORD = struct.Struct("!IHBHBBB")
+COUNT = struct.Struct("!H")
+REMOVED_ID = struct.Struct("!I")
+
+
+class ProtocolError(Exception):
+    pass
+
+
+def frame(payload: bytes) -> bytes:
+    return HEADER.pack(len(payload)) + payload
+
+
+def encode_frame(obj: dict) -> bytes:
+    return frame(json.dumps(obj, separators=(",", ":")).encode("utf-8"))
+
+
+def decode_payload(payload: bytes) -> dict:
+    if payload[:1] == b"{":
+        try:
+            obj = json.loads(payload.decode("utf-8"))
+        except ValueError as e:
+            raise ProtocolError(f"invalid frame: {e}")
+        if not isinstance(obj, dict):
+            raise ProtocolError("frame is not an object")
+        return obj
+    
+    try:
+        kind = payload[0] if payload else None
+        if kind == MSG_SNAPSHOT:
+            return {"type": "snapshot", **decode_snapshot(payload)}
+        if kind == MSG_UPDATE:
+            return {"type": "update", **decode_update(payload)}
+    except (struct.error, IndexError, UnicodeDecodeError) as e:
+        raise ProtocolError(f"invalid binary frame: {e}")
+    raise ProtocolError(f"unknown binary message {kind!r}")
+
+
+# ----------------------------------------------------------------------
+# Binary encoding
+# ----------------------------------------------------------------------
+def _quantize(v: float) -> tuple[int, int]:
+    q = min(max(int(round(float(v) * SUBTILE / TILE_SIZE)), 0), MAX_QUANTIZED)
+    return q >> 8, q & 0xFF
+
+
+def _dequantize(tile: int, frac: int) -> float:
+    return (tile * SUBTILE + frac) * TILE_SIZE / SUBTILE
+
+
+def _pack_maps(names: list[str]) -> bytes:
+    out = bytearray([len(names)])
+    for name in names:
+        raw = name.encode("utf-8")[:255]
+        out.append(len(raw))
+        out += raw
+    return bytes(out)
+
+
+def _unpack_maps(buf: bytes, offset: int) -> tuple[list[str], int]:
+    n = buf[offset]
+    offset += 1
+    names = []
+    for _ in range(n):
+        length = buf[offset]
+        names.append(buf[offset + 1:offset + 1 + length].decode("utf-8"))
+        offset += 1 + length
+    return names, offset
+
+
+def _pack_record(p: dict, map_index: dict[str, int]) -> bytes:
+    x_tile, x_frac = _quantize(p["x"])
+    y_tile, y_frac = _quantize(p["y"])
+    flags = _DIRECTION_INDEX.get(p.get("direction", "down"), 0)
+    if p.get("is_moving"):
+        flags |= FLAG_MOVING
+    return RECORD.pack(int(p["id"]), x_tile, x_frac, y_tile, y_frac, flags, map_index[p.get("map", "")])
+
+
+def _unpack_record(fields: tuple, maps: list[str]) -> dict:
+    pid, x_tile, x_frac, y_tile, y_frac, flags, m = fields
+    return {
+        "id": pid,
+        "x": _dequantize(x_tile, x_frac),
+        "y": _dequantize(y_tile, y_frac),
+        "map": maps[m],
+        "direction": DIRECTIONS[flags & 0x03],
+        "is_moving": bool(flags & FLAG_MOVING),
+    }
+
+
+def _intern_maps(players) -> tuple[list[str], dict[str, int]]:
+    names: list[str] = []
+    index: dict[str, int] = {}
+    for p in players:
+        name = p.get("map", "")
+        if name not in index:
+            if len(names) == 255:
+                raise ProtocolError("too many maps in one message")
+            index[name] = len(names)
+            names.append(name)
+    return names, index
+
+
+def encode_snapshot(data: dict) -> bytes:
+    """ Binary form of a {"version", "full", "players", "removed", "time"} dict """
+    players = list(data["players"].values())
+    removed = data.get("removed", [])
+    names, index = _intern_maps(players)
+    
+    flags = FLAG_FULL if data.get("full") else 0
+    out = bytearray(SNAPSHOT_HEADER.pack(MSG_SNAPSHOT, data["version"], flags, data.get("time", 0.0)))
+    out += _pack_maps(names)
+    out += COUNT.pack(len(players))
+    for p in players:
+        out += _pack_record(p, index)
+    out += COUNT.pack(len(removed))
+    for pid in removed:
+        out += REMOVED_ID.pack(int(pid))
+    return bytes(out)
+
+
+def decode_snapshot(buf: bytes) -> dict:
+    kind, version, flags, server_time = SNAPSHOT_HEADER.unpack_from(buf)
+    if kind != MSG_SNAPSHOT:
+        raise ProtocolError("not a snapshot")
+    maps, offset = _unpack_maps(buf, SNAPSHOT_HEADER.size)
+    
+    (n,) = COUNT.unpack_from(buf, offset)
+    offset += COUNT.size
+    end = offset + n * RECORD.size
+    players = {}
+    for fields in RECORD.iter_unpack(buf[offset:end]):
+        p = _unpack_record(fields, maps)
+        players[p["id"]] = p
+    
+    (n,) = COUNT.unpack_from(buf, end)
+    offset = end + COUNT.size
+    removed = [pid for (pid,) in REMOVED_ID.iter_unpack(buf[offset:offset + n * REMOVED_ID.size])]
+    
+    return {"version": version, "full": bool(flags & FLAG_FULL), "players": players, "removed": removed, "time": server_time}
+
+
+def encode_update(pid: int, update: dict) -> bytes:
+    p = {"id": pid, **update}
+    names, index = _intern_maps([p])
+    return bytes([MSG_UPDATE]) + _pack_maps(names) + _pack_record(p, index)
+
+
+def decode_update(buf: bytes) -> dict:
+    if buf[0] != MSG_UPDATE:
+        raise ProtocolError("not an update")
+    maps, offset = _unpack_maps(buf, 1)
+    return _unpack_record(RECORD.unpack_from(buf, offset), maps)
+
+
+async def read_frame(reader: asyncio.StreamReader) -> dict | None:
+    """ Returns None on a clean EOF """
+    try:
+        header = await reader.readexactly(HEADER.size)
+    except asyncio.IncompleteReadError:
+        return None
+    (length,) = HEADER.unpack(header)
+    if length > MAX_FRAME_SIZE:
+        raise ProtocolError(f"frame too large: {length}")
+    try:
+        payload = await reader.readexactly(length)
+    except asyncio.IncompleteReadError: # peer went away mid frame, same as an EOF
+        return None
+    return decode_payload(payload)
+
+
+class FrameReader:
+    """ Incremental decoder for blocking sockets: feed() whatever recv() gave you """
+    def __init__(self) -> None:
+        self._buf = bytearray()
+
+    def feed(self, data: bytes) -> list[dict]:
+        self._buf += data
+        frames = []
+        while len(self._buf) >= HEADER.size:
+            (length,) = HEADER.unpack_from(self._buf)
+            if length > MAX_FRAME_SIZE:
+                raise ProtocolError(f"frame too large: {length}")
+            end = HEADER.size + length
+            if len(self._buf) < end:
+                break
+            frames.append(decode_payload(bytes(self._buf[HEADER.size:end])))
+            del self._buf[:end]
+        return frames
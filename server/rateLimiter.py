@@ -0,0 +1,74 @@
+import threading
+import time
+from typing import Hashable
+
+from server.metrics import REGISTRY
+
+"""
+Per-player token buckets
+
+    retry_after = RATE_LIMITER.check(pid, "update")
+    if retry_after > 0: -> 429 with a Retry-After hint
+
+Each (key, kind) refills at `rate` tokens per second up to `burst`. A normal
+client ticks at 60Hz, so the limits leave some headroom above that and only
+catch clients that send far more than the game ever does.
+"""
+
+LIMITS = {
+    # kind: (tokens per second, burst)
+    "update": (75.0, 40.0), # position updates and heartbeats
+    "poll": (75.0, 40.0),   # GET /players?id= and POST /sync
+    "chat": (1.0, 5.0),     # messages posted
+}
+IDLE_TIME = 60.0 # buckets untouched this long are full again anyway, drop them
+PRUNE_INTERVAL = 10.0
+
+LIMITED = REGISTRY.counter("rate_limited_total", "Requests rejected by the rate limiter", ("kind",))
+
+
+class TokenBucket:
+    __slots__ = ("rate", "burst", "tokens", "stamp")
+
+    def __init__(self, rate: float, burst: float, now: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.stamp = now
+
+    def take(self, now: float, cost: float = 1.0) -> float:
+        """ 0 if `cost` tokens were taken, otherwise seconds until they would be there """
+        self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+        if self.tokens >= cost:
+            self.tokens -= cost
+            return 0.0
+        return (cost - self.tokens) / self.rate
+
+
+class RateLimiter:
+    def __init__(self, limits: dict[str, tuple[float, float]] = LIMITS):
+        self.limits = limits
+        self._buckets: dict[tuple[Hashable, str], TokenBucket] = {}
+        self._lock = threading.Lock()
+        self._pruned_at = time.monotonic()
+
+    def check(self, key: Hashable, kind: str, cost: float = 1.0) -> float:
+        """ Take `cost` tokens from key's `kind` bucket. Returns 0 if allowed, else the retry-after in seconds """
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get((key, kind))
+            if bucket is None:
+                rate, burst = self.limits[kind]
+                bucket = self._buckets[(key, kind)] = TokenBucket(rate, burst, now)
+            retry_after = bucket.take(now, cost)
+            if now - self._pruned_at > PRUNE_INTERVAL:
+                self._prune(now)
+        if retry_after > 0:
+            LIMITED.inc((kind,))
+        return retry_after
+
+    def _prune(self, now: float) -> None:
+        """ Call with _lock held """
+        self._buckets = {k: b for k, b in self._buckets.items() if now - b.stamp < IDLE_TIME}
+        self._pruned_at = now
@@ -0,0 +1,158 @@
+import json
+import struct
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+from typing import BinaryIO, Iterator
+
+from server.metrics import REGISTRY
+
+"""
+Append-only log of everything clients send, for server/replay.py
+
+    python server.py --record traffic.rec
+
+The file is a magic header followed by records, each one
+
+    RECORD header | meta | reply | body
+
+kind   STATE   meta = "", body = zlib'd {"players": PlayerHandler.dump(), "chat": ChatHandler.dump()},
+               written when recording starts so a replay begins from the same world
+       HTTP    method = METHODS index, status = response code, meta = path?query plus the
+               headers that change the answer ("\\nName: value"), body = request body
+       UDP     body = the datagram
+       STREAM  conn = connection serial, body = the message as JSON, method = STREAM_CLOSE
+               with no body when the connection ends
+
+reply is what the server handed out that the client will send back later, the
+"id token" of a /register or a stream hello, so a replay can map the tokens.
+Records are written in the order requests finished, stamped with when they arrived.
+A server restart appending to the same file starts with a new STATE record.
+"""
+
+MAGIC = b"MGREC\x01\n"
+RECORD = struct.Struct("<dBBHIHHI") # time, kind, method, status, conn, meta len, reply len, body len
+KIND_STATE, KIND_HTTP, KIND_UDP, KIND_STREAM = range(4)
+METHODS = ("GET", "POST", "PUT", "DELETE", "HEAD")
+STREAM_MESSAGE, STREAM_CLOSE = 0, 1
+RECORDED_HEADERS = ("Content-Type", "Accept", "If-None-Match")
+FLUSH_INTERVAL = 1.0 # seconds, what a crash can lose
+
+RECORDED = REGISTRY.counter("recorder_records_total", "Requests written to the traffic log", ("kind",))
+RECORDED_BYTES = REGISTRY.counter("recorder_bytes_total", "Bytes written to the traffic log")
+
+
+@dataclass(frozen=True)
+class Record:
+    t: float
+    kind: int
+    method: int
+    status: int
+    conn: int
+    meta: bytes
+    reply: bytes
+    body: bytes
+
+    @property
+    def method_name(self) -> str:
+        return METHODS[self.method] if self.method < len(METHODS) else "GET"
+
+    def http_request(self) -> tuple[str, dict[str, str]]:
+        """ (path?query, recorded headers) of an HTTP record """
+        path, *lines = self.meta.decode("latin-1").split("\n")
+        headers = {}
+        for line in lines:
+            name, _, value = line.partition(": ")
+            headers[name] = value
+        return path, headers
+
+    def state(self) -> dict:
+        return json.loads(zlib.decompress(self.body))
+
+
+class Recorder:
+    """
+    Request threads (and the stream/udp loops) only pack a record and append it to a
+    list, a background thread does the file writes every FLUSH_INTERVAL.
+    """
+    def __init__(self, path: str, *, flush_interval: float = FLUSH_INTERVAL):
+        self.path = path
+        self.flush_interval = flush_interval
+        self._pending: list[bytes] = []
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._file: BinaryIO | None = None
+
+    def start(self, player_handler, chat_handler) -> None:
+        self._file = open(self.path, "ab")
+        if self._file.tell() == 0:
+            self._file.write(MAGIC)
+        state = {"players": player_handler.dump(), "chat": chat_handler.dump()}
+        self._append(KIND_STATE, body=zlib.compress(json.dumps(state, separators=(",", ":")).encode("utf-8")))
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._writer, name="Recorder", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=2.0)
+            self._thread = None
+        self._flush()
+        if self._file:
+            self._file.close()
+            self._file = None
+
+    def _writer(self) -> None:
+        while not self._stop_event.wait(self.flush_interval):
+            self._flush()
+
+    def _flush(self) -> None:
+        with self._lock:
+            pending, self._pending = self._pending, []
+        if pending and self._file:
+            data = b"".join(pending)
+            self._file.write(data)
+            self._file.flush()
+            RECORDED_BYTES.inc((), len(data))
+
+    def _append(self, kind: int, *, t: float | None = None, method: int = 0, status: int = 0, conn: int = 0,
+                meta: bytes = b"", reply: bytes = b"", body: bytes = b"") -> None:
+        header = RECORD.pack(time.time() if t is None else t, kind, method, status, conn, len(meta), len(reply), len(body))
+        with self._lock:
+            self._pending.append(header + meta + reply + body)
+        RECORDED.inc((("state", "http", "udp", "stream")[kind],))
+
+    # -- called by the servers -----------------------------------------
+    def record_http(self, t: float, method: str, path: str, headers, body: bytes, status: int, reply: str = "") -> None:
+        meta = path + "".join(f"\n{name}: {headers[name]}" for name in RECORDED_HEADERS if headers.get(name))
+        self._append(KIND_HTTP, t=t, method=METHODS.index(method) if method in METHODS else 0, status=status,
+                     meta=meta.encode("latin-1", "replace"), reply=reply.encode("utf-8"), body=body)
+
+    def record_udp(self, data: bytes) -> None:
+        self._append(KIND_UDP, body=data)
+
+    def record_stream(self, conn: int, msg: dict | None, reply: str = "") -> None:
+        if msg is None:
+            self._append(KIND_STREAM, method=STREAM_CLOSE, conn=conn)
+            return
+        self._append(KIND_STREAM, conn=conn, reply=reply.encode("utf-8"),
+                     body=json.dumps(msg, separators=(",", ":")).encode("utf-8"))
+
+
+def read_records(f: BinaryIO) -> Iterator[Record]:
+    """ Every record in a log, stops quietly at a record cut short by a crash """
+    if f.read(len(MAGIC)) != MAGIC:
+        raise ValueError("not a traffic recording")
+    while True:
+        header = f.read(RECORD.size)
+        if len(header) < RECORD.size:
+            return
+        t, kind, method, status, conn, n_meta, n_reply, n_body = RECORD.unpack(header)
+        payload = f.read(n_meta + n_reply + n_body)
+        if len(payload) < n_meta + n_reply + n_body:
+            return
+        yield Record(t, kind, method, status, conn, payload[:n_meta],
+                     payload[n_meta:n_meta + n_reply], payload[n_meta + n_reply:])
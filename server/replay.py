@@ -0,0 +1,310 @@
+import argparse
+import importlib.util
+import io
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from urllib.parse import urlsplit, parse_qs, urlencode
+
+from server.playerHandler import PlayerHandler
+from server.chatHandler import ChatHandler
+from server.streamServer import StreamServer, Connection
+from server.udpServer import UdpServer, UDP_HEADER, udp_key
+from server.protocol import BINARY_CONTENT_TYPE, encode_update, decode_update
+from server.rateLimiter import RateLimiter, LIMITS
+from server.recorder import read_records, Record, KIND_STATE, KIND_HTTP, KIND_UDP, KIND_STREAM, STREAM_CLOSE
+
+"""
+Feeds a recording from `server.py --record` into a fresh PlayerHandler/ChatHandler
+
+    python -m server.replay traffic.rec            # as fast as possible, one request at a time
+    python -m server.replay traffic.rec --speed 1  # original timing, concurrent like the real server
+    python -m server.replay traffic.rec --speed 4 -v
+
+HTTP requests go through server.py's own Handler (from in-memory buffers instead of a
+socket), UDP datagrams through UdpServer.handle_datagram and stream messages through
+StreamServer._on_message, so it's the real server code that gets exercised.
+Each recorded STATE record resets the world to what the server had when it started recording.
+
+As fast as possible is deterministic: same recording, same result. It turns the chat
+long-poll wait= into 0, or every poll would sit out its full wait with nobody posting.
+The rate limiter is only on at --speed 1, the recording was already limited once and
+squeezed into less time it would mostly get 429s. Without it, recorded 429s can't
+come back, so they're counted on their own instead of as mismatches.
+Tokens handed out by /register and stream hellos are mapped from the recorded ones
+to the replayed ones, and so are ids when two registrations finish in a different
+order than they ran (records are written as requests finish). Responses whose status
+differs from the recording are counted per route, that's the regression check.
+Stream snapshots aren't broadcast.
+"""
+
+ROOT = Path(__file__).resolve().parent.parent
+UNLIMITED = {kind: (1e9, 1e9) for kind in LIMITS}
+REALTIME_WORKERS = 64 # the real server is a thread per connection, long-polls included
+
+
+def load_app():
+    """ server.py as a module (the `server` name is taken by this package) """
+    spec = importlib.util.spec_from_file_location("server_app", ROOT / "server.py")
+    app = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(app)
+    app.PLAYER_HANDLER.stop() # replaced by a fresh one per session
+    return app
+
+
+class _NullWriter:
+    """ Stands in for a stream connection's StreamWriter, replies go nowhere """
+    def write(self, data: bytes) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+    def is_closing(self) -> bool:
+        return False
+
+
+@dataclass
+class Result:
+    requests: dict[str, int] = field(default_factory=dict)     # kind -> count
+    mismatches: dict[str, int] = field(default_factory=dict)   # "GET /players 200->404" -> count
+    id_mismatches: int = 0
+    unlimited_429s: int = 0 # recorded 429s replayed without the rate limiter, not compared
+    sessions: int = 0
+    elapsed: float = 0.0
+    recorded_span: float = 0.0 # seconds of traffic, summed over sessions
+
+
+class Replayer:
+    def __init__(self, *, speed: float = 0.0, rate_limit: bool | None = None, verbose: bool = False):
+        self.speed = speed # 0 = as fast as possible
+        self.rate_limit = speed == 1 if rate_limit is None else rate_limit
+        self.verbose = verbose
+        self.app = load_app()
+        self.result = Result()
+        self._pool = ThreadPoolExecutor(REALTIME_WORKERS, thread_name_prefix="Replay") if speed > 0 else None
+        self._tokens: dict[str, str] = {}          # recorded token -> replayed token
+        self._ids: dict[int, int] = {}             # recorded pid -> replayed pid, only the ones that differ
+        self._keys: dict[int, int] = {}            # recorded udp key -> replayed one, they come from the tokens
+        self._conns: dict[int, Connection] = {}    # recorded stream serial -> connection
+        self.reset(None)
+
+    def reset(self, state: dict | None) -> None:
+        """ Fresh handlers, loaded with a STATE record if there is one """
+        app = self.app
+        if self._pool:
+            app.PLAYER_HANDLER.stop()
+        app.PLAYER_HANDLER = PlayerHandler()
+        app.CHAT_HANDLER = ChatHandler()
+        app.RATE_LIMITER = RateLimiter() if self.rate_limit else RateLimiter(UNLIMITED)
+        app.RECORDER = None
+        if state:
+            app.PLAYER_HANDLER.load(state["players"], version_gap=False)
+            app.CHAT_HANDLER.load(state["chat"])
+        if self._pool: # only expire players in real time, fast replays would otherwise depend on the machine
+            app.PLAYER_HANDLER.start()
+        self.udp = UdpServer(app.PLAYER_HANDLER, app.RATE_LIMITER)
+        self.stream = StreamServer(app.PLAYER_HANDLER, app.CHAT_HANDLER, app.RATE_LIMITER)
+        self._tokens.clear()
+        self._ids.clear()
+        self._keys.clear()
+        self._conns.clear()
+
+    @property
+    def players(self) -> PlayerHandler:
+        return self.app.PLAYER_HANDLER
+
+    def run(self, records) -> Result:
+        t0 = time.perf_counter()
+        first = last = None
+        for rec in records:
+            if rec.kind == KIND_STATE:
+                if first is not None:
+                    self.result.recorded_span += last - first
+                self._wait_idle()
+                self.reset(rec.state())
+                self.result.sessions += 1
+                first = None # a restart can be hours later, don't wait for it
+                continue
+            if first is None:
+                first, base = rec.t, time.perf_counter()
+            last = rec.t
+            if self._pool:
+                time.sleep(max(0.0, base + (rec.t - first) / self.speed - time.perf_counter()))
+            self._apply(rec)
+            kind = ("state", "http", "udp", "stream")[rec.kind]
+            self.result.requests[kind] = self.result.requests.get(kind, 0) + 1
+        self._wait_idle()
+        self.result.elapsed = time.perf_counter() - t0
+        if first is not None:
+            self.result.recorded_span += last - first
+        return self.result
+
+    def _wait_idle(self) -> None:
+        if self._pool:
+            self._pool.shutdown(wait=True)
+            self._pool = ThreadPoolExecutor(REALTIME_WORKERS, thread_name_prefix="Replay")
+
+    def _apply(self, rec: Record) -> None:
+        if rec.kind == KIND_HTTP:
+            if self._pool and rec.meta.startswith(b"/chat"): # may long-poll, don't hold up the rest
+                self._pool.submit(self._http, rec)
+            else:
+                self._http(rec)
+        elif rec.kind == KIND_UDP:
+            body = rec.body
+            if len(body) > UDP_HEADER.size:
+                kind, key, session, seq = UDP_HEADER.unpack_from(body)
+                if key in self._keys or self._ids:
+                    update = self._remap_binary(body[UDP_HEADER.size:]) if self._ids else body[UDP_HEADER.size:]
+                    body = UDP_HEADER.pack(kind, self._keys.get(key, key), session, seq) + update
+            self.udp.handle_datagram(body)
+        elif rec.kind == KIND_STREAM:
+            self._stream(rec)
+
+    # -- http ----------------------------------------------------------
+    def _http(self, rec: Record) -> None:
+        path, headers = rec.http_request()
+        url = urlsplit(path)
+        query = parse_qs(url.query)
+        if "token" in query:
+            query["token"] = [self._tokens.get(t, t) for t in query["token"]]
+        if not self._pool and "wait" in query:
+            query["wait"] = ["0"]
+        body = rec.body
+        if self._ids:
+            if "id" in query:
+                query["id"] = [str(self._map_id(i)) for i in query["id"]]
+            if headers.get("Content-Type") == BINARY_CONTENT_TYPE:
+                body = self._remap_binary(body)
+            elif body:
+                body = self._remap_json(body)
+        path = url.path + ("?" + urlencode(query, doseq=True) if query else "")
+
+        head = [f"{rec.method_name} {path} HTTP/1.1", "Host: replay"]
+        head += [f"{name}: {value}" for name, value in headers.items()]
+        head.append(f"Content-Length: {len(body)}")
+        raw = ("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body
+
+        handler = self.app.Handler.__new__(self.app.Handler)
+        handler.rfile = io.BytesIO(raw)
+        handler.wfile = io.BytesIO()
+        handler.client_address = ("replay", 0)
+        handler.server = None
+        handler.close_connection = True
+        handler.handle_one_request()
+
+        if rec.status == 429 and not self.rate_limit:
+            self.result.unlimited_429s += 1
+        elif handler._status != rec.status:
+            key = f"{rec.method_name} {url.path} {rec.status}->{handler._status}"
+            self.result.mismatches[key] = self.result.mismatches.get(key, 0) + 1
+            if self.verbose:
+                print(f"[Replay] {key}")
+        if rec.reply and url.path == "/register" and handler._status == 200:
+            body = handler.wfile.getvalue().split(b"\r\n\r\n", 1)[1]
+            reply = json.loads(body)
+            self._map_reply(rec.reply, reply["id"], reply["token"])
+
+    def _map_reply(self, recorded: bytes, pid: int, token: str) -> None:
+        old_pid, _, old_token = recorded.decode("utf-8").partition(" ")
+        self._tokens[old_token] = token
+        self._keys[udp_key(old_token)] = udp_key(token)
+        if int(old_pid) != pid:
+            self._ids[int(old_pid)] = pid
+            self.result.id_mismatches += 1
+            if self.verbose:
+                print(f"[Replay] player {old_pid} came back as {pid}")
+        else:
+            self._ids.pop(pid, None)
+
+    def _map_id(self, pid):
+        try:
+            return self._ids.get(int(pid), pid)
+        except (TypeError, ValueError):
+            return pid # broken request, replay it broken
+
+    def _remap_json(self, body: bytes) -> bytes:
+        try:
+            data = json.loads(body)
+        except ValueError:
+            return body
+        if not isinstance(data, dict) or "id" not in data:
+            return body
+        data["id"] = self._map_id(data["id"])
+        return json.dumps(data).encode("utf-8")
+
+    def _remap_binary(self, body: bytes) -> bytes:
+        try:
+            update = decode_update(body)
+        except Exception:
+            return body
+        return encode_update(self._map_id(update.pop("id")), update)
+
+    # -- stream --------------------------------------------------------
+    def _stream(self, rec: Record) -> None:
+        if rec.method == STREAM_CLOSE:
+            conn = self._conns.pop(rec.conn, None)
+            if conn:
+                self.stream.connections.discard(conn)
+            return
+        conn = self._conns.get(rec.conn)
+        if conn is None:
+            conn = self._conns[rec.conn] = Connection(_NullWriter(), serial=rec.conn)
+        msg = json.loads(rec.body)
+        if msg.get("type") == "hello":
+            if msg.get("token"):
+                msg["token"] = self._tokens.get(msg["token"], msg["token"])
+            if msg.get("id") is not None:
+                msg["id"] = self._map_id(msg["id"])
+        try:
+            self.stream._on_message(conn, msg)
+        except Exception as e: # the recorded server dropped this connection too
+            if self.verbose:
+                print(f"[Replay] stream #{rec.conn}: {e}")
+            self._conns.pop(rec.conn, None)
+            return
+        if rec.reply and msg.get("type") == "hello":
+            self._map_reply(rec.reply, conn.pid, conn.token)
+
+    def close(self) -> None:
+        if self._pool:
+            self._pool.shutdown(wait=True)
+        self.app.PLAYER_HANDLER.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Replay a server.py --record traffic log against a fresh PlayerHandler")
+    parser.add_argument("file", help="recording written by server.py --record")
+    parser.add_argument("--speed", type=float, default=0.0, help="1 = original timing, 2 = twice as fast, 0 = as fast as possible")
+    parser.add_argument("--rate-limit", action="store_true", default=None, help="keep the rate limiter on at speeds other than 1")
+    parser.add_argument("--json", dest="json_out", default=None, help="also write the results to this file")
+    parser.add_argument("-v", "--verbose", action="store_true", help="print every mismatch")
+    args = parser.parse_args()
+
+    replayer = Replayer(speed=args.speed, rate_limit=args.rate_limit, verbose=args.verbose)
+    try:
+        with open(args.file, "rb") as f:
+            r = replayer.run(read_records(f))
+        players = len(replayer.players.list_players())
+    finally:
+        replayer.close()
+
+    total = sum(r.requests.values())
+    print(f"[Replay] {total} requests ({', '.join(f'{k} {n}' for k, n in sorted(r.requests.items()))}) "
+          f"from {r.sessions} session(s) in {r.elapsed:.2f}s, {total / max(r.elapsed, 1e-9):.0f} req/s "
+          f"(recorded over {r.recorded_span:.2f}s)")
+    print(f"[Replay] {players} players at the end, {r.id_mismatches} id mismatches, "
+          f"{sum(r.mismatches.values())} status mismatches"
+          + (f" ({r.unlimited_429s} recorded 429s not compared, rate limiter off)" if r.unlimited_429s else ""))
+    for key, n in sorted(r.mismatches.items(), key=lambda kv: -kv[1]):
+        print(f"          {key:<32} {n}")
+    if args.json_out:
+        with open(args.json_out, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "players": players, **r.__dict__}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,691 @@
+import heapq
+import multiprocessing
+import secrets
+import struct
+import threading
+import time
+from multiprocessing import shared_memory
+from typing import Dict, Optional
+
+from server.playerHandler import (
+    PlayerSnapshot, TIMEOUT_TIME, CHECK_INTERVAL_TIME, SNAPSHOT_INTERVAL, RESTORE_VERSION_GAP, SESSION_GRACE_TIME,
+    EXPIRED, SWEEP_TIME,
+)
+from server.chatHandler import MAX_MESSAGES, MAX_WAIT_TIME
+from server.rateLimiter import LIMITS, LIMITED, IDLE_TIME, PRUNE_INTERVAL, TokenBucket
+from server.protocol import TILE_SIZE, DIRECTIONS
+
+"""
+Player table, chat ring and rate limits in shared memory, for `server.py --workers N`
+
+Every worker process maps the same block and reads records in place with
+struct.unpack_from, nothing is pickled or copied between processes.
+
+players block
+    header: u64 next_id, u64 version, u64 tombstone_floor, u32 map count, u32 slots in use
+    map table: MAX_MAPS * MAP_NAME (pascal string), index 0 is ""
+    records: MAX_PLAYERS * RECORD
+        u32 seq, i32 id (FREE = never used), f64 x, f64 y, u8 map index, u8 direction,
+        u8 flags (bit0 alive, bit1 is_moving), pad, f64 last_update (monotonic), u64 version,
+        16 bytes session token
+    pid index: u32 seq, then a power of two >= 2 * capacity of INDEX_ENTRY (i32 pid, i32 slot),
+        open addressing with linear probing, pid FREE = empty. Rebuilt by register()
+        and load(), the only places a slot gets a different pid.
+
+rate limit block
+    header: f64 pruned_at, u32 buckets in use
+    buckets: a power of two >= 2 * capacity * kinds of BUCKET (i64 key hash, i32 kind, f64 tokens, f64 stamp),
+        open addressing like the pid index, kind FREE = empty. Pruning rebuilds it.
+
+Writers take one cross-process lock. Readers don't lock at all: `seq` is odd
+while a record is being written, so a reader retries until it gets the same
+even seq before and after (a seqlock), the index works the same way. Scans over
+all slots (interest polls, deltas) peek at the fields they filter on in
+place and only read the records that pass. A removed player stays in its slot as a
+tombstone (alive = 0), which is also what register(token) resumes, so
+new players only take a tombstone once its grace time is over.
+"""
+
+MAX_PLAYERS = 1024
+MAX_MAPS = 64
+
+HEADER = struct.Struct("<QQQII")
+MAP_NAME = struct.Struct("<64p")
+RECORD = struct.Struct("<IiddBBBxdQ16s")
+SEQ = struct.Struct("<I")
+PEEK = struct.Struct("<4xiddBBBxdQ16x") # RECORD minus seq and token, read in place without the seqlock
+INDEX_ENTRY = struct.Struct("<ii")
+RECORDS_OFFSET = HEADER.size + MAX_MAPS * MAP_NAME.size
+
+FREE = -1
+FLAG_ALIVE = 0x01
+FLAG_MOVING = 0x02
+CONTACT_INTERVAL = 1.0 # polls refresh last_update at most this often, so reads stay lock free
+
+CHAT_HEADER = struct.Struct("<Q")
+CHAT_TEXT_SIZE = 512 # bytes of utf-8, longer messages are cut
+CHAT_RECORD = struct.Struct(f"<QiH{CHAT_TEXT_SIZE}s")
+
+BUCKETS_HEADER = struct.Struct("<dI")
+BUCKET = struct.Struct("<qidd")
+
+_DIRECTION_INDEX = {d: i for i, d in enumerate(DIRECTIONS)}
+
+# fork, so workers inherit the mapping and the locks
+_CTX = multiprocessing.get_context("fork")
+
+
+class SharedPlayerHandler:
+    """
+    PlayerHandler API on top of the shared table. Create it in the parent before
+    forking; run the cleaner (start()) in one process only.
+    """
+    _shm: shared_memory.SharedMemory
+    _lock: "multiprocessing.synchronize.Lock"
+
+    # per process caches, rebuilt from shared memory on a miss
+    _slots: Dict[int, int]                        # pid -> slot
+    _map_names: list[str]
+    _map_index: Dict[str, int]
+    _views: Dict[int, tuple[int, frozenset[int]]] # pid -> (version served, pids it can see)
+    _snapshot: PlayerSnapshot
+    _snapshot_lock: threading.Lock
+    _expiry: list[tuple[float, int]]              # (deadline, slot), cleaner process only
+    _watched: int                                 # slots below this are in _expiry
+
+    def __init__(self, *, capacity: int = MAX_PLAYERS, timeout_seconds: float = TIMEOUT_TIME,
+                 check_interval_seconds: float = CHECK_INTERVAL_TIME):
+        self.capacity = capacity
+        self.timeout = timeout_seconds
+        self.check_interval = check_interval_seconds
+        self._index_offset = RECORDS_OFFSET + capacity * RECORD.size
+        self._index_mask = (1 << (2 * capacity - 1).bit_length()) - 1
+        self._shm = shared_memory.SharedMemory(
+            create=True, size=self._index_offset + SEQ.size + (self._index_mask + 1) * INDEX_ENTRY.size)
+        self._buf = self._shm.buf
+        self._lock = _CTX.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+        HEADER.pack_into(self._buf, 0, 0, 0, 0, 1, 0)
+        MAP_NAME.pack_into(self._buf, HEADER.size, b"")
+        for slot in range(capacity):
+            RECORD.pack_into(self._buf, self._offset(slot), 0, FREE, 0.0, 0.0, 0, 0, 0, 0.0, 0, b"")
+        SEQ.pack_into(self._buf, self._index_offset, 0)
+        self._clear_index()
+
+        self._slots = {}
+        self._map_names = [""]
+        self._map_index = {"": 0}
+        self._views = {}
+        self._snapshot = PlayerSnapshot.build(0, {})
+        self._snapshot_lock = threading.Lock()
+        self._expiry = []
+        self._watched = 0
+
+    def close(self) -> None:
+        """ Parent only, after the workers are gone """
+        self.stop()
+        self._shm.close()
+        self._shm.unlink()
+
+    # Threading (cleaner, one process)
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._cleaner, name="PlayerCleaner", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=2.0)
+
+    def _cleaner(self) -> None:
+        while not self._stop_event.wait(self.check_interval):
+            t0 = time.perf_counter()
+            expired = self._expire(time.monotonic())
+            if expired:
+                EXPIRED.inc((), expired)
+            SWEEP_TIME.observe((), time.perf_counter() - t0)
+
+    def _expire(self, now: float) -> int:
+        """
+        Same deadline heap as PlayerHandler, kept by the one process that runs the
+        cleaner. Other workers refresh last_update without telling it, so a due slot
+        is re-read and pushed back with its real deadline. Slots that aren't alive
+        are looked at again a timeout later, in case register() reused them.
+        """
+        used = self._header()[4]
+        if used < self._watched: # load() started over
+            self._expiry, self._watched = [], 0
+        for slot in range(self._watched, used):
+            heapq.heappush(self._expiry, (self._read(slot)[7] + self.timeout, slot))
+        self._watched = used
+
+        expired = 0
+        while self._expiry and self._expiry[0][0] <= now:
+            _, slot = heapq.heappop(self._expiry)
+            rec = self._read(slot)
+            if rec[6] & FLAG_ALIVE and rec[7] + self.timeout <= now:
+                with self._lock:
+                    rec = self._read(slot) # may have been refreshed meanwhile
+                    if rec[6] & FLAG_ALIVE and rec[7] + self.timeout <= now:
+                        version = self._header()[1] + 1
+                        self._write(slot, *rec[1:6], rec[6] & ~FLAG_ALIVE, rec[7], version, rec[9])
+                        self._set_header(version=version)
+                        expired += 1
+                        rec = self._read(slot)
+            if rec[6] & FLAG_ALIVE:
+                heapq.heappush(self._expiry, (rec[7] + self.timeout, slot))
+            else:
+                heapq.heappush(self._expiry, (now + self.timeout, slot))
+        return expired
+
+    # Records
+    @staticmethod
+    def _offset(slot: int) -> int:
+        return RECORDS_OFFSET + slot * RECORD.size
+
+    def _read(self, slot: int) -> tuple:
+        off = self._offset(slot)
+        while True:
+            rec = RECORD.unpack_from(self._buf, off)
+            if not rec[0] & 1 and SEQ.unpack_from(self._buf, off)[0] == rec[0]:
+                return rec
+            time.sleep(0) # writer is mid-record, let it finish
+
+    def _peek(self, slot: int) -> tuple:
+        """ (id, x, y, map, direction, flags, last_update, version) without the seqlock, may be torn. Filter with it, then _read() """
+        return PEEK.unpack_from(self._buf, self._offset(slot))
+
+    def _peek_all(self):
+        """ (slot, _peek(slot)) of every used slot, one at a time straight from the shared block """
+        end = RECORDS_OFFSET + self._header()[4] * RECORD.size
+        return enumerate(PEEK.iter_unpack(self._buf[RECORDS_OFFSET:end]))
+
+    def _write(self, slot: int, pid: int, x: float, y: float, map_idx: int, direction: int,
+               flags: int, last_update: float, version: int, token: bytes) -> None:
+        """ Call with _lock held """
+        off = self._offset(slot)
+        seq = SEQ.unpack_from(self._buf, off)[0]
+        SEQ.pack_into(self._buf, off, (seq + 1) & 0xFFFFFFFF)
+        RECORD.pack_into(self._buf, off, (seq + 1) & 0xFFFFFFFF, pid, x, y, map_idx, direction, flags, last_update, version, token)
+        SEQ.pack_into(self._buf, off, (seq + 2) & 0xFFFFFFFF)
+
+    def _header(self) -> tuple[int, int, int, int, int]:
+        return HEADER.unpack_from(self._buf, 0)
+
+    def _set_header(self, **fields) -> None:
+        """ Call with _lock held, after the records it covers are written """
+        next_id, version, floor, n_maps, used = self._header()
+        HEADER.pack_into(
+            self._buf, 0,
+            fields.get("next_id", next_id), fields.get("version", version),
+            fields.get("floor", floor), fields.get("n_maps", n_maps), fields.get("used", used),
+        )
+
+    def _scan(self) -> list[tuple]:
+        return [self._read(slot) for slot in range(self._header()[4])]
+
+    def _slot_of(self, pid: int) -> Optional[int]:
+        slot = self._slots.get(pid)
+        if slot is None: # registered by another worker
+            slot = self._index_lookup(pid)
+            if slot is None:
+                return None
+        rec = self._read(slot)
+        if rec[1] == pid and rec[6] & FLAG_ALIVE:
+            self._slots[pid] = slot
+            return slot
+        self._slots.pop(pid, None)
+        return None
+
+    # pid index
+    def _entry_offset(self, i: int) -> int:
+        return self._index_offset + SEQ.size + i * INDEX_ENTRY.size
+
+    def _index_lookup(self, pid: int) -> Optional[int]:
+        while True:
+            seq = SEQ.unpack_from(self._buf, self._index_offset)[0]
+            if seq & 1:
+                time.sleep(0) # being rebuilt
+                continue
+            slot = None
+            i = pid & self._index_mask
+            while True:
+                key, value = INDEX_ENTRY.unpack_from(self._buf, self._entry_offset(i))
+                if key == FREE:
+                    break
+                if key == pid:
+                    slot = value
+                    break
+                i = (i + 1) & self._index_mask
+            if SEQ.unpack_from(self._buf, self._index_offset)[0] == seq:
+                return slot
+
+    def _clear_index(self) -> None:
+        for i in range(self._index_mask + 1):
+            INDEX_ENTRY.pack_into(self._buf, self._entry_offset(i), FREE, 0)
+
+    def _rebuild_index(self) -> None:
+        """ Call with _lock held, after the records are written """
+        seq = SEQ.unpack_from(self._buf, self._index_offset)[0]
+        SEQ.pack_into(self._buf, self._index_offset, (seq + 1) & 0xFFFFFFFF)
+        self._clear_index()
+        for slot in range(self._header()[4]):
+            pid = self._peek(slot)[0] # the writer, nothing is mid-write
+            if pid == FREE:
+                continue
+            i = pid & self._index_mask
+            while INDEX_ENTRY.unpack_from(self._buf, self._entry_offset(i))[0] != FREE:
+                i = (i + 1) & self._index_mask
+            INDEX_ENTRY.pack_into(self._buf, self._entry_offset(i), pid, slot)
+        SEQ.pack_into(self._buf, self._index_offset, (seq + 2) & 0xFFFFFFFF)
+
+    # Map names
+    def _load_maps(self) -> None:
+        n = self._header()[3]
+        names = [MAP_NAME.unpack_from(self._buf, HEADER.size + i * MAP_NAME.size)[0].decode("utf-8") for i in range(n)]
+        self._map_names = names
+        self._map_index = {name: i for i, name in enumerate(names)}
+
+    def _map_name(self, idx: int) -> str:
+        if idx >= len(self._map_names):
+            self._load_maps()
+        return self._map_names[idx]
+
+    def _map_id(self, name: str) -> int:
+        idx = self._map_index.get(name)
+        if idx is not None:
+            return idx
+        with self._lock:
+            self._load_maps()
+            if name in self._map_index:
+                return self._map_index[name]
+            raw = name.encode("utf-8")
+            n = len(self._map_names)
+            if n == MAX_MAPS or len(raw) > MAP_NAME.size - 1:
+                raise ValueError(f"can't intern map name {name!r}")
+            MAP_NAME.pack_into(self._buf, HEADER.size + n * MAP_NAME.size, raw)
+            self._set_header(n_maps=n + 1)
+            self._load_maps()
+            return n
+
+    def _to_dict(self, rec: tuple) -> dict:
+        return {
+            "id": rec[1],
+            "x": rec[2],
+            "y": rec[3],
+            "map": self._map_name(rec[4]),
+            "direction": DIRECTIONS[rec[5] & 0x03],
+            "is_moving": bool(rec[6] & FLAG_MOVING),
+        }
+
+    # API
+    def _resumable(self, rec: tuple, now: float) -> bool:
+        # removed by the cleaner at last_update + timeout at the earliest
+        return rec[1] != FREE and rec[7] + self.timeout + SESSION_GRACE_TIME > now
+
+    def register(self, token: Optional[str] = None) -> tuple[int, str]:
+        """ Same as PlayerHandler.register. Raises RuntimeError when every slot holds a live player """
+        raw_token = token.encode("utf-8")[:16] if token else b""
+        now = time.monotonic()
+        with self._lock:
+            next_id, version, floor, _, used = self._header()
+            if raw_token:
+                for slot, rec in enumerate(self._scan()):
+                    if rec[1] == FREE or rec[9].rstrip(b"\0") != raw_token:
+                        continue
+                    if rec[6] & FLAG_ALIVE or self._resumable(rec, now):
+                        version += 1
+                        self._write(slot, *rec[1:6], rec[6] | FLAG_ALIVE, now, version, rec[9])
+                        self._set_header(version=version)
+                        self._slots[rec[1]] = slot
+                        return rec[1], token
+                    break
+
+            slot, fallback = None, None
+            for i, rec in enumerate(self._scan()):
+                if rec[6] & FLAG_ALIVE:
+                    continue
+                if not self._resumable(rec, now): # lowest free slot keeps `used` small
+                    slot = i
+                    break
+                if fallback is None:
+                    fallback = i
+            if slot is None and used < self.capacity:
+                slot = used
+                used += 1
+            if slot is None:
+                slot = fallback # full, give up on a resumable player
+            if slot is None:
+                raise RuntimeError("player table is full")
+
+            old = self._read(slot)
+            if old[1] != FREE: # overwriting a tombstone, deltas older than it can't be served anymore
+                floor = max(floor, old[8])
+            version += 1
+            token = secrets.token_hex(8)
+            self._write(slot, next_id, 0.0, 0.0, 0, 0, FLAG_ALIVE, now, version, token.encode("ascii"))
+            self._set_header(next_id=next_id + 1, version=version, floor=floor, used=used)
+            self._rebuild_index() # register is rare, simpler than deleting the tombstone's entry
+        self._slots[next_id] = slot
+        return next_id, token
+
+    def update(self, pid: int, x: float, y: float, map_name: str, direction = "down", is_moving = False) -> bool:
+        slot = self._slot_of(pid)
+        if slot is None:
+            return False
+        x, y = float(x), float(y)
+        map_idx = self._map_id(str(map_name))
+        d = _DIRECTION_INDEX.get(direction, 0)
+        flags = FLAG_ALIVE | (FLAG_MOVING if is_moving else 0)
+        with self._lock:
+            rec = self._read(slot)
+            if rec[1] != pid or not rec[6] & FLAG_ALIVE: # expired since _slot_of
+                return False
+            version = rec[8]
+            changed = (x, y, map_idx, d, flags) != rec[2:7]
+            if changed:
+                version = self._header()[1] + 1
+            self._write(slot, pid, x, y, map_idx, d, flags, time.monotonic(), version, rec[9])
+            if changed:
+                self._set_header(version=version)
+        return True
+
+    def exists(self, pid: int) -> bool:
+        return self._slot_of(pid) is not None
+
+    def token_of(self, pid: int) -> Optional[str]:
+        slot = self._slot_of(pid)
+        if slot is None:
+            return None
+        rec = self._read(slot)
+        return rec[9].rstrip(b"\0").decode("utf-8", errors="ignore") if rec[1] == pid else None
+
+    def heartbeat(self, pid: int) -> bool:
+        slot = self._slot_of(pid)
+        if slot is None:
+            return False
+        with self._lock:
+            rec = self._read(slot)
+            if rec[1] != pid or not rec[6] & FLAG_ALIVE:
+                return False
+            self._write(slot, *rec[1:7], time.monotonic(), rec[8], rec[9])
+        return True
+
+    def players_per_map(self) -> dict[str, int]:
+        counts: dict[str, int] = {}
+        for rec in self._scan():
+            if rec[6] & FLAG_ALIVE:
+                name = self._map_name(rec[4])
+                counts[name] = counts.get(name, 0) + 1
+        return counts
+
+    @property
+    def version(self) -> int:
+        return self._header()[1]
+
+    # Persistence, same format as PlayerHandler.dump/load
+    def dump(self) -> dict:
+        next_id, version, _, _, _ = self._header()
+        players = [
+            {**self._to_dict(rec), "version": rec[8], "token": rec[9].rstrip(b"\0").decode("utf-8", errors="ignore")}
+            for rec in self._scan() if rec[6] & FLAG_ALIVE
+        ]
+        return {"next_id": next_id, "version": version, "players": players}
+
+    def load(self, state: dict, *, restore_players: bool = True, version_gap: bool = True) -> None:
+        """ Parent only, before the workers are forked """
+        players = state["players"] if restore_players else []
+        if len(players) > self.capacity:
+            raise ValueError(f"{len(players)} players don't fit in {self.capacity} slots")
+        version = int(state["version"]) + (RESTORE_VERSION_GAP if version_gap else 0)
+        next_id = int(state["next_id"])
+        now = time.monotonic()
+        with self._lock:
+            for slot in range(self._header()[4]):
+                self._write(slot, FREE, 0.0, 0.0, 0, 0, 0, 0.0, 0, b"")
+            self._set_header(used=0)
+        self._slots.clear()
+        self._views.clear()
+        for slot, d in enumerate(players):
+            map_idx = self._map_id(str(d["map"]))
+            flags = FLAG_ALIVE | (FLAG_MOVING if d.get("is_moving") else 0)
+            with self._lock:
+                self._write(slot, int(d["id"]), float(d["x"]), float(d["y"]), map_idx,
+                            _DIRECTION_INDEX.get(d.get("direction"), 0), flags, now, version,
+                            (d.get("token") or secrets.token_hex(8)).encode("utf-8")[:16])
+            next_id = max(next_id, int(d["id"]) + 1)
+        with self._lock:
+            self._set_header(next_id=next_id, version=version, floor=version, used=len(players))
+            self._rebuild_index()
+
+    def snapshot(self) -> PlayerSnapshot:
+        """ Same as PlayerHandler.snapshot, cached per worker """
+        snap = self._snapshot
+        version = self.version
+        if snap.version == version or time.monotonic() - snap.built_at < SNAPSHOT_INTERVAL:
+            return snap
+        if not self._snapshot_lock.acquire(blocking=False):
+            return snap
+        try:
+            version = self.version # read before the scan, so the snapshot is never newer than it claims
+            players = self.list_players()
+            if version != self._snapshot.version:
+                self._snapshot = PlayerSnapshot.build(version, players)
+            return self._snapshot
+        finally:
+            self._snapshot_lock.release()
+
+    def list_players(self) -> dict:
+        return {rec[1]: self._to_dict(rec) for rec in self._scan() if rec[6] & FLAG_ALIVE}
+
+    def list_players_since(self, since: int) -> dict:
+        _, version, floor, _, _ = self._header()
+        if since < floor or since > version:
+            return {"version": version, "full": True, "players": self.list_players(), "removed": [], "time": time.time()}
+
+        changed = {}
+        removed = []
+        for slot, peek in self._peek_all():
+            if peek[7] <= since: # versions only go up, a torn one is still > since if it's changing
+                continue
+            rec = self._read(slot)
+            if rec[8] <= since or rec[1] == FREE:
+                continue
+            if rec[6] & FLAG_ALIVE:
+                changed[rec[1]] = self._to_dict(rec)
+            else:
+                removed.append(rec[1])
+        return {"version": version, "full": False, "players": changed, "removed": removed, "time": time.time()}
+
+    def is_current(self, since: int, pid: Optional[int] = None) -> bool:
+        if since != self.version:
+            return False
+        if pid is None:
+            return True
+        slot = self._slot_of(pid)
+        if slot is None or self._views.get(pid, (-1,))[0] != since: # views are per worker
+            return False
+        if time.monotonic() - self._read(slot)[7] > CONTACT_INTERVAL:
+            self.heartbeat(pid)
+        return True
+
+    def list_players_near(self, pid: int, radius_tiles: float, since: int) -> Optional[dict]:
+        slot = self._slot_of(pid)
+        if slot is None:
+            self._views.pop(pid, None)
+            return None
+        version = self.version
+        me = self._read(slot)
+        if me[1] != pid or not me[6] & FLAG_ALIVE:
+            return None
+        if time.monotonic() - me[7] > CONTACT_INTERVAL: # polling counts as contact
+            self.heartbeat(pid)
+
+        radius = radius_tiles * TILE_SIZE
+        r2 = radius * radius
+        map_idx, mx, my = me[4], me[2], me[3]
+        served, seen = self._views.get(pid, (-1, frozenset()))
+        full = since < 0 or since != served
+
+        # filter in place, only the players that get sent are read (consistently) and turned into dicts
+        visible = set()
+        changed = {}
+        for slot, (q, x, y, m, _, flags, _, v) in self._peek_all():
+            if not flags & FLAG_ALIVE or q == pid or m != map_idx:
+                continue
+            if radius > 0 and (x - mx) ** 2 + (y - my) ** 2 > r2:
+                continue
+            visible.add(q)
+            if full or q not in seen or v > since:
+                rec = self._read(slot)
+                if rec[1] == q and rec[6] & FLAG_ALIVE:
+                    changed[q] = self._to_dict(rec)
+        removed = [] if full else list(seen - visible)
+
+        self._views[pid] = (version, frozenset(visible))
+        return {"version": version, "full": full, "players": changed, "removed": removed, "time": time.time()}
+
+
+class SharedChatHandler:
+    """
+    ChatHandler API on a shared ring, so a message posted to one worker
+    wakes long-polls waiting in the others. Chat is rare, everything locks.
+    """
+    def __init__(self, *, max_messages: int = MAX_MESSAGES):
+        self.max_messages = max_messages
+        self._shm = shared_memory.SharedMemory(create=True, size=CHAT_HEADER.size + max_messages * CHAT_RECORD.size)
+        self._buf = self._shm.buf
+        self._cond = _CTX.Condition()
+        CHAT_HEADER.pack_into(self._buf, 0, 1)
+
+    def close(self) -> None:
+        self._shm.close()
+        self._shm.unlink()
+
+    def _next_id(self) -> int:
+        return CHAT_HEADER.unpack_from(self._buf, 0)[0]
+
+    @property
+    def last_id(self) -> int:
+        with self._cond:
+            return self._next_id() - 1
+
+    def post(self, pid: int, text: str) -> dict:
+        raw = text.encode("utf-8")[:CHAT_TEXT_SIZE]
+        with self._cond:
+            msg_id = self._next_id()
+            off = CHAT_HEADER.size + (msg_id % self.max_messages) * CHAT_RECORD.size
+            CHAT_RECORD.pack_into(self._buf, off, msg_id, pid, len(raw), raw)
+            CHAT_HEADER.pack_into(self._buf, 0, msg_id + 1)
+            self._cond.notify_all()
+        return {"id": msg_id, "from": pid, "text": raw.decode("utf-8", errors="ignore")}
+
+    def list_messages(self, after: int = 0) -> list[dict]:
+        with self._cond:
+            return self._after(after)
+
+    def wait_messages(self, after: int, timeout: float) -> list[dict]:
+        timeout = min(max(timeout, 0.0), MAX_WAIT_TIME)
+        with self._cond:
+            self._cond.wait_for(lambda: self._next_id() - 1 > after or after >= self._next_id(), timeout)
+            return self._after(after)
+
+    def dump(self) -> dict:
+        with self._cond:
+            return {"next_id": self._next_id(), "messages": self._after(0)}
+
+    def load(self, state: dict) -> None:
+        with self._cond:
+            for msg in state["messages"][-self.max_messages:]:
+                raw = str(msg["text"]).encode("utf-8")[:CHAT_TEXT_SIZE]
+                off = CHAT_HEADER.size + (int(msg["id"]) % self.max_messages) * CHAT_RECORD.size
+                CHAT_RECORD.pack_into(self._buf, off, int(msg["id"]), int(msg["from"]), len(raw), raw)
+            CHAT_HEADER.pack_into(self._buf, 0, int(state["next_id"]))
+            self._cond.notify_all()
+
+    def _after(self, after: int) -> list[dict]:
+        next_id = self._next_id()
+        if after >= next_id:
+            after = 0
+        messages = []
+        for msg_id in range(max(after + 1, next_id - self.max_messages, 1), next_id):
+            off = CHAT_HEADER.size + (msg_id % self.max_messages) * CHAT_RECORD.size
+            _, pid, length, raw = CHAT_RECORD.unpack_from(self._buf, off)
+            messages.append({"id": msg_id, "from": pid, "text": raw[:length].decode("utf-8", errors="ignore")})
+        return messages
+
+
+class SharedRateLimiter:
+    """
+    RateLimiter API with the buckets in shared memory. Keep-alive connections stick
+    to whichever worker accepted them, so per worker buckets would hand a client
+    N times the limits. Every check locks, it's a few struct reads.
+    """
+    def __init__(self, limits: dict[str, tuple[float, float]] = LIMITS, *, capacity: int = MAX_PLAYERS):
+        self.limits = limits
+        self._kinds = {kind: i for i, kind in enumerate(limits)}
+        self._mask = (1 << (2 * capacity * len(limits) - 1).bit_length()) - 1
+        self._shm = shared_memory.SharedMemory(create=True, size=BUCKETS_HEADER.size + (self._mask + 1) * BUCKET.size)
+        self._buf = self._shm.buf
+        self._lock = _CTX.Lock()
+        BUCKETS_HEADER.pack_into(self._buf, 0, time.monotonic(), 0)
+        self._clear()
+
+    def close(self) -> None:
+        self._shm.close()
+        self._shm.unlink()
+
+    def check(self, key, kind: str, cost: float = 1.0) -> float:
+        """ Same as RateLimiter.check. Keys are hashed, which for player ids is the id """
+        now = time.monotonic()
+        key_hash = hash(key)
+        rate, burst = self.limits[kind]
+        with self._lock:
+            pruned_at, used = BUCKETS_HEADER.unpack_from(self._buf, 0)
+            if now - pruned_at > PRUNE_INTERVAL or 2 * used > self._mask:
+                used = self._prune(now)
+            i = self._find(key_hash, self._kinds[kind])
+            off = self._bucket_offset(i)
+            _, found, tokens, stamp = BUCKET.unpack_from(self._buf, off)
+            bucket = TokenBucket(rate, burst, now)
+            if found != FREE:
+                bucket.tokens, bucket.stamp = tokens, stamp
+            elif 2 * used > self._mask:
+                return 0.0 # still full of active clients after pruning, don't track new ones
+            else:
+                BUCKETS_HEADER.pack_into(self._buf, 0, BUCKETS_HEADER.unpack_from(self._buf, 0)[0], used + 1)
+            retry_after = bucket.take(now, cost)
+            BUCKET.pack_into(self._buf, off, key_hash, self._kinds[kind], bucket.tokens, bucket.stamp)
+        if retry_after > 0:
+            LIMITED.inc((kind,))
+        return retry_after
+
+    def _bucket_offset(self, i: int) -> int:
+        return BUCKETS_HEADER.size + i * BUCKET.size
+
+    def _find(self, key_hash: int, kind: int) -> int:
+        """ Call with _lock held. Index of the bucket, or of the empty entry it would go in """
+        i = (key_hash * len(self._kinds) + kind) & self._mask
+        while True:
+            key, found = BUCKET.unpack_from(self._buf, self._bucket_offset(i))[:2]
+            if found == FREE or (key == key_hash and found == kind):
+                return i
+            i = (i + 1) & self._mask
+
+    def _clear(self) -> None:
+        for i in range(self._mask + 1):
+            BUCKET.pack_into(self._buf, self._bucket_offset(i), 0, FREE, 0.0, 0.0)
+
+    def _prune(self, now: float) -> int:
+        """ Call with _lock held. Drops idle buckets and returns how many are left """
+        keep = [b for b in BUCKET.iter_unpack(self._buf[BUCKETS_HEADER.size:]) if b[1] != FREE and now - b[3] < IDLE_TIME]
+        self._clear()
+        for key, kind, tokens, stamp in keep:
+            BUCKET.pack_into(self._buf, self._bucket_offset(self._find(key, kind)), key, kind, tokens, stamp)
+        BUCKETS_HEADER.pack_into(self._buf, 0, now, len(keep))
+        return len(keep)
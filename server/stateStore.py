@@ -0,0 +1,98 @@
+import json
+import os
+import tempfile
+import threading
+import time
+
+from server.metrics import REGISTRY
+
+"""
+Periodic snapshot of the server state (players, next id, chat ring) to one JSON file
+
+    {"format": 1, "saved_at": <unix time>, "players": PlayerHandler.dump(), "chat": ChatHandler.dump()}
+
+Written to a temp file in the same directory and os.replace()d over the old one,
+so a crash mid-write leaves the previous snapshot intact. On start the server
+loads it and clients carry on with the ids they already have.
+"""
+
+STATE_FORMAT = 1
+SAVE_INTERVAL = 5.0 # seconds, what a crash can lose
+
+SAVE_TIME = REGISTRY.histogram("state_save_seconds", "Time to write one state snapshot")
+
+
+class StateStore:
+    def __init__(self, path: str, player_handler, chat_handler, *, interval: float = SAVE_INTERVAL):
+        self.path = path
+        self.players = player_handler
+        self.chat = chat_handler
+        self.interval = interval
+        self._stop_event = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def save(self) -> None:
+        t0 = time.perf_counter()
+        state = {
+            "format": STATE_FORMAT,
+            "saved_at": time.time(),
+            "players": self.players.dump(),
+            "chat": self.chat.dump(),
+        }
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(prefix=".state-", suffix=".tmp", dir=directory)
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(state, f, separators=(",", ":"))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        SAVE_TIME.observe((), time.perf_counter() - t0)
+
+    def load(self) -> bool:
+        """
+        Warm start from the last snapshot. False if there is none (or it's unreadable).
+        Players are only restored if the snapshot is younger than their timeout,
+        otherwise they'd all have expired anyway; ids and chat are always kept.
+        """
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+            if state.get("format") != STATE_FORMAT:
+                print(f"[Server] Ignoring {self.path}: unknown format {state.get('format')!r}")
+                return False
+            fresh = time.time() - float(state["saved_at"]) < self.players.timeout
+            self.players.load(state["players"], restore_players=fresh)
+            self.chat.load(state["chat"])
+        except FileNotFoundError:
+            return False
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"[Server] Ignoring {self.path}: {e}")
+            return False
+        return True
+
+    # Threading
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._loop, name="StateStore", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """ Stops the saver and writes one last snapshot """
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=2.0)
+        self.save()
+
+    def _loop(self) -> None:
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.save()
+            except OSError as e:
+                print(f"[Server] Saving state failed: {e}")
@@ -0,0 +1,176 @@
+import asyncio
+import socket
+from dataclasses import dataclass, field
+
+from server.playerHandler import PlayerHandler, interest_radius
+from server.chatHandler import ChatHandler
+from server.protocol import encode_frame, frame, encode_snapshot, read_frame, ProtocolError
+from server.rateLimiter import RateLimiter
+
+TICK_RATE = 30.0                  # snapshots per second
+MAX_WRITE_BUFFER = 64 * 1024      # skip a tick for clients that can't keep up
+DEFAULT_INTEREST_RADIUS = 0       # tiles, 0 = whole map
+
+
+@dataclass(eq=False)
+class Connection:
+    writer: asyncio.StreamWriter
+    pid: int = -1
+    radius: float = DEFAULT_INTEREST_RADIUS
+    version: int = -1             # last snapshot version sent, -1 = needs a full one
+    binary: bool = False          # negotiated in hello
+    chat_after: int = 0           # last chat id pushed
+    peer: tuple = field(default_factory=tuple)
+    serial: int = 0               # tells connections apart in a recording
+    token: str = ""
+
+
+class StreamServer:
+    """
+    Persistent TCP alternative to polling GET/POST /players.
+    One asyncio task per client reads updates, one ticker broadcasts snapshots.
+    Shares the PlayerHandler and ChatHandler with the HTTP server so both kinds of client see each other.
+    """
+    def __init__(self, player_handler: PlayerHandler, chat_handler: ChatHandler, rate_limiter: RateLimiter | None = None,
+                 *, tick_rate: float = TICK_RATE, recorder=None):
+        self.players = player_handler
+        self.chat = chat_handler
+        self.limiter = rate_limiter # same budgets as HTTP, over the limit is dropped since there's no 429 to send
+        self.tick_interval = 1.0 / tick_rate
+        self.recorder = recorder
+        self.connections: set[Connection] = set()
+        self._next_serial = 0
+
+    async def serve(self, host: str, port: int) -> None:
+        server = await asyncio.start_server(self._handle_client, host, port)
+        ticker = asyncio.create_task(self._broadcast_loop())
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            ticker.cancel()
+
+    async def _handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        sock = writer.get_extra_info("socket")
+        if sock is not None:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        conn = Connection(writer, peer=writer.get_extra_info("peername") or (), serial=self._next_serial)
+        self._next_serial += 1
+
+        try:
+            while True:
+                msg = await read_frame(reader)
+                if msg is None:
+                    break
+                try:
+                    self._on_message(conn, msg)
+                finally:
+                    if self.recorder:
+                        hello = msg.get("type") == "hello" and conn.token
+                        self.recorder.record_stream(conn.serial, msg, f"{conn.pid} {conn.token}" if hello else "")
+        except (ProtocolError, ConnectionError) as e:
+            print(f"[Stream] {conn.peer} dropped: {e}")
+        except Exception as e: # our bug, not the client's, still only costs this connection
+            print(f"[Stream] {conn.peer} dropped on a server error: {e!r}")
+        finally:
+            if self.recorder:
+                self.recorder.record_stream(conn.serial, None)
+            self.connections.discard(conn)
+            writer.close()
+            # The player itself stays until the cleaner times it out, a quick reconnect can resume it
+
+    def _on_message(self, conn: Connection, msg: dict) -> None:
+        kind = msg.get("type")
+        if kind == "hello":
+            try:
+                radius = interest_radius(msg.get("radius", DEFAULT_INTEREST_RADIUS))
+                chat_after = int(msg.get("chat_after", self.chat.last_id))
+            except (TypeError, ValueError):
+                raise ProtocolError("invalid hello")
+            token = msg.get("token")
+            if token is not None and not isinstance(token, str):
+                raise ProtocolError("invalid hello token")
+            # only the token resumes a player, an id alone would let anyone take over anyone
+            pid, token = self.players.register(token)
+            conn.pid = int(pid)
+            conn.token = token or ""
+            conn.radius = radius
+            conn.version = -1
+            conn.binary = msg.get("encoding") == "binary"
+            conn.chat_after = chat_after
+            self.connections.add(conn)
+            welcome = {"type": "welcome", "id": conn.pid, "token": token, "encoding": "binary" if conn.binary else "json"}
+            conn.writer.write(encode_frame(welcome))
+            return
+
+        if conn.pid == -1:
+            raise ProtocolError("expected hello first")
+
+        if kind == "update":
+            if self._limited(conn, "update"):
+                return
+            try:
+                self.players.update(
+                    conn.pid,
+                    msg["x"],
+                    msg["y"],
+                    msg["map"],
+                    msg.get("direction", "down"),
+                    msg.get("is_moving", False)
+                )
+            except (KeyError, TypeError, ValueError):
+                raise ProtocolError("invalid update")
+            return
+
+        if kind == "chat":
+            text = str(msg.get("text", "")).strip()
+            if text and not self._limited(conn, "chat"):
+                self.chat.post(conn.pid, text)
+            return
+
+        raise ProtocolError(f"unknown message type {kind!r}")
+
+    def _limited(self, conn: Connection, kind: str) -> bool:
+        return self.limiter is not None and self.limiter.check(conn.pid, kind) > 0
+
+    async def _broadcast_loop(self) -> None:
+        loop = asyncio.get_running_loop()
+        next_tick = loop.time()
+        while True:
+            next_tick += self.tick_interval
+            self._broadcast()
+            await asyncio.sleep(max(0.0, next_tick - loop.time()))
+
+    def _broadcast(self) -> None:
+        for conn in list(self.connections):
+            try:
+                self._broadcast_to(conn)
+            except Exception as e: # one bad connection must not stop the ticker for everyone
+                print(f"[Stream] {conn.peer} dropped on a server error: {e!r}")
+                self.connections.discard(conn)
+                conn.writer.close()
+
+    def _broadcast_to(self, conn: Connection) -> None:
+        if conn.writer.is_closing():
+            self.connections.discard(conn)
+            return
+        if conn.writer.transport.get_write_buffer_size() > MAX_WRITE_BUFFER:
+            conn.version = -1 # it missed deltas, resend everything once it drains
+            return
+
+        data = self.players.list_players_near(conn.pid, conn.radius, conn.version)
+        if data is None: # timed out under us
+            self.connections.discard(conn)
+            conn.writer.close()
+            return
+        if data["full"] or data["players"] or data["removed"]:
+            if conn.binary:
+                conn.writer.write(frame(encode_snapshot(data)))
+            else:
+                conn.writer.write(encode_frame({"type": "snapshot", **data}))
+        conn.version = data["version"]
+
+        messages = self.chat.list_messages(conn.chat_after)
+        if messages:
+            conn.writer.write(encode_frame({"type": "chat", "messages": messages}))
+            conn.chat_after = messages[-1]["id"]
@@ -0,0 +1,123 @@
+import hashlib
+import socket
+import struct
+import threading
+import time
+from functools import lru_cache
+
+from server.playerHandler import PlayerHandler
+from server.protocol import ProtocolError, decode_update
+from server.metrics import REGISTRY
+from server.rateLimiter import RateLimiter
+
+"""
+Optional UDP channel for position updates (latest value wins, no retransmits)
+
+datagram: u8 MSG_UDP_UPDATE, u32 key, u16 session, u32 seq, then a binary update (protocol.encode_update)
+
+`key` is udp_key() of the session token the player got from /register (or the
+stream welcome), datagrams for a pid with any other key are dropped, so knowing
+an id isn't enough to move someone. `session` is random per client run, `seq`
+counts up per datagram. Anything not newer than the last seq seen for (pid, session)
+is stale and dropped, so a late datagram can never move a player backwards.
+Registration and chat stay on HTTP.
+"""
+
+MSG_UDP_UPDATE = 0x03
+UDP_HEADER = struct.Struct("!BIHI")
+MAX_DATAGRAM = 1024
+PRUNE_INTERVAL = 10.0 # seconds between dropping the seq state of players that are gone
+
+DATAGRAMS = REGISTRY.counter("udp_datagrams_total", "UDP position datagrams", ("result",))
+
+
+@lru_cache(maxsize=4096)
+def udp_key(token: str) -> int:
+    """ Per-session datagram key, both sides derive it from the token so it never travels on its own """
+    return int.from_bytes(hashlib.sha256(b"udp:" + token.encode("utf-8")).digest()[:4], "big")
+
+
+def encode_datagram(key: int, session: int, seq: int, update: bytes) -> bytes:
+    return UDP_HEADER.pack(MSG_UDP_UPDATE, key & 0xFFFFFFFF, session & 0xFFFF, seq & 0xFFFFFFFF) + update
+
+
+def is_newer(seq: int, last: int) -> bool:
+    """ Serial number comparison, survives the u32 wrapping around """
+    return 0 < (seq - last) & 0xFFFFFFFF < 0x80000000
+
+
+class UdpServer:
+    def __init__(self, player_handler: PlayerHandler, rate_limiter: RateLimiter | None = None, recorder=None):
+        self.players = player_handler
+        self.limiter = rate_limiter # shares the "update" budget with HTTP, no way to tell the client though
+        self.recorder = recorder
+        self._last_seq: dict[int, tuple[int, int]] = {} # pid -> (session, seq)
+        self._pruned_at = time.monotonic()
+        self._sock: socket.socket | None = None
+        self._thread: threading.Thread | None = None
+        self._stop_event = threading.Event()
+
+    def start(self, host: str, port: int) -> None:
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._sock.bind((host, port))
+        self._sock.settimeout(0.5) # so stop() is noticed
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._loop, name="UdpServer", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=2.0)
+        if self._sock:
+            self._sock.close()
+
+    def _loop(self) -> None:
+        while not self._stop_event.is_set():
+            if time.monotonic() - self._pruned_at > PRUNE_INTERVAL:
+                self.prune()
+            try:
+                data, _ = self._sock.recvfrom(MAX_DATAGRAM)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            if self.recorder:
+                self.recorder.record_udp(data)
+            DATAGRAMS.inc((self.handle_datagram(data),))
+
+    def handle_datagram(self, data: bytes) -> str:
+        """ Apply one datagram, returns what happened to it (for metrics) """
+        try:
+            kind, key, session, seq = UDP_HEADER.unpack_from(data)
+            if kind != MSG_UDP_UPDATE:
+                return "invalid"
+            update = decode_update(data[UDP_HEADER.size:])
+        except (struct.error, IndexError, UnicodeDecodeError, ProtocolError):
+            return "invalid"
+
+        pid = update["id"]
+        token = self.players.token_of(pid)
+        if token is None:
+            self._last_seq.pop(pid, None)
+            return "unknown" # client finds out through its HTTP poll and re-registers
+        if key != udp_key(token):
+            return "forged"
+        last = self._last_seq.get(pid)
+        if last is not None and last[0] == session and not is_newer(seq, last[1]):
+            return "stale"
+        if self.limiter and self.limiter.check(pid, "update") > 0:
+            return "limited"
+
+        found = self.players.update(pid, update["x"], update["y"], update["map"], update["direction"], update["is_moving"])
+        if not found:
+            self._last_seq.pop(pid, None)
+            return "unknown" # client finds out through its HTTP poll and re-registers
+        self._last_seq[pid] = (session, seq)
+        return "accepted"
+
+    def prune(self) -> None:
+        """ Forget the seq state of players that expired since, it only shrinks on failed updates otherwise """
+        self._pruned_at = time.monotonic()
+        for pid in [pid for pid in self._last_seq if not self.players.exists(pid)]:
+            del self._last_seq[pid]
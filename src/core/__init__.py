@@ -1 +1 @@
-from .managers import GameManager, OnlineManager, PokemonManager, AutoSaveManager, AchieveManager
\ No newline at end of file
+from .managers import GameManager, OnlineManager, AsyncOnlineManager, ProcessOnlineManager, PokemonManager, AutoSaveManager, AchieveManager
\ No newline at end of file
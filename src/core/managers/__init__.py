@@ -4,6 +4,8 @@ from .resource_manager import ResourceManager
 from .sound_manager import SoundManager
 from .game_manager import GameManager
 from .online_manager import OnlineManager
+from .async_online_manager import AsyncOnlineManager
+from .process_online_manager import ProcessOnlineManager
 from .pokemon_manager import PokemonManager
 from .autosave_manager import AutoSaveManager
 from .achivevement_manager import AchieveManager
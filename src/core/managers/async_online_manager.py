@@ -0,0 +1,385 @@
+import asyncio
+import http.client
+import io
+import json
+import queue
+import socket
+import threading
+import time
+from urllib.parse import urlencode, urlsplit
+
+from src.utils import Logger, GameSettings
+from server.protocol import ProtocolError, FrameReader, encode_frame, encode_update, BINARY_CONTENT_TYPE
+from .online_manager import OnlineManager, CHAT_WAIT_TIME, HEARTBEAT_INTERVAL
+
+"""
+asyncio backend for OnlineManager (GameSettings.ONLINE_BACKEND = "asyncio")
+
+One background thread runs one event loop instead of a thread (and a requests.Session)
+per job. Sending, polling /players and the chat long-poll are tasks on that loop and
+share a small pool of keep-alive connections. The sender sleeps until update() or
+send_chat() wakes it up, so an idle player only costs the poll and the heartbeat.
+Same API as OnlineManager, GameScene can't tell them apart.
+"""
+
+POOL_SIZE = 4 # sender + fetcher + chat long-poll, plus one spare
+IDEMPOTENT_METHODS = {"GET", "HEAD"} # safe to send again when a reused connection dies under them
+
+
+class Response:
+    """ The bits of requests.Response that OnlineManager looks at """
+    def __init__(self, status_code: int, headers: http.client.HTTPMessage, content: bytes):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class HttpPool:
+    """ Minimal HTTP/1.1 client on asyncio streams, keeps up to `size` connections open """
+    def __init__(self, base: str, size: int = POOL_SIZE):
+        parts = urlsplit(base)
+        self.host = parts.hostname or "localhost"
+        self.port = parts.port or 80
+        self._host_header = parts.netloc
+        self._idle: list[tuple[asyncio.StreamReader, asyncio.StreamWriter]] = []
+        self._slots = asyncio.Semaphore(size)
+
+    async def request(self, method: str, path: str, *, params: dict | None = None, json_body=None,
+                      data: bytes = b"", headers: dict | None = None, timeout: float = 1.0) -> Response:
+        if params:
+            path = f"{path}?{urlencode(params)}"
+        headers = dict(headers or {})
+        if json_body is not None:
+            data = json.dumps(json_body).encode("utf-8")
+            headers["Content-Type"] = "application/json"
+        lines = [f"{method} {path} HTTP/1.1", f"Host: {self._host_header}", f"Content-Length: {len(data)}"]
+        lines += [f"{k}: {v}" for k, v in headers.items()]
+        head = ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+        async with self._slots:
+            return await asyncio.wait_for(self._roundtrip(head + data, method in IDEMPOTENT_METHODS), timeout)
+
+    async def _roundtrip(self, payload: bytes, idempotent: bool) -> Response:
+        while True:
+            reused = bool(self._idle)
+            if reused:
+                reader, writer = self._idle.pop()
+                if reader.at_eof() or writer.is_closing(): # closed while idle, nothing was sent on it yet
+                    writer.close()
+                    continue
+            else:
+                reader, writer = await asyncio.open_connection(self.host, self.port)
+            try:
+                writer.write(payload)
+                await writer.drain()
+                resp, keep_alive = await self._read_response(reader)
+            except BaseException as e:
+                writer.close()
+                if reused and isinstance(e, (ConnectionError, asyncio.IncompleteReadError)):
+                    self.close() # server restarted or dropped idle connections, the others are dead too
+                    if idempotent: # a POST may have gone through before the connection died, don't send it twice
+                        continue
+                raise
+            if keep_alive:
+                self._idle.append((reader, writer))
+            else:
+                writer.close()
+            return resp
+
+    @staticmethod
+    async def _read_response(reader: asyncio.StreamReader) -> tuple[Response, bool]:
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionResetError("connection closed")
+        version, status, *_ = status_line.decode("latin-1").split(" ", 2)
+        status = int(status)
+
+        raw = []
+        while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+            raw.append(line)
+        headers = http.client.parse_headers(io.BytesIO(b"".join(raw) + b"\r\n"))
+        keep_alive = version == "HTTP/1.1" and headers.get("Connection", "").lower() != "close"
+
+        if status in (204, 304) or 100 <= status < 200: # never have a body
+            content = b""
+        elif headers.get("Content-Length") is not None:
+            content = await reader.readexactly(int(headers["Content-Length"]))
+        else: # body runs until the server closes
+            content = await reader.read()
+            keep_alive = False
+        return Response(status, headers, content), keep_alive
+
+    def close(self) -> None:
+        for _, writer in self._idle:
+            writer.close()
+        self._idle.clear()
+
+
+class AsyncOnlineManager(OnlineManager):
+    def __init__(self):
+        super().__init__()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._wake: asyncio.Event | None = None # set (thread safely) when there's something to send
+        self._stopping: asyncio.Event | None = None
+        self._pool: HttpPool | None = None
+        self._async_register_lock: asyncio.Lock | None = None
+
+    def _notify(self) -> None:
+        loop = self._loop
+        if loop is None:
+            return # not running yet, the sender looks at the pending update when it starts
+        try:
+            loop.call_soon_threadsafe(self._wake.set)
+        except RuntimeError: # loop already closed
+            pass
+
+    def start(self) -> None:
+        if any(t.is_alive() for t in self._threads):
+            return
+
+        self._stop_event.clear()
+
+        if GameSettings.ONLINE_UDP and GameSettings.ONLINE_TRANSPORT != "stream":
+            self._udp_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+        self._threads = [threading.Thread(target=lambda: asyncio.run(self._main()), name="OnlineManagerLoop", daemon=True)]
+        self._threads[0].start()
+
+    def stop(self) -> None:
+        super().stop()
+        loop = self._loop
+        if loop is not None:
+            try:
+                loop.call_soon_threadsafe(self._stopping.set)
+            except RuntimeError:
+                pass
+
+    async def _main(self) -> None:
+        self._wake = asyncio.Event()
+        self._stopping = asyncio.Event()
+        self._async_register_lock = asyncio.Lock()
+        self._pool = HttpPool(self.base)
+        self._loop = asyncio.get_running_loop()
+        if self._stop_event.is_set(): # stop() came before we had a loop to tell
+            return
+
+        if GameSettings.ONLINE_TRANSPORT == "stream":
+            jobs = [self._stream_task()]
+        elif GameSettings.ONLINE_TRANSPORT == "sync":
+            jobs = [self._sync_task()]
+        else:
+            jobs = [self._send_task(), self._fetch_task(), self._chat_task()]
+        tasks = [asyncio.create_task(job) for job in jobs]
+
+        await self._stopping.wait()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._loop = None
+        self._pool.close()
+
+    async def _wait_wake(self, timeout: float) -> bool:
+        """ True if woken up, False on timeout """
+        try:
+            await asyncio.wait_for(self._wake.wait(), max(0.0, timeout))
+            woken = True
+        except TimeoutError:
+            woken = False
+        self._wake.clear()
+        return woken
+
+    # ------------------------------------------------------------------
+    # Registration
+    # ------------------------------------------------------------------
+    async def _register(self) -> None:
+        try:
+            resp = await self._pool.request("GET", "/register", params=self._register_params(), timeout=5)
+            self._on_register(resp)
+        except Exception as e:
+            self._connection_failed(e)
+
+    async def _reregister_async(self, stale_id: int) -> None:
+        async with self._async_register_lock:
+            if self.player_id != stale_id:
+                return
+            Logger.warning("PlayerID not found (404). Resuming session...")
+            await self._register()
+
+    # ------------------------------------------------------------------
+    # HTTP transport
+    # ------------------------------------------------------------------
+    async def _send_task(self) -> None:
+        last_sent = time.monotonic()
+
+        while True:
+            if not self._has_outgoing():
+                deadline = last_sent + HEARTBEAT_INTERVAL
+                if self._chat_pending:
+                    deadline = min(deadline, self._chat_retry_at)
+                await self._wait_wake(deadline - time.monotonic())
+
+            with self._lock:
+                data = self._latest_update
+                self._latest_update = None
+            if data:
+                await self._send_update_async(data)
+                last_sent = time.monotonic()
+            elif time.monotonic() - last_sent >= HEARTBEAT_INTERVAL:
+                await self._send_heartbeat_async()
+                last_sent = time.monotonic()
+            await self._drain_chat()
+
+            await asyncio.sleep(self._send_delay()) # caps the send rate, stretched by 429s and errors
+
+    async def _send_update_async(self, update_data: dict) -> None:
+        pid = self.player_id
+        if pid == -1 or self._send_udp(update_data):
+            return
+        try:
+            binary = self._binary
+            if binary:
+                resp = await self._pool.request(
+                    "POST", "/players", data=encode_update(pid, update_data),
+                    headers={"Content-Type": BINARY_CONTENT_TYPE}
+                )
+            else:
+                resp = await self._pool.request("POST", "/players", json_body={"id": pid, **update_data})
+            if self._on_update(resp, update_data, binary):
+                await self._reregister_async(pid)
+        except Exception as e:
+            self._connection_failed(e)
+
+    async def _send_heartbeat_async(self) -> None:
+        pid = self.player_id
+        if pid == -1:
+            return
+        try:
+            resp = await self._pool.request("POST", "/heartbeat", json_body={"id": pid})
+            if not self._rate_limited("update", resp) and resp.status_code == 404:
+                await self._reregister_async(pid)
+        except Exception as e:
+            self._connection_failed(e)
+
+    async def _drain_chat(self) -> None:
+        if time.monotonic() < self._chat_retry_at or self.player_id == -1:
+            return
+        try:
+            while True:
+                text = self._chat_pending or self._chat_out_queue.get_nowait()
+                self._chat_pending = None
+                retry_after = 0.0
+                try:
+                    resp = await self._pool.request("POST", "/chat", json_body={"id": self.player_id, "text": text})
+                    self._connection_ok()
+                    if resp.status_code == 429:
+                        retry_after = self._retry_after(resp)
+                except Exception as e:
+                    self._connection_failed(e)
+                if retry_after > 0: # keep it and its place in line
+                    self._chat_pending = text
+                    self._chat_retry_at = time.monotonic() + retry_after
+                    break
+        except queue.Empty:
+            pass
+
+    async def _fetch_task(self) -> None:
+        if self.player_id == -1:
+            await self._register()
+
+        while True:
+            await asyncio.sleep(self._poll_delay())
+            pid = self.player_id
+            if pid == -1: # server was down when we started
+                await self._register()
+                continue
+            try:
+                params, headers = self._players_request()
+                resp = await self._pool.request("GET", "/players", params=params, headers=headers)
+                if self._on_players(resp):
+                    await self._reregister_async(pid)
+            except Exception as e:
+                self._connection_failed(e)
+
+    async def _chat_task(self) -> None:
+        while True:
+            headers = {"If-None-Match": self._chat_etag} if self._chat_etag else {}
+            params = {"after": self._last_chat_id, "wait": CHAT_WAIT_TIME}
+            try:
+                resp = await self._pool.request("GET", "/chat", params=params, headers=headers, timeout=CHAT_WAIT_TIME + 1.0)
+                ok = self._on_chat(resp)
+            except Exception as e:
+                self._connection_failed(e)
+                ok = False
+            if not ok:
+                await asyncio.sleep(self._backoff_delay()) # server down, don't spin
+
+    # ------------------------------------------------------------------
+    # Sync transport
+    # ------------------------------------------------------------------
+    async def _sync_task(self) -> None:
+        while True:
+            # Carries our update too, so don't sleep through one
+            if await self._wait_wake(self._poll_delay()):
+                await asyncio.sleep(self._send_delay())
+            pid = self.player_id
+            if pid == -1:
+                await self._register()
+                continue
+            body, update, texts = self._sync_request()
+            try:
+                resp = await self._pool.request("POST", "/sync", json_body=body)
+            except Exception as e:
+                self._connection_failed(e)
+                resp = None
+            if self._on_sync(resp, update, texts):
+                await self._reregister_async(pid)
+
+    # ------------------------------------------------------------------
+    # Stream transport, the server pushes so nothing here runs on a timer
+    # ------------------------------------------------------------------
+    async def _stream_task(self) -> None:
+        host = self._pool.host
+        port = GameSettings.ONLINE_STREAM_PORT
+
+        while True:
+            try:
+                reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), 5)
+                try:
+                    writer.get_extra_info("socket").setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                    await self._stream_session_async(reader, writer)
+                finally:
+                    writer.close()
+            except (OSError, ProtocolError, TimeoutError) as e:
+                self._connection_failed(e)
+            except Exception as e: # e.g. a message we choke on, reconnect instead of dropping the stream for good
+                Logger.warning(f"OnlineManager stream failed: {e!r}")
+                self._connection_failed(e)
+            await asyncio.sleep(self._backoff_delay())
+
+    async def _stream_session_async(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        writer.write(encode_frame(self._stream_hello()))
+        receiver = asyncio.create_task(self._stream_receive(reader))
+        try:
+            while not receiver.done():
+                for data in self._stream_outgoing():
+                    writer.write(data)
+                await writer.drain()
+                waker = asyncio.create_task(self._wake.wait())
+                await asyncio.wait((receiver, waker), return_when=asyncio.FIRST_COMPLETED)
+                waker.cancel()
+                self._wake.clear()
+            receiver.result() # why it ended
+        finally:
+            receiver.cancel()
+
+    async def _stream_receive(self, reader: asyncio.StreamReader) -> None:
+        frames = FrameReader()
+        while True:
+            chunk = await reader.read(65536)
+            if not chunk:
+                raise ConnectionResetError("server closed the stream")
+            for msg in frames.feed(chunk):
+                self._on_stream_message(msg)
@@ -1,24 +1,55 @@
 import threading
 import time
 import queue
-import collections
-import json
+import socket
+import random
 from collections import deque
-from typing import Optional
-from src.utils import Logger, GameSettings
+from dataclasses import dataclass, replace
+from enum import Enum
+from typing import Callable
+from urllib.parse import urlsplit
+from src.utils import Logger, GameSettings, RemotePlayerBuffer, BufferView, predict
+from server.protocol import (
+    encode_frame, frame, FrameReader, ProtocolError,
+    BINARY_CONTENT_TYPE, encode_update, decode_snapshot
+)
+from server.udpServer import encode_datagram, udp_key
 import requests
 
-from typing import Any
+POLL_INTERVAL = 0.016 # 60Hz Updates, while someone near us moves
+POLL_IDLE = 0.25 # others around but nobody moving
+POLL_ALONE = 1.0 # nobody else on the map, only looking for newcomers
+NEARBY_DISTANCE = 16 * GameSettings.TILE_SIZE # about a screen
+CHAT_WAIT_TIME = 10.0 # long-poll, server answers early when a message arrives
+RECONNECT_DELAY = 1.0 # first retry after a connection error, doubles up to MAX_RECONNECT_DELAY
+MAX_RECONNECT_DELAY = 30.0
+HEARTBEAT_INTERVAL = 10.0 # keep an idle player alive, server drops it after 60s of silence
+MAX_SEND_INTERVAL = 1.0 # slowest we go when the server keeps answering 429
+DRIFT_THRESHOLD = GameSettings.TILE_SIZE / 4 # dead reckoning: send once we're this far from the prediction
+KEEPALIVE_INTERVAL = 1.0 # and at least this often, repairs a lost UDP update too
+SYNC_CHAT_BATCH = 5 # texts per /sync, the server's chat burst, more can never be accepted at once
 
-POLL_INTERVAL = 0.016 # 60Hz Updates
+ConnectionState = Enum('ConnectionState', ['CONNECTING', 'ONLINE', 'RECONNECTING'])
+
+@dataclass(frozen=True)
+class OnlineSnapshot:
+    """
+    What the network side published last. Never changed, a new one replaces it, so the
+    game loop reads `online_manager.snapshot` once per frame without locking or copying
+    and skips work when the version it cares about is the one it already handled.
+    """
+    version: int = 0 # bumps on every publish
+    players: tuple[dict, ...] = () # remote players, not including us
+    players_version: int = 0
+    chat: tuple[dict, ...] = () # oldest first
+    chat_version: int = 0
+    interp: BufferView = BufferView() # remote players' jitter buffer as of the last snapshot, sample() per frame
 
 class OnlineManager:
-    list_players: list[dict]
     player_id: int
     
     _stop_event: threading.Event
-    _fetch_thread: threading.Thread | None # Two thread to make it faster GET
-    _send_thread: threading.Thread | None # POST
+    _threads: list[threading.Thread] # http: fetch (GET) + send (POST) + chat (long-poll), sync/stream: one thread
     _lock: threading.Lock
     _update_queue: queue.Queue
     _session: requests.Session
@@ -26,18 +57,45 @@ class OnlineManager:
     def __init__(self):
         self.base: str = GameSettings.ONLINE_SERVER_URL
         self.player_id = -1
-        self.list_players = []
-        self._fetch_thread = None 
-        self._send_thread = None 
+        self._session_token: str | None = None # lets register() get the same id back after a drop
+        self._snapshot = OnlineSnapshot()
+        self._players_by_id: dict[int, dict] = {} # merged world state from /players deltas
+        self._players_version = 0
+        self._players_etag: str | None = None # sent as If-None-Match, 304 = nothing to merge
+        self._interp = RemotePlayerBuffer(GameSettings.ONLINE_INTERP_DELAY, GameSettings.ONLINE_EXTRAPOLATE_LIMIT)
+        self._binary = False # the server has shown it takes binary: /register encodings, a binary snapshot or the stream welcome
+        self._threads = []
         self._stop_event = threading.Event()
         self._lock = threading.Lock()
+        self._register_lock = threading.Lock() # fetch and send threads can both hit a 404
         
         self._latest_update = None # Use single variable
+        self._outgoing = threading.Event() # update() / send_chat() wake the sender with it
+        self._failures = 0 # connection errors in a row, drives the backoff
+        self._was_online = False
+        self._sent_state: tuple[dict, float] | None = None # last update queued and when, for dead reckoning
         self._session = requests.Session() # Reuse TCP connection
         
+        # Optional UDP position channel, registration/chat/polling stay on HTTP
+        self._udp_sock: socket.socket | None = None
+        self._udp_addr = (urlsplit(self.base).hostname or "localhost", GameSettings.ONLINE_UDP_PORT)
+        self._udp_session = random.getrandbits(16)
+        self._udp_seq = 0
+        
+        # Loop intervals, stretched when the server rate limits us (429) and eased back on success
+        self._intervals = {"update": POLL_INTERVAL, "poll": POLL_INTERVAL}
+        self._chat_pending: str | None = None # rate limited message, sent before the queue
+        self._chat_held: list[str] = [] # /sync texts the server handed back, sent before the queue
+        self._chat_retry_at = 0.0
+        
         self._chat_out_queue = queue.Queue(maxsize=50)
         self._chat_messages = deque(maxlen=200)
         self._last_chat_id = 0
+        self._chat_etag: str | None = None
+        
+        # Called from the network threads with every merged snapshot / the new chat messages
+        self.on_snapshot: Callable[[dict, list[dict]], None] | None = None
+        self.on_chat: Callable[[list[dict]], None] | None = None
 
         Logger.info("OnlineManager initialized")
         
@@ -48,9 +106,78 @@ class OnlineManager:
     def exit(self):
         self.stop()
         
+    @property
+    def snapshot(self) -> OnlineSnapshot:
+        return self._snapshot
+
     def get_list_players(self) -> list[dict]:
-        with self._lock:
-            return list(self.list_players)
+        return list(self.snapshot.players)
+
+    def get_interpolated_players(self) -> list[dict]:
+        """ Remote players where they should be drawn this frame, smoothed over network jitter """
+        return self.snapshot.interp.sample(time.monotonic())
+
+    @property
+    def connection_state(self) -> ConnectionState:
+        if self._failures:
+            return ConnectionState.RECONNECTING
+        if self.player_id == -1:
+            return ConnectionState.CONNECTING
+        return ConnectionState.ONLINE
+
+    # ------------------------------------------------------------------
+    # Scheduling: how long the loops sleep
+    # ------------------------------------------------------------------
+    def _connection_ok(self) -> None:
+        if self._failures:
+            Logger.info("OnlineManager reconnected")
+        self._failures = 0
+        self._was_online = True
+
+    def _connection_failed(self, e: Exception) -> None:
+        if self._failures == 0:
+            Logger.warning(f"OnlineManager {'lost the server' if self._was_online else 'cannot reach the server'}: {e}")
+        self._failures += 1
+
+    def _backoff_delay(self) -> float:
+        """ Exponential backoff with jitter, so a fleet of clients doesn't retry in lockstep """
+        delay = min(RECONNECT_DELAY * 2 ** max(self._failures - 1, 0), MAX_RECONNECT_DELAY)
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def _poll_delay(self) -> float:
+        """ Fast while something near us moves, slow when alone or idle, backing off while the server is gone """
+        if self._failures:
+            return self._backoff_delay()
+        players = self._snapshot.players
+        if not players:
+            delay = POLL_ALONE
+        elif self._activity_nearby(players):
+            delay = POLL_INTERVAL
+        else:
+            delay = POLL_IDLE
+        return max(delay, self._intervals["poll"]) # 429s can stretch it further
+
+    def _activity_nearby(self, players: tuple[dict, ...]) -> bool:
+        if self._sent_state is None: # don't know where we are yet
+            return any(p.get("is_moving") for p in players)
+        me = self._sent_state[0]
+        if me["is_moving"]: # what's near us keeps changing
+            return True
+        return any(
+            p.get("is_moving") and p.get("map") == me["map"]
+            and abs(p["x"] - me["x"]) <= NEARBY_DISTANCE and abs(p["y"] - me["y"]) <= NEARBY_DISTANCE
+            for p in players
+        )
+
+    def _send_delay(self) -> float:
+        return self._backoff_delay() if self._failures else self._intervals["update"]
+
+    def _has_outgoing(self) -> bool:
+        if self._latest_update is not None:
+            return True
+        if time.monotonic() < self._chat_retry_at:
+            return False
+        return self._chat_pending is not None or bool(self._chat_held) or not self._chat_out_queue.empty()
 
     # ------------------------------------------------------------------
     # Threading and API Calling Below
@@ -59,56 +186,108 @@ class OnlineManager:
         s = session if session else requests
         try:
             url = f"{self.base}/register"
-            resp = s.get(url, timeout=5)
+            resp = s.get(url, params=self._register_params(), timeout=5)
             # resp.raise_for_status() 
-            if resp.status_code == 200:
-                data = resp.json()
-                self.player_id = data["id"]
-                Logger.info(f"OnlineManager registered with id={self.player_id}")
-            else:
-                Logger.warning(f"Registration failed: {resp.status_code}")
+            self._on_register(resp)
         except Exception as e:
-            Logger.warning(f"OnlineManager registration error: {e}")
+            self._connection_failed(e)
         return
 
+    def _register_params(self) -> dict | None:
+        return {"token": self._session_token} if self._session_token else None
+
+    def _on_register(self, resp) -> None:
+        self._connection_ok()
+        if resp.status_code != 200:
+            Logger.warning(f"Registration failed: {resp.status_code}")
+            return
+        data = resp.json()
+        resumed = data["id"] == self.player_id
+        self.player_id = data["id"]
+        self._sent_state = None # server may have lost our position, send it right away
+        self._session_token = data.get("token")
+        self._binary = GameSettings.ONLINE_ENCODING == "binary" and "binary" in data.get("encodings", ())
+        Logger.info(f"OnlineManager {'resumed' if resumed else 'registered with'} id={self.player_id}")
+
+    def _reregister(self, stale_id: int, session: requests.Session) -> None:
+        """ Server forgot `stale_id`, register again unless another thread already did """
+        with self._register_lock:
+            if self.player_id != stale_id:
+                return
+            Logger.warning("PlayerID not found (404). Resuming session...")
+            self.register(session)
+
     def update(self, x: float, y: float, map_name: str, direction = 'down', is_moving = False) -> bool:
         if self.player_id == -1:
             return False
         
+        state = {
+            "x": x, 
+            "y": y, 
+            "map": map_name, 
+            "direction": direction, 
+            "is_moving": is_moving
+        }
+        now = time.monotonic()
+        if GameSettings.ONLINE_DEAD_RECKONING and not self._should_send(state, now):
+            return True
+        
         # Only keep the LATEST update
         with self._lock:
-            self._latest_update = {
-                "x": x, 
-                "y": y, 
-                "map": map_name, 
-                "direction": direction, 
-                "is_moving": is_moving
-            }
+            self._latest_update = state
+        self._sent_state = (state, now)
+        self._notify()
         return True
 
+    def _notify(self) -> None:
+        """ Something new to send """
+        self._outgoing.set()
+
+    def _should_send(self, state: dict, now: float) -> bool:
+        """ Dead reckoning: skip updates remote clients can already predict from the last one """
+        if self._sent_state is None:
+            return True
+        sent, sent_at = self._sent_state
+        if now - sent_at >= KEEPALIVE_INTERVAL:
+            return True
+        if (state["map"], state["direction"], state["is_moving"]) != (sent["map"], sent["direction"], sent["is_moving"]):
+            return True
+        px, py = predict(sent["x"], sent["y"], sent["direction"], sent["is_moving"], now - sent_at)
+        return (px - state["x"]) ** 2 + (py - state["y"]) ** 2 > DRIFT_THRESHOLD ** 2
+
     def start(self) -> None:
-        if (self._fetch_thread and self._fetch_thread.is_alive()) or \
-           (self._send_thread and self._send_thread.is_alive()):
+        if any(t.is_alive() for t in self._threads):
             return
         
         self._stop_event.clear()
         
-        self._fetch_thread = threading.Thread(
-            target=self._fetch_loop,
-            name="OnlineManagerFetcher",
-            daemon=True
-        )
-        self._fetch_thread.start()
+        if GameSettings.ONLINE_UDP and GameSettings.ONLINE_TRANSPORT != "stream":
+            self._udp_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         
-        self._send_thread = threading.Thread(
-            target=self._send_loop,
-            name="OnlineManagerSender",
-            daemon=True
-        )
-        self._send_thread.start()
+        if GameSettings.ONLINE_TRANSPORT == "stream":
+            loops = {"OnlineManagerStream": self._stream_loop}
+        elif GameSettings.ONLINE_TRANSPORT == "sync":
+            loops = {"OnlineManagerSync": self._sync_loop}
+        else:
+            loops = {
+                "OnlineManagerFetcher": self._fetch_loop,
+                "OnlineManagerSender": self._send_loop,
+                "OnlineManagerChat": self._chat_loop,
+            }
+        
+        self._threads = [
+            threading.Thread(target=target, name=name, daemon=True)
+            for name, target in loops.items()
+        ]
+        for t in self._threads:
+            t.start()
 
     def stop(self) -> None:
         self._stop_event.set() # not join threads, let there exit on it own
+        self._outgoing.set()
+        if self._udp_sock:
+            self._udp_sock.close()
+            self._udp_sock = None
 
     def _fetch_loop(self) -> None:
         session = requests.Session() # create thread-local session
@@ -117,23 +296,26 @@ class OnlineManager:
         if self.player_id == -1:
             self.register(session)
         
-        
-        tick = 0
-        while not self._stop_event.wait(POLL_INTERVAL):
+        while not self._stop_event.wait(self._poll_delay()):
+            if self.player_id == -1: # server was down when we started
+                self.register(session)
+                continue
             self._fetch_players(session)
-            
-            # fetch chat every 10 frames
-            tick += 1
-            if tick >= 10:
-                self._fetch_chat(session)
-                tick = 0
         
         session.close()
     
     def _send_loop(self) -> None:
         session = requests.Session()  # create thread-local session
+        last_sent = time.monotonic()
         
         while not self._stop_event.is_set():
+            if not self._has_outgoing(): # sleep until there's something to send or the heartbeat is due
+                timeout = last_sent + HEARTBEAT_INTERVAL - time.monotonic()
+                if self._chat_pending:
+                    timeout = min(timeout, self._chat_retry_at - time.monotonic())
+                self._outgoing.wait(max(timeout, 0.0))
+            self._outgoing.clear()
+            
             # Send Position
             data = None
             with self._lock:
@@ -142,81 +324,405 @@ class OnlineManager:
                     self._latest_update = None
             if data:
                 self._send_update(data, session)
+                last_sent = time.monotonic()
+            elif time.monotonic() - last_sent >= HEARTBEAT_INTERVAL:
+                self._send_heartbeat(session)
+                last_sent = time.monotonic()
             
             # Send Chat (Drain Queue)
+            if time.monotonic() >= self._chat_retry_at:
+                try:
+                    while True:
+                        text = self._chat_pending or self._chat_out_queue.get_nowait()
+                        self._chat_pending = None
+                        retry_after = self._post_chat(text, session)
+                        if retry_after > 0: # keep it and its place in line
+                            self._chat_pending = text
+                            self._chat_retry_at = time.monotonic() + retry_after
+                            break
+                except queue.Empty:
+                    pass
+                
+            self._stop_event.wait(self._send_delay()) # caps the send rate, stretched by 429s and errors
+        
+        session.close()
+    
+    # ------------------------------------------------------------------
+    # Sync transport: one POST /sync per tick carries position + chat both ways
+    # ------------------------------------------------------------------
+    def _sync_loop(self) -> None:
+        session = requests.Session()
+        
+        while not self._stop_event.is_set():
+            # Carries our update too, so don't sleep through one
+            if self._outgoing.wait(self._poll_delay()):
+                self._stop_event.wait(self._send_delay())
+            self._outgoing.clear()
+            if self._stop_event.is_set():
+                break
+            if self.player_id == -1:
+                self.register(session)
+                continue
+            self._sync(session)
+        
+        session.close()
+    
+    def _sync(self, session: requests.Session) -> None:
+        pid = self.player_id
+        body, update, texts = self._sync_request()
+        try:
+            resp = session.post(f"{self.base}/sync", json=body, timeout=1.0)
+        except Exception as e:
+            self._connection_failed(e)
+            resp = None
+        if self._on_sync(resp, update, texts): # server forgot us
+            self._reregister(pid, session)
+    
+    def _sync_request(self) -> tuple[dict, dict | None, list[str]]:
+        """ Takes the pending update and chat, returns (body, update, texts) so they can be put back on failure """
+        with self._lock:
+            update = self._latest_update
+            self._latest_update = None
+        if update and self._send_udp(update):
+            update = None # already on its way
+        texts = []
+        if time.monotonic() >= self._chat_retry_at:
+            texts, self._chat_held = self._chat_held[:SYNC_CHAT_BATCH], self._chat_held[SYNC_CHAT_BATCH:]
             try:
-                while True:
-                    text = self._chat_out_queue.get_nowait()
-                    self._post_chat(text, session)
+                while len(texts) < SYNC_CHAT_BATCH:
+                    texts.append(self._chat_out_queue.get_nowait())
             except queue.Empty:
                 pass
-                
-            time.sleep(POLL_INTERVAL)
+        
+        body = {
+            "id": self.player_id,
+            "update": update,
+            "chat": texts,
+            "since": self._players_version,
+            "radius": GameSettings.ONLINE_INTEREST_RADIUS,
+            "chat_after": self._last_chat_id,
+        }
+        return body, update, texts
+    
+    def _on_sync(self, resp, update: dict | None, texts: list[str]) -> bool:
+        """ True if the server answered 404 """
+        if resp is None or self._rate_limited("poll", resp):
+            # Keep what we failed to send, unless something newer came in meanwhile
+            with self._lock:
+                if self._latest_update is None:
+                    self._latest_update = update
+            self._chat_held[:0] = texts # in front, keeps the order
+            return False
+        if resp.status_code != 200:
+            return resp.status_code == 404
+        
+        data = resp.json()
+        self._merge_players(data["players"])
+        chat = data["chat"]
+        rejected = int(chat.get("rejected", 0))
+        if rejected: # over the chat limit, the rest of the sync went through
+            self._chat_held[:0] = texts[len(texts) - rejected:]
+            self._chat_retry_at = time.monotonic() + float(chat.get("retry_after", 1.0))
+        if int(chat.get("last_id", 0)) < self._last_chat_id: # server restarted, ids start over
+            self._last_chat_id = 0
+        self._add_chat(chat.get("messages", []))
+        return False
+    
+    # ------------------------------------------------------------------
+    # Stream transport (server.py --stream-port), positions and chat
+    # ------------------------------------------------------------------
+    def _stream_loop(self) -> None:
+        host = urlsplit(self.base).hostname or "localhost"
+        port = GameSettings.ONLINE_STREAM_PORT
+        
+        while not self._stop_event.is_set():
+            try:
+                with socket.create_connection((host, port), timeout=5) as sock:
+                    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                    self._stream_session(sock)
+            except (OSError, ProtocolError) as e:
+                self._connection_failed(e)
+            except Exception as e: # e.g. a message we choke on, reconnect instead of dropping the stream for good
+                Logger.warning(f"OnlineManager stream failed: {e!r}")
+                self._connection_failed(e)
+            self._stop_event.wait(self._backoff_delay())
+    
+    def _stream_session(self, sock: socket.socket) -> None:
+        sock.sendall(encode_frame(self._stream_hello()))
+        sock.settimeout(POLL_INTERVAL) # recv timeout doubles as the send tick
+        reader = FrameReader()
+        
+        while not self._stop_event.is_set():
+            for data in self._stream_outgoing():
+                sock.sendall(data)
+            
+            try:
+                chunk = sock.recv(65536)
+            except socket.timeout:
+                continue
+            if not chunk:
+                raise ConnectionResetError("server closed the stream")
+            
+            for msg in reader.feed(chunk):
+                self._on_stream_message(msg)
+    
+    def _stream_hello(self) -> dict:
+        return {
+            "type": "hello",
+            "token": self._session_token, # resume if the server still knows us
+            "id": self.player_id if self.player_id != -1 else None,
+            "radius": GameSettings.ONLINE_INTEREST_RADIUS,
+            "encoding": GameSettings.ONLINE_ENCODING,
+            "chat_after": self._last_chat_id,
+        }
+    
+    def _stream_outgoing(self) -> list[bytes]:
+        """ Frames for the pending update and chat messages """
+        frames = []
+        with self._lock:
+            data = self._latest_update
+            self._latest_update = None
+        if data:
+            if self._binary:
+                frames.append(frame(encode_update(self.player_id, data)))
+            else:
+                frames.append(encode_frame({"type": "update", **data}))
+        try:
+            while True:
+                text = self._chat_out_queue.get_nowait()
+                frames.append(encode_frame({"type": "chat", "text": text}))
+        except queue.Empty:
+            pass
+        return frames
+    
+    def _on_stream_message(self, msg: dict) -> None:
+        kind = msg.get("type")
+        if kind == "welcome":
+            self._connection_ok()
+            self.player_id = int(msg["id"])
+            self._session_token = msg.get("token") or self._session_token
+            self._binary = msg.get("encoding") == "binary"
+            Logger.info(f"OnlineManager streaming with id={self.player_id}")
+        elif kind == "snapshot":
+            self._merge_players(msg)
+        elif kind == "chat":
+            self._add_chat(msg.get("messages", []))
+    
+    def _chat_loop(self) -> None:
+        session = requests.Session()
+        
+        while not self._stop_event.is_set():
+            if not self._fetch_chat(session, CHAT_WAIT_TIME):
+                self._stop_event.wait(self._backoff_delay()) # server down, don't spin
         
         session.close()
             
-    def _post_chat(self, text: str, session: requests.Session):
-        if self.player_id == -1: return
+    def _post_chat(self, text: str, session: requests.Session) -> float:
+        """ Seconds to wait before retrying `text` if the server rate limited it, 0 otherwise """
+        if self.player_id == -1: return 0.0
         try:
             url = f"{self.base}/chat"
             body = {"id": self.player_id, "text": text}
-            session.post(url, json=body, timeout=1.0)
-        except Exception:
-            pass
+            resp = session.post(url, json=body, timeout=1.0)
+            self._connection_ok()
+            if resp.status_code == 429:
+                return self._retry_after(resp)
+        except Exception as e:
+            self._connection_failed(e)
+        return 0.0
 
     def _send_update(self, update_data: dict, session: requests.Session) -> None:
-        if self.player_id == -1:
+        pid = self.player_id
+        if pid == -1:
+            return
+        if self._send_udp(update_data):
             return
         
         url = f"{self.base}/players"
-        body = {
-            "id": self.player_id, 
-            **update_data
-        }
         
         try:
-            resp = session.post(url, json=body, timeout=1.0) # use session for reusing connection
-            if resp.status_code == 404:
+            binary = self._binary
+            if binary:
+                resp = session.post(
+                    url, data=encode_update(self.player_id, update_data),
+                    headers={"Content-Type": BINARY_CONTENT_TYPE}, timeout=1.0
+                )
+            else:
+                body = {"id": self.player_id, **update_data}
+                resp = session.post(url, json=body, timeout=1.0) # use session for reusing connection
+            if self._on_update(resp, update_data, binary):
                 # Auto-Reconnect
-                Logger.warning("PlayerID not found (404). Re-registering...")
-                self.register(session)
-            elif resp.status_code != 200:
-                pass
+                self._reregister(pid, session)
         except Exception as e:
-            # Logger.warning(f"Update connection error: {e}")
-            pass
+            self._connection_failed(e)
     
-    def _fetch_chat(self, session: requests.Session) -> None:
+    def _on_update(self, resp, update_data: dict, binary: bool = False) -> bool:
+        """ True if the server answered 404 """
+        if binary and resp.status_code in (400, 415): # server can't read binary after all
+            Logger.warning(f"Server rejected a binary update ({resp.status_code}), sending JSON")
+            self._binary = False
+            resp = None # resend it
+        if resp is None or self._rate_limited("update", resp):
+            with self._lock: # goes out on a later tick unless a newer one replaces it
+                if self._latest_update is None:
+                    self._latest_update = update_data
+            return False
+        return resp.status_code == 404
+    
+    def _send_udp(self, update_data: dict) -> bool:
+        """ Fire and forget over UDP if enabled. A lost datagram is fine, a newer one follows """
+        sock = self._udp_sock
+        if sock is None:
+            return False
+        self._udp_seq = (self._udp_seq + 1) & 0xFFFFFFFF
+        try:
+            payload = encode_update(self.player_id, update_data)
+            key = udp_key(self._session_token) if self._session_token else 0 # server drops datagrams without our token's key
+            sock.sendto(encode_datagram(key, self._udp_session, self._udp_seq, payload), self._udp_addr)
+            return True
+        except OSError:
+            return False # fall back to HTTP for this one
+    
+    def _send_heartbeat(self, session: requests.Session) -> None:
+        pid = self.player_id
+        if pid == -1:
+            return
+        try:
+            resp = session.post(f"{self.base}/heartbeat", json={"id": pid}, timeout=1.0)
+            if self._rate_limited("update", resp):
+                return
+            if resp.status_code == 404:
+                self._reregister(pid, session)
+        except Exception as e:
+            self._connection_failed(e)
+    
+    def _fetch_chat(self, session: requests.Session, wait: float = 0.0) -> bool:
         try:
             url = f"{self.base}/chat"
-            resp = session.get(url, timeout=1.0)
-            if resp.status_code == 200:
-                data = resp.json()
-                msgs = data.get("messages", [])
-                with self._lock:
-                    for m in msgs:
-                        mid = int(m.get("id", 0))
-                        if mid > self._last_chat_id:
-                            self._chat_messages.append(m)
-                            self._last_chat_id = mid
-        except Exception:
-            pass
+            params = {"after": self._last_chat_id, "wait": wait}
+            headers = {"If-None-Match": self._chat_etag} if self._chat_etag else {}
+            resp = session.get(url, params=params, headers=headers, timeout=wait + 1.0)
+            return self._on_chat(resp)
+        except Exception as e:
+            self._connection_failed(e)
+        return False
+    
+    def _on_chat(self, resp) -> bool:
+        self._connection_ok()
+        if resp.status_code == 304: # nothing new
+            return True
+        if resp.status_code == 200:
+            self._chat_etag = resp.headers.get("ETag")
+            data = resp.json()
+            if int(data.get("last_id", 0)) < self._last_chat_id: # server restarted, ids start over
+                self._last_chat_id = 0
+            self._add_chat(data.get("messages", []))
+            return True
+        return False
+
+    def _add_chat(self, msgs: list[dict]) -> None:
+        added = []
+        with self._lock:
+            for m in msgs:
+                mid = int(m.get("id", 0))
+                if mid > self._last_chat_id:
+                    self._chat_messages.append(m)
+                    self._last_chat_id = mid
+                    added.append(m)
+            if added:
+                self._publish(chat=tuple(self._chat_messages))
+        if added and self.on_chat:
+            self.on_chat(added)
 
     def _fetch_players(self, session: requests.Session) -> None:
-        if self.player_id == -1:
+        pid = self.player_id
+        if pid == -1:
             return
 
         url = f"{self.base}/players"
         try:
-            resp = session.get(url, timeout=1.0)
-            if resp.status_code == 200:
-                data = resp.json() # {id: player_data},
-                players = data.get("players", {}).values()
-                
-                with self._lock:
-                    self.list_players = [p for p in players if p["id"] != self.player_id] # not including
-        except Exception:
-            pass
+            params, headers = self._players_request()
+            resp = session.get(url, params=params, headers=headers, timeout=1.0)
+            if self._on_players(resp):
+                self._reregister(pid, session)
+        except Exception as e:
+            self._connection_failed(e)
+    
+    def _players_request(self) -> tuple[dict, dict]:
+        params = {
+            "since": self._players_version,
+            "id": self.player_id, # server only sends players on our map
+            "radius": GameSettings.ONLINE_INTEREST_RADIUS,
+        }
+        headers = {}
+        if self._players_etag:
+            headers["If-None-Match"] = self._players_etag
+        if GameSettings.ONLINE_ENCODING == "binary":
+            headers["Accept"] = f"{BINARY_CONTENT_TYPE}, application/json" # server may still answer JSON
+        return params, headers
+    
+    def _on_players(self, resp) -> bool:
+        """ True if the server answered 404, with UDP updates this is the only place we learn it forgot us """
+        if self._rate_limited("poll", resp) or resp.status_code == 304: # 304: nothing moved, nothing to parse
+            return False
+        if resp.status_code == 200:
+            if resp.headers.get("Content-Type") == BINARY_CONTENT_TYPE:
+                data = decode_snapshot(resp.content)
+                self._binary = True # it writes binary, it reads it too
+            else:
+                data = resp.json() # {version, full, players: {id: player_data}, removed: [id]}
+            self._merge_players(data)
+            self._players_etag = resp.headers.get("ETag")
+        return resp.status_code == 404
+
+    def _rate_limited(self, kind: str, resp: requests.Response) -> bool:
+        """ Adapt the `kind` loop interval to the server's limit, True if `resp` is a 429 """
+        self._connection_ok()
+        interval = self._intervals[kind]
+        if resp.status_code != 429:
+            self._intervals[kind] = max(POLL_INTERVAL, interval * 0.95) # ease back to full speed
+            return False
+        self._intervals[kind] = min(max(interval * 2, self._retry_after(resp)), MAX_SEND_INTERVAL)
+        return True
+
+    @staticmethod
+    def _retry_after(resp: requests.Response) -> float:
+        try:
+            return float(resp.json()["retry_after"]) # precise, the header only has whole seconds
+        except (ValueError, KeyError, TypeError):
+            try:
+                return float(resp.headers.get("Retry-After", 1))
+            except ValueError:
+                return 1.0
+
+    def _merge_players(self, data: dict) -> None:
+        if data.get("full", True):
+            self._players_by_id = {}
+        for p in data.get("players", {}).values():
+            self._players_by_id[int(p["id"])] = p
+        for pid in data.get("removed", []):
+            self._players_by_id.pop(int(pid), None)
+        self._players_version = int(data.get("version", 0))
+
+        players = tuple(p for pid, p in self._players_by_id.items() if pid != self.player_id) # not including
+        with self._lock:
+            self._interp.push(data, time.monotonic(), exclude=self.player_id)
+            self._publish(players=players, interp=self._interp.view)
+        if self.on_snapshot:
+            self.on_snapshot(data, players)
+
+    def _publish(self, players: tuple[dict, ...] | None = None, chat: tuple[dict, ...] | None = None,
+                 interp: BufferView | None = None) -> None:
+        """ Swap in a new snapshot, call with _lock held """
+        snap = self._snapshot
+        changes = {"version": snap.version + 1}
+        if interp is not None:
+            changes["interp"] = interp
+        if players is not None:
+            changes.update(players=players, players_version=snap.players_version + 1)
+        if chat is not None:
+            changes.update(chat=chat, chat_version=snap.chat_version + 1)
+        self._snapshot = replace(snap, **changes)
         
     # -----------------------------
     # Chat API
@@ -229,10 +735,10 @@ class OnlineManager:
             return False
         try:
             self._chat_out_queue.put_nowait(t)
-            return True
         except queue.Full:
             return False
+        self._notify()
+        return True
 
     def get_recent_chat(self, limit: int = 50) -> list[dict]:
-        with self._lock:
-            return list(self._chat_messages)[-limit:]
\ No newline at end of file
+        return list(self.snapshot.chat[-limit:])
\ No newline at end of file
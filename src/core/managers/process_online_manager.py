@@ -0,0 +1,341 @@
+import multiprocessing
+import os
+import queue
+import struct
+import threading
+import time
+from multiprocessing import shared_memory
+
+from src.utils import Logger, GameSettings
+from server.protocol import DIRECTIONS
+from .online_manager import OnlineManager, ConnectionState
+from .async_online_manager import AsyncOnlineManager
+
+"""
+Network client in a child process (GameSettings.ONLINE_PROCESS = True)
+
+The child runs a normal OnlineManager (ONLINE_BACKEND picks which) so sockets, JSON and
+requests never take the GIL from the render loop. What it receives is published into
+shared memory as fixed size records, the game process only unpacks the ones it hasn't seen.
+
+    parent -> child   commands queue: ("update", state) / ("chat", text) / ("stop",)
+    child -> parent   chat queue: lists of new messages (low rate, a queue is fine)
+                      shared memory, one writer (child) one reader (game loop):
+
+    header  published u64    ring entries written so far
+            world_seq u64    seqlock of the world area, odd while it's written
+            player_id i32
+            world_n   u32
+            world_t   f64    server time of the world area
+            token     64p    session token, so the next child resumes our id
+            state     u8     ConnectionState value
+    world   WORLD_RECORDS x RECORD    everyone we know of, for get_list_players() and catching up
+    ring    RING_SLOTS x entry        snapshot i lives in slot i % RING_SLOTS
+            entry   seq u64 (2i+1 while written, 2i+2 when done), server time f64, kind u8, n u16
+                    SLOT_RECORDS x RECORD
+    RECORD  <iddBB64p   id, x, y, direction, flags (1 moving, 2 removed), map
+
+A reader that falls more than RING_SLOTS behind, or meets an entry too big for a slot,
+resyncs from the world area instead.
+"""
+
+RING_SLOTS = 64
+SLOT_RECORDS = 64
+WORLD_RECORDS = 1024
+
+PUBLISHED = struct.Struct("<Q")
+WORLD_SEQ = struct.Struct("<Q")
+PLAYER_ID = struct.Struct("<i")
+WORLD_N = struct.Struct("<I")
+WORLD_T = struct.Struct("<d")
+TOKEN = struct.Struct("<64p")
+STATE = struct.Struct("<B")
+HEADER_SIZE = 104 # 8 + 8 + 4 + 4 + 8 + 64 + 1, padded
+ENTRY = struct.Struct("<QdBH")
+RECORD = struct.Struct("<iddBB64p")
+
+KIND_DELTA, KIND_FULL, KIND_OVERFLOW = 0, 1, 2
+FLAG_MOVING, FLAG_REMOVED = 1, 2
+
+WORLD_OFFSET = HEADER_SIZE
+RING_OFFSET = WORLD_OFFSET + WORLD_RECORDS * RECORD.size
+ENTRY_SIZE = ENTRY.size + SLOT_RECORDS * RECORD.size
+SHM_SIZE = RING_OFFSET + RING_SLOTS * ENTRY_SIZE
+
+STOP_TIMEOUT = 2.0
+
+# fork keeps the child from re-importing the game (and opening the audio device again)
+_CTX = multiprocessing.get_context("fork" if "fork" in multiprocessing.get_all_start_methods() else "spawn")
+_DIRECTION_INDEX = {d: i for i, d in enumerate(DIRECTIONS)}
+
+
+def _pack_player(buf, offset: int, p: dict) -> None:
+    flags = FLAG_MOVING if p.get("is_moving") else 0
+    RECORD.pack_into(buf, offset, int(p["id"]), float(p["x"]), float(p["y"]),
+                     _DIRECTION_INDEX.get(p.get("direction", "down"), 0), flags, p.get("map", "").encode("utf-8"))
+
+
+def _unpack_player(rec: tuple) -> dict:
+    pid, x, y, direction, flags, map_name = rec
+    return {"id": pid, "x": x, "y": y, "map": map_name.decode("utf-8"),
+            "direction": DIRECTIONS[direction & 0x03], "is_moving": bool(flags & FLAG_MOVING)}
+
+
+class PlayerRing:
+    """ The shared memory above. create=True in the game process, the child attaches by name """
+    def __init__(self, name: str | None = None):
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=SHM_SIZE)
+            self.shm.buf[:HEADER_SIZE] = bytes(HEADER_SIZE)
+            PLAYER_ID.pack_into(self.shm.buf, 16, -1)
+            STATE.pack_into(self.shm.buf, 96, ConnectionState.CONNECTING.value)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.buf = self.shm.buf
+        self._lock = threading.Lock() # network threads of the child can both publish
+        self._published = PUBLISHED.unpack_from(self.buf, 0)[0]
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    # Writer (child)
+    def set_player(self, pid: int, token: str | None, state: ConnectionState) -> None:
+        PLAYER_ID.pack_into(self.buf, 16, pid)
+        TOKEN.pack_into(self.buf, 32, (token or "").encode("ascii"))
+        STATE.pack_into(self.buf, 96, state.value)
+
+    def publish(self, data: dict, players: tuple[dict, ...]) -> None:
+        t = float(data.get("time") or 0.0)
+        changed = list(data.get("players", {}).values())
+        removed = data.get("removed", [])
+        with self._lock:
+            # world first, a reader that fell behind the ring catches up from it
+            seq = WORLD_SEQ.unpack_from(self.buf, 8)[0] + 1
+            WORLD_SEQ.pack_into(self.buf, 8, seq)
+            n = min(len(players), WORLD_RECORDS)
+            for i in range(n):
+                _pack_player(self.buf, WORLD_OFFSET + i * RECORD.size, players[i])
+            WORLD_N.pack_into(self.buf, 20, n)
+            WORLD_T.pack_into(self.buf, 24, t)
+            WORLD_SEQ.pack_into(self.buf, 8, seq + 1)
+
+            i = self._published
+            offset = RING_OFFSET + (i % RING_SLOTS) * ENTRY_SIZE
+            ENTRY.pack_into(self.buf, offset, 2 * i + 1, t, KIND_OVERFLOW, 0)
+            if len(changed) + len(removed) > SLOT_RECORDS:
+                kind, n = KIND_OVERFLOW, 0
+            else:
+                kind = KIND_FULL if data.get("full", True) else KIND_DELTA
+                n = 0
+                for p in changed:
+                    _pack_player(self.buf, offset + ENTRY.size + n * RECORD.size, p)
+                    n += 1
+                for pid in removed:
+                    RECORD.pack_into(self.buf, offset + ENTRY.size + n * RECORD.size, int(pid), 0.0, 0.0, 0, FLAG_REMOVED, b"")
+                    n += 1
+            ENTRY.pack_into(self.buf, offset, 2 * i + 2, t, kind, n)
+            self._published = i + 1
+            PUBLISHED.pack_into(self.buf, 0, i + 1)
+
+    # Reader (game loop)
+    def published(self) -> int:
+        return PUBLISHED.unpack_from(self.buf, 0)[0]
+
+    def player_id(self) -> int:
+        return PLAYER_ID.unpack_from(self.buf, 16)[0]
+
+    def token(self) -> str | None:
+        return TOKEN.unpack_from(self.buf, 32)[0].decode("ascii") or None
+
+    def state(self) -> ConnectionState:
+        return ConnectionState(STATE.unpack_from(self.buf, 96)[0])
+
+    def world_seq(self) -> int:
+        return WORLD_SEQ.unpack_from(self.buf, 8)[0]
+
+    def read_world(self) -> tuple[int, list[dict], float] | None:
+        """ (seq, players, server time), None if the child is writing it right now """
+        seq = self.world_seq()
+        if seq & 1:
+            return None
+        n = WORLD_N.unpack_from(self.buf, 20)[0]
+        t = WORLD_T.unpack_from(self.buf, 24)[0]
+        records = RECORD.iter_unpack(self.buf[WORLD_OFFSET:WORLD_OFFSET + n * RECORD.size])
+        players = [_unpack_player(rec) for rec in records]
+        if self.world_seq() != seq:
+            return None
+        return seq, players, t
+
+    def read_entry(self, i: int) -> dict | None:
+        """ Snapshot i in OnlineManager's format, None if it was overwritten or didn't fit """
+        offset = RING_OFFSET + (i % RING_SLOTS) * ENTRY_SIZE
+        seq, t, kind, n = ENTRY.unpack_from(self.buf, offset)
+        if seq != 2 * i + 2 or kind == KIND_OVERFLOW:
+            return None
+        start = offset + ENTRY.size
+        players, removed = {}, []
+        for rec in RECORD.iter_unpack(self.buf[start:start + n * RECORD.size]):
+            if rec[4] & FLAG_REMOVED:
+                removed.append(rec[0])
+            else:
+                players[rec[0]] = _unpack_player(rec)
+        if ENTRY.unpack_from(self.buf, offset)[0] != seq:
+            return None
+        return {"time": t, "full": kind == KIND_FULL, "players": players, "removed": removed}
+
+    def close(self, unlink: bool = False) -> None:
+        self.buf = None
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+
+def _client_main(shm_name: str, commands, chat_out, parent_pid: int) -> None:
+    """ Child process: a normal OnlineManager fed by the command queue """
+    GameSettings.ONLINE_DEAD_RECKONING = False # the game process already decided what is worth sending
+    ring = PlayerRing(shm_name)
+    manager = AsyncOnlineManager() if GameSettings.ONLINE_BACKEND == "asyncio" else OnlineManager()
+    manager.player_id = ring.player_id() # previous child's session, -1 the first time
+    manager._session_token = ring.token()
+
+    def on_snapshot(data: dict, players: tuple[dict, ...]) -> None:
+        ring.set_player(manager.player_id, manager._session_token, manager.connection_state)
+        ring.publish(data, players)
+
+    manager.on_snapshot = on_snapshot
+    manager.on_chat = chat_out.put
+    manager.start()
+    try:
+        while os.getppid() == parent_pid: # game died without telling us
+            ring.set_player(manager.player_id, manager._session_token, manager.connection_state)
+            try:
+                cmd = commands.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if cmd[0] == "update":
+                state = cmd[1]
+                manager.update(state["x"], state["y"], state["map"], state["direction"], state["is_moving"])
+            elif cmd[0] == "chat":
+                manager.send_chat(cmd[1])
+            elif cmd[0] == "stop":
+                break
+    finally:
+        manager.on_snapshot = None
+        manager.stop()
+        ring.close()
+
+
+class ProcessOnlineManager(OnlineManager):
+    """ Same API as OnlineManager, the game loop side of the child process """
+    def __init__(self):
+        super().__init__()
+        self._process: multiprocessing.Process | None = None
+        self._ring: PlayerRing | None = None
+        self._commands = None
+        self._chat_in = None
+        self._read_seq = 0 # next ring entry to push into _interp
+        self._world_seq = -1
+
+    def start(self) -> None:
+        if self._process and self._process.is_alive():
+            return
+        self._ring = PlayerRing()
+        self._ring.set_player(self.player_id, self._session_token, ConnectionState.CONNECTING) # resume like the threads do after exit()/enter()
+        self._commands = _CTX.Queue(maxsize=256)
+        self._chat_in = _CTX.Queue()
+        self._read_seq = 0
+        self._world_seq = -1
+        self._interp.clear()
+        self._publish(interp=self._interp.view)
+        self._process = _CTX.Process(
+            target=_client_main, name="OnlineManagerClient", daemon=True,
+            args=(self._ring.name, self._commands, self._chat_in, os.getpid()),
+        )
+        self._process.start()
+        Logger.info(f"OnlineManager client process started (pid={self._process.pid})")
+
+    def stop(self) -> None:
+        if self._process is None:
+            return
+        try:
+            self._commands.put(("stop",), timeout=STOP_TIMEOUT)
+        except queue.Full:
+            pass
+        self._process.join(STOP_TIMEOUT)
+        if self._process.is_alive():
+            self._process.terminate()
+        self._process = None
+        self._session_token = self._ring.token()
+        self._ring.close(unlink=True)
+        self._ring = None
+
+    def _notify(self) -> None:
+        """ update()/send_chat() queued something, hand it to the child """
+        if self._commands is None:
+            return
+        with self._lock:
+            data = self._latest_update
+            self._latest_update = None
+        try:
+            if data:
+                self._commands.put_nowait(("update", data))
+            while True:
+                self._commands.put_nowait(("chat", self._chat_out_queue.get_nowait()))
+        except queue.Empty:
+            pass
+        except queue.Full: # child is stuck, positions are superseded anyway
+            pass
+
+    @property
+    def connection_state(self) -> ConnectionState:
+        if self._ring is None:
+            return ConnectionState.CONNECTING
+        return self._ring.state()
+
+    def update(self, x: float, y: float, map_name: str, direction = 'down', is_moving = False) -> bool:
+        self._refresh() # once per frame, everything else reads the published snapshot
+        return super().update(x, y, map_name, direction, is_moving)
+
+    def _refresh(self) -> None:
+        """ Pull what the child published since the last frame. Game thread only, so no _lock """
+        ring = self._ring
+        if ring is None:
+            return
+        self.player_id = ring.player_id()
+
+        published = ring.published()
+        read_from = self._read_seq
+        behind = published - self._read_seq > RING_SLOTS
+        while not behind and self._read_seq < published:
+            data = ring.read_entry(self._read_seq)
+            if data is None:
+                behind = True
+                break
+            self._interp.push(data, time.monotonic(), exclude=self.player_id)
+            self._read_seq += 1
+        if behind:
+            world = ring.read_world()
+            if world is not None: # otherwise try again next frame
+                _, players, t = world
+                self._interp.push({"time": t, "full": True, "players": {p["id"]: p for p in players}},
+                                  time.monotonic(), exclude=self.player_id)
+                self._read_seq = published
+        if self._read_seq != read_from:
+            self._publish(interp=self._interp.view)
+
+        if ring.world_seq() != self._world_seq:
+            world = ring.read_world()
+            if world is not None:
+                self._world_seq, players, _ = world
+                self._publish(players=tuple(players))
+
+        added = False
+        try:
+            while True:
+                self._chat_messages.extend(self._chat_in.get_nowait()) # child already dropped duplicates
+                added = True
+        except queue.Empty:
+            pass
+        if added:
+            self._publish(chat=tuple(self._chat_messages))
@@ -21,6 +21,8 @@ class MiniMap:
         self.current_map = None   
         self._cached_map_key = None # for checking load map
         self._base_surface = None
+        self._online_dots_key = None # (players version, map, size) the cached dots were made for
+        self._online_dots: list[tuple[int, int]] = []
 
         # Navigation setup
         self.navigation = Navigation(self.game_manager)
@@ -29,7 +31,7 @@ class MiniMap:
         self.small_font = resource_manager.get_font('Minecraft.ttf', 20)
         self.large_font = resource_manager.get_font('Minecraft.ttf', 30)
     
-    def draw(self, screen: pg.Surface, online_players: list = None):
+    def draw(self, screen: pg.Surface, online_players: list = None, players_version: int | None = None):
         if not self.visible:
             return
         
@@ -42,7 +44,7 @@ class MiniMap:
         self.draw_statue(mini_surf)
         self.draw_trainer(mini_surf)
         if online_players:
-            self.draw_online_players(mini_surf, online_players)
+            self.draw_online_players(mini_surf, online_players, players_version)
         self.draw_player(mini_surf)
 
         screen.blit(mini_surf, self.screen_pos)      
@@ -121,14 +123,19 @@ class MiniMap:
         pg.draw.circle(screen, "white", mini_pos, 5)  # border
         pg.draw.circle(screen, "black", mini_pos, 3)   # fill
 
-    def draw_online_players(self, surf, online_players: list):
+    def draw_online_players(self, surf, online_players: list, players_version: int | None = None):
         current_map_path = self.game_manager.current_map.path_name
-        for p in online_players:
-            if p.get("map") == current_map_path: # Only when same map
-                pos = (p.get("x", 0), p.get("y", 0))
-                mini_pos = self.get_mini_pos(pos)
-                pg.draw.circle(surf, "#000000", mini_pos, 4)
-                pg.draw.circle(surf, "#F8AEF0", mini_pos, 2)
+        key = (players_version, current_map_path, self.v_scale)
+        if players_version is None or key != self._online_dots_key: # nothing moved, reuse the dots
+            self._online_dots = [
+                self.get_mini_pos((p.get("x", 0), p.get("y", 0)))
+                for p in online_players
+                if p.get("map") == current_map_path # Only when same map
+            ]
+            self._online_dots_key = key
+        for mini_pos in self._online_dots:
+            pg.draw.circle(surf, "#000000", mini_pos, 4)
+            pg.draw.circle(surf, "#F8AEF0", mini_pos, 2)
     
     def draw_npc(self, surf):
         if not self.current_map.npc_shop:
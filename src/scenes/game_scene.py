@@ -1,16 +1,16 @@
 import pygame as pg
-import threading
 import time
 
 from src.scenes.scene import Scene
-from src.core import GameManager, OnlineManager, PokemonManager, AutoSaveManager
+from src.core import GameManager, OnlineManager, AsyncOnlineManager, ProcessOnlineManager, PokemonManager, AutoSaveManager
 from src.utils import Logger, PositionCamera, GameSettings, Position
 from src.interface.components import Button
 from src.core.services import scene_manager, sound_manager, input_manager
 from src.sprites import Sprite
 from src.maps.minimap import MiniMap
 from src.core.managers.achivevement_manager import AchieveManager
-from src.sprites.animation import Animation
+from src.core.managers.online_manager import ConnectionState
+from src.sprites import AvatarPool
 from src.interface.components.chat_overlay import ChatOverlay
 
 from typing import override, Dict, Tuple
@@ -48,7 +48,12 @@ class GameScene(Scene):
         # Online Manager
         self.chat_overlay = None
         if GameSettings.IS_ONLINE:
-            self.online_manager = OnlineManager()
+            if GameSettings.ONLINE_PROCESS:
+                self.online_manager = ProcessOnlineManager()
+            elif GameSettings.ONLINE_BACKEND == "asyncio":
+                self.online_manager = AsyncOnlineManager()
+            else:
+                self.online_manager = OnlineManager()
             self.chat_overlay = ChatOverlay(
                 send_callback=self.online_manager.send_chat,
                 get_messages=self.online_manager.get_recent_chat 
@@ -57,11 +62,13 @@ class GameScene(Scene):
         else:
             self.online_manager = None
             
-        self.online_player_animations: dict[int, Animation] = {}
+        self.remote_avatars = AvatarPool()
+        self.online_players: list[dict] = [] # interpolated this frame, update() fills it and draw() uses it
         
         # Chat Bubbles
         self._chat_bubbles: Dict[int, Tuple[str, float]] = {}
         self._last_chat_id_seen = 0
+        self._chat_version_seen = 0 # OnlineSnapshot.chat_version, rescan only when it changes
         self._font = pg.font.Font(None, 24)
 
         #UI
@@ -123,70 +130,12 @@ class GameScene(Scene):
         
         # Update online players with interpolation
         if self.online_manager and self.game_manager.player:
-            list_online = self.online_manager.get_list_players()
-            
-            for player in list_online:
-                pid = player["id"]
-                
-                # Check map matching
-                if player.get("map") != self.game_manager.current_map.path_name:
-                    if pid in self.online_player_animations:
-                        del self.online_player_animations[pid] # Cleanup
-                    continue
-                
-                # Create animation if new player
-                if pid not in self.online_player_animations:
-                    self.online_player_animations[pid] = Animation(
-                        "character/ow1.png",
-                        ["down", "left", "right", "up"],
-                        4,
-                        (GameSettings.TILE_SIZE, GameSettings.TILE_SIZE)
-                    )
-                    # Initialize position ONLY when creating new animation
-                    anim = self.online_player_animations[pid]
-                    anim.position = Position(player["x"], player["y"])
-                    anim.rect.topleft = (int(anim.position.x), int(anim.position.y))
-                    
-                    # Apply scale based on player's map
-                    p_map = player.get("map", "")
-                    p_scale = self.game_manager.get_map_scale(p_map)
-                    anim.set_scale(p_scale)
-                
-                # Get animation (already exists)
-                anim = self.online_player_animations[pid]
-                direction = player.get("direction", "down")
-                is_moving = player.get("is_moving", False)
-                
-                # Target position from server
-                target_x = player["x"]
-                target_y = player["y"]
-                p_map = player.get("map", "")
-                
-                # Dynamic scale update
-                p_scale = self.game_manager.get_map_scale(p_map)
-                if getattr(anim, 'scale', 1) != p_scale:
-                    anim.set_scale(p_scale)
-                
-                # Initialize position attribute if it doesn't exist
-                if not hasattr(anim, 'position'):
-                    anim.position = Position(target_x, target_y)
-                
-                # No Lerp (Instant snap like user requested)
-                anim.position = Position(target_x, target_y)
-                
-                # Update rect for rendering
-                anim.rect.topleft = (int(anim.position.x), int(anim.position.y))
-                
-                # Switch direction
-                if "none" in direction:
-                    direction = "down"
-                anim.switch(direction)
-                
-                # Animate if moving, freeze if stopped
-                if is_moving:
-                    anim.update(dt)
-                else:
-                    anim.accumulator = 0  # Reset to first frame when stopped
+            self.online_players = self.online_manager.get_interpolated_players()
+            map_name = self.game_manager.current_map.path_name
+            self.remote_avatars.update(
+                self.online_players, map_name, self.game_manager.get_map_scale(map_name),
+                self.game_manager.player.camera, dt
+            )
                     
         # Update Chat Overlay
         if self.chat_overlay:
@@ -196,9 +145,11 @@ class GameScene(Scene):
             self.chat_overlay.update(dt)
             
         # Update Chat Bubbles
-        if self.online_manager:
+        snapshot = self.online_manager.snapshot if self.online_manager else None
+        if snapshot and snapshot.chat_version != self._chat_version_seen:
+            self._chat_version_seen = snapshot.chat_version
             try:
-                msgs = self.online_manager.get_recent_chat(50)
+                msgs = snapshot.chat[-50:]
                 max_id = self._last_chat_id_seen
                 now = time.monotonic()
                 # Detect Server Reset (If we see IDs much lower than expected)
@@ -274,15 +225,7 @@ class GameScene(Scene):
         self.achievement_button.draw(screen)
 
         if self.online_manager and self.game_manager.player:
-            list_online = self.online_manager.get_list_players()
-            for player in list_online:
-                if player["map"] == self.game_manager.current_map.path_name:
-                    pid = player["id"]
-                    if pid in self.online_player_animations:
-                        anim = self.online_player_animations[pid]
-                        is_moving = player.get("is_moving", False)
-                        cam = self.game_manager.player.camera
-                        anim.draw(screen, cam, key_press=is_moving)        
+            self.remote_avatars.draw(screen, self.game_manager.player.camera)
         
         # Navigation path
         if self.game_manager.player and self.minimap.navigation:
@@ -293,21 +236,35 @@ class GameScene(Scene):
              self._draw_chat_bubbles(screen, self.game_manager.player.camera)
         
         # Minimap logic updates
-        online_players = []
-        if self.online_manager:
-            online_players = self.online_manager.get_list_players()
+        snapshot = self.online_manager.snapshot if self.online_manager else None
+        online_players = snapshot.players if snapshot else ()
+        players_version = snapshot.players_version if snapshot else None
 
         if not self.minimap.full_map:
-            self.minimap.draw(screen, online_players)
+            self.minimap.draw(screen, online_players, players_version)
         
         self.cycle.draw(screen)
         
         # full map
         if self.minimap.full_map:
-            self.minimap.draw(screen, online_players)
+            self.minimap.draw(screen, online_players, players_version)
+            
+        if self.online_manager:
+            self._draw_connection_state(screen)
             
         if self.chat_overlay:
             self.chat_overlay.draw(screen)
+    
+    def _draw_connection_state(self, screen: pg.Surface):
+        state = self.online_manager.connection_state
+        if state == ConnectionState.ONLINE:
+            return
+        text = "Connecting..." if state == ConnectionState.CONNECTING else "Connection lost, reconnecting..."
+        surf = self._font.render(text, True, (255, 255, 255))
+        bg = pg.Surface((surf.get_width() + 16, surf.get_height() + 8), pg.SRCALPHA)
+        bg.fill((0, 0, 0, 160))
+        bg.blit(surf, (8, 4))
+        screen.blit(bg, (GameSettings.SCREEN_WIDTH // 2 - bg.get_width() // 2, 10))
       
     def cycle_handle(self, dt):
         self.cycle.update(dt)
@@ -349,16 +306,10 @@ class GameScene(Scene):
             self._draw_chat_bubble_for_pos(screen, camera, self.game_manager.player.position, text, self._font)
 
         # DRAW OTHER PLAYERS' BUBBLES
-        # Use animations for smoother position if available
-        if not self.online_player_animations:
-             return
-             
-        for pid, anim in self.online_player_animations.items():
+        # Only the ones on screen, 'anim.position' is the interpolated world pos
+        for pid, anim in self.remote_avatars.visible():
             if pid not in self._chat_bubbles:
                 continue
-            
-            # Use 'anim.position' which is the interpolated world pos
-            # We assume if animation exists, they are on valid map (logic in update handles creation)
              
             text, _ = self._chat_bubbles[pid]
             self._draw_chat_bubble_for_pos(screen, camera, anim.position, text, self._font)
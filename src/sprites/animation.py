@@ -4,6 +4,39 @@ from .sprite import Sprite
 from src.utils import GameSettings, Logger, PositionCamera
 from typing import Optional
 
+# (sheet, rows, n_keyframes, size, scale) -> frames per row. Frames are only ever blitted, so
+# every Animation of the same sheet shares one set instead of slicing and scaling its own
+_FRAMES: dict[tuple, dict[str, list[pg.Surface]]] = {}
+
+def _get_frames(sheet: pg.Surface, key: tuple, scale: float = 1) -> dict[str, list[pg.Surface]]:
+    image_path, rows, n_keyframes, size = key
+    frames = _FRAMES.get((*key, scale))
+    if frames is not None:
+        return frames
+    
+    if scale != 1: # from the unscaled frames, like set_scale always did
+        n_size = (int(size[0] * scale), int(size[1] * scale))
+        frames = {
+            name: [pg.transform.scale(frame, n_size) for frame in anim]
+            for name, anim in _get_frames(sheet, key).items()
+        }
+    else:
+        sheet_w, sheet_h = sheet.get_size()
+        frame_w = sheet_w // n_keyframes
+        frame_h = sheet_h // len(rows)
+        frames = {}
+        for r, name in enumerate(rows):
+            anim : list[pg.Surface] = []
+            for c in range(n_keyframes):
+                frame = sheet.subsurface(pg.Rect(
+                    c * frame_w, r * frame_h,
+                    frame_w, frame_h
+                ))
+                anim.append(pg.transform.scale(frame, size))
+            frames[name] = anim
+    _FRAMES[(*key, scale)] = frames
+    return frames
+
 class Animation(Sprite):
     # Animations
     o_animations: dict[str, list[pg.Surface]]
@@ -20,27 +53,15 @@ class Animation(Sprite):
         loop: float = 1                     # loop in second
     ):
         super().__init__(image_path)
-        sheet_w, sheet_h = self.image.get_size()
-        frame_w = sheet_w // n_keyframes
-        frame_h = sheet_h // len(rows)
         
         if (len(rows) <= 0 or n_keyframes <= 0):
             Logger.error("Invalid number of rows")
         
         self.o_size = size
 
-        self.o_animations = {}
-        self.animation = {}
-        for r, name in enumerate(rows):
-            anim : list[pg.Surface] = []
-            for c in range(n_keyframes):
-                frame = self.image.subsurface(pg.Rect(
-                    c * frame_w, r * frame_h,
-                    frame_w, frame_h
-                ))
-                anim.append(pg.transform.scale(frame, size))
-            self.o_animations[name] = anim
-            self.animations = self.o_animations.copy()
+        self._frames_key = (image_path, tuple(rows), n_keyframes, tuple(size))
+        self.o_animations = _get_frames(self.o_image, self._frames_key)
+        self.animations = self.o_animations
             
         self.accumulator = 0
         self.cur_row = rows[0]
@@ -52,13 +73,8 @@ class Animation(Sprite):
         self.scale = scale
         n_width, n_height = int(self.o_size[0] * scale), int(self.o_size[1] * scale)
         
-        # scale animation frames
-        self.animations = {}
-        for name, frames in self.o_animations.items():
-            scaled_frames = []
-            for frame in frames:
-                scaled_frames.append(pg.transform.scale(frame, (n_width, n_height)))
-            self.animations[name] = scaled_frames
+        # scaled frames are shared too, only the first Animation at this scale pays for them
+        self.animations = _get_frames(self.o_image, self._frames_key, scale)
         
         # Update rect size
         old_topleft = self.rect.topleft
@@ -0,0 +1,86 @@
+import pygame as pg
+
+from .animation import Animation
+from src.utils import GameSettings, Position, PositionCamera
+from typing import Iterator
+
+MAX_SPARE = 32 # idle avatars kept around for players coming (back) onto the map
+CULL_MARGIN = 2 * GameSettings.TILE_SIZE # keep animating just outside the screen so nothing pops
+
+
+class AvatarPool:
+    """
+    Animations for remote players.
+    Avatars of players that leave the map go to a spare list and are handed to the next
+    player that shows up instead of building a new Animation (and they all share one frame
+    set per sheet and scale anyway). Only avatars inside the camera view are animated and drawn.
+    """
+    def __init__(self, image_path: str = "character/ow1.png"):
+        self.image_path = image_path
+        self._avatars: dict[int, Animation] = {} # pid -> avatar, players on our map
+        self._spare: list[Animation] = []
+        self._visible: list[tuple[int, Animation, bool]] = [] # (pid, avatar, is_moving) in view this frame
+
+    def _acquire(self) -> Animation:
+        if self._spare:
+            return self._spare.pop()
+        return Animation(
+            self.image_path,
+            ["down", "left", "right", "up"],
+            4,
+            (GameSettings.TILE_SIZE, GameSettings.TILE_SIZE)
+        )
+
+    def _release(self, pid: int) -> None:
+        anim = self._avatars.pop(pid)
+        if len(self._spare) < MAX_SPARE:
+            anim.accumulator = 0
+            self._spare.append(anim)
+
+    def update(self, players: list[dict], map_name: str, scale: float, camera: PositionCamera, dt: float) -> None:
+        view = pg.Rect(camera.x, camera.y, GameSettings.SCREEN_WIDTH, GameSettings.SCREEN_HEIGHT).inflate(CULL_MARGIN * 2, CULL_MARGIN * 2)
+
+        here = {p["id"]: p for p in players if p.get("map") == map_name}
+        for pid in [pid for pid in self._avatars if pid not in here]:
+            self._release(pid)
+
+        self._visible = []
+        for pid, player in here.items():
+            anim = self._avatars.get(pid)
+            if anim is None:
+                anim = self._avatars[pid] = self._acquire()
+            if anim.scale != scale:
+                anim.set_scale(scale) # dict lookup once the frames at this scale exist
+
+            # Interpolated position (OnlineManager's jitter buffer)
+            anim.position = Position(player["x"], player["y"])
+            anim.rect.topleft = (int(anim.position.x), int(anim.position.y))
+            if not view.colliderect(anim.rect):
+                continue
+
+            direction = player.get("direction", "down")
+            if "none" in direction:
+                direction = "down"
+            anim.switch(direction)
+
+            # Animate if moving, freeze if stopped
+            is_moving = player.get("is_moving", False)
+            if is_moving:
+                anim.update(dt)
+            else:
+                anim.accumulator = 0 # Reset to first frame when stopped
+            self._visible.append((pid, anim, is_moving))
+
+    def draw(self, screen: pg.Surface, camera: PositionCamera) -> None:
+        for _, anim, is_moving in self._visible:
+            anim.draw(screen, camera, key_press=is_moving)
+
+    def visible(self) -> Iterator[tuple[int, Animation]]:
+        """ (pid, avatar) of the remote players on screen, as of the last update() """
+        for pid, anim, _ in self._visible:
+            yield pid, anim
+
+    def clear(self) -> None:
+        for pid in list(self._avatars):
+            self._release(pid)
+        self._visible = []
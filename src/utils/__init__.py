@@ -4,6 +4,7 @@ from .logger import Logger
 from .settings import GameSettings
 from .loader import load_tmx, load_img, load_font, load_sound
 from .definition import Position, PositionCamera, Direction, MouseBtn, Key, Teleport
+from .interpolation import RemotePlayerBuffer, BufferView, predict
 
 __all__ = [
     "Logger",
@@ -18,4 +19,7 @@ __all__ = [
     "MouseBtn",
     "Key",
     "Teleport",
+    "RemotePlayerBuffer",
+    "BufferView",
+    "predict",
 ]
\ No newline at end of file
@@ -0,0 +1,146 @@
+from bisect import bisect_right
+from collections import deque
+from dataclasses import dataclass, field
+
+from .settings import GameSettings
+
+DIRECTION_VECTORS = {"down": (0.0, 1.0), "left": (-1.0, 0.0), "right": (1.0, 0.0), "up": (0.0, -1.0)}
+WALK_SPEED = 4.0 * GameSettings.TILE_SIZE # same as Player.speed
+MAX_SAMPLES = 32
+CLOCK_WINDOW = 5.0 # seconds of clock offset samples, the smallest one is the least delayed
+
+
+def predict(x: float, y: float, direction: str, is_moving: bool, dt: float) -> tuple[float, float]:
+    """ Where a player is `dt` seconds later if it keeps doing what it did. OnlineManager sends when reality drifts from this """
+    if not is_moving:
+        return x, y
+    dx, dy = DIRECTION_VECTORS.get(direction, (0.0, 0.0))
+    return x + dx * WALK_SPEED * dt, y + dy * WALK_SPEED * dt
+
+
+@dataclass(frozen=True)
+class Sample:
+    t: float # server time
+    x: float
+    y: float
+    map: str
+    direction: str
+    is_moving: bool
+
+
+@dataclass(frozen=True)
+class BufferView:
+    """
+    What a RemotePlayerBuffer held after its last push(). Never changed, so the game
+    loop can sample() it every frame while the network side pushes the next snapshot.
+    """
+    samples: dict[int, tuple[Sample, ...]] = field(default_factory=dict) # oldest first
+    offset: float = 0.0 # local clock - server clock
+    delay: float = 0.0
+    extrapolate_limit: float = 0.0
+
+    def sample(self, local_now: float) -> list[dict]:
+        render_time = local_now - self.offset - self.delay
+        return [self._at(pid, samples, render_time) for pid, samples in self.samples.items()]
+
+    def _at(self, pid: int, samples: tuple[Sample, ...], t: float) -> dict:
+        i = bisect_right(samples, t, key=lambda s: s.t) # samples[i - 1].t <= t < samples[i].t
+        if i == 0:
+            a = samples[0]
+            return self._to_dict(pid, a, a.x, a.y)
+        a = samples[i - 1]
+        if i < len(samples):
+            b = samples[i]
+            if a.map != b.map: # teleported, no sliding across maps
+                return self._to_dict(pid, a, a.x, a.y)
+            f = (t - a.t) / (b.t - a.t)
+            return self._to_dict(pid, a, a.x + (b.x - a.x) * f, a.y + (b.y - a.y) * f)
+
+        # ran out of samples (or the sender is dead reckoning), keep walking for a bit
+        x, y = predict(a.x, a.y, a.direction, a.is_moving, min(t - a.t, self.extrapolate_limit))
+        return self._to_dict(pid, a, x, y)
+
+    @staticmethod
+    def _to_dict(pid: int, s: Sample, x: float, y: float) -> dict:
+        return {"id": pid, "x": x, "y": y, "map": s.map, "direction": s.direction, "is_moving": s.is_moving}
+
+
+class RemotePlayerBuffer:
+    """
+    Jitter buffer for remote players.
+    push() every snapshot as it arrives (stamped with the server's "time"), sample() `view`
+    once per frame. Players are shown `delay` seconds behind the server, interpolated between
+    the two samples around that time, or extrapolated from direction/is_moving for at most
+    `extrapolate_limit` seconds when the next sample is late.
+    push() isn't thread safe, OnlineManager calls it under its lock and publishes `view`.
+    """
+    def __init__(self, delay: float, extrapolate_limit: float):
+        self.delay = delay
+        self.extrapolate_limit = extrapolate_limit
+        self._samples: dict[int, deque[Sample]] = {}
+        self._clock: deque[tuple[float, float]] = deque() # (local time, local - server)
+        self._offset = 0.0
+        self._last_time: float | None = None # server time of the previous snapshot
+        self.view = BufferView(delay=delay, extrapolate_limit=extrapolate_limit)
+
+    def clear(self) -> None:
+        self._samples.clear()
+        self._last_time = None
+        self.view = BufferView(delay=self.delay, extrapolate_limit=self.extrapolate_limit)
+
+    def push(self, data: dict, local_now: float, exclude: int = -1) -> None:
+        server_time = data.get("time")
+        if server_time:
+            self._observe_clock(local_now, float(server_time))
+            stamp = float(server_time)
+        else: # old server, our receive time is the best we have
+            self._offset = 0.0
+            stamp = local_now
+
+        if data.get("full", True):
+            keep = {int(pid) for pid in data.get("players", {})}
+            for pid in [pid for pid in self._samples if pid not in keep]:
+                del self._samples[pid]
+        for pid in data.get("removed", []):
+            self._samples.pop(int(pid), None)
+
+        for p in data.get("players", {}).values():
+            pid = int(p["id"])
+            if pid == exclude:
+                continue
+            sample = Sample(stamp, float(p["x"]), float(p["y"]), p.get("map", ""),
+                            p.get("direction", "down"), bool(p.get("is_moving", False)))
+            samples = self._samples.get(pid)
+            if samples is None:
+                self._samples[pid] = deque([sample], maxlen=MAX_SAMPLES)
+                continue
+            last = samples[-1]
+            if stamp <= last.t: # same snapshot twice, or out of order
+                if stamp == last.t:
+                    samples[-1] = sample
+                continue
+            # Deltas skip players that didn't send anything, so as of the previous snapshot it was
+            # still where we'd predict it (dead reckoning). Without this the move would be smeared
+            # over the quiet time.
+            if self._last_time is not None and last.t < self._last_time < stamp:
+                dt = min(self._last_time - last.t, self.extrapolate_limit)
+                x, y = predict(last.x, last.y, last.direction, last.is_moving, dt)
+                samples.append(Sample(self._last_time, x, y, last.map, last.direction, last.is_moving))
+            samples.append(sample)
+        self._last_time = stamp
+        self._publish(local_now)
+
+    def _publish(self, local_now: float) -> None:
+        render_time = local_now - self._offset - self.delay
+        view = {}
+        for pid, samples in self._samples.items():
+            while len(samples) >= 2 and samples[1].t <= render_time: # older than what we'll ever need again
+                samples.popleft()
+            view[pid] = tuple(samples)
+        self.view = BufferView(view, self._offset, self.delay, self.extrapolate_limit)
+
+    def _observe_clock(self, local_now: float, server_time: float) -> None:
+        self._clock.append((local_now, local_now - server_time))
+        while self._clock and self._clock[0][0] < local_now - CLOCK_WINDOW:
+            self._clock.popleft()
+        self._offset = min(offset for _, offset in self._clock)
@@ -17,5 +17,16 @@ class Settings:
     # Online
     IS_ONLINE: bool = False
     ONLINE_SERVER_URL: str = "http://localhost:8989"
+    ONLINE_BACKEND: str = "threads" # "threads" (one thread per loop) or "asyncio" (one event loop, pooled connections)
+    ONLINE_PROCESS: bool = False # run the network client in a child process, remote players come back through shared memory
+    ONLINE_TRANSPORT: str = "http"  # "http" (polling), "sync" (one POST /sync per tick) or "stream" (needs server.py --stream-port)
+    ONLINE_STREAM_PORT: int = 8990
+    ONLINE_UDP: bool = False        # send position updates over UDP (needs server.py --udp-port), http/sync transports only
+    ONLINE_UDP_PORT: int = 8991
+    ONLINE_ENCODING: str = "binary"  # "binary" (compact player records) or "json", binary only once the server has shown it reads it
+    ONLINE_INTEREST_RADIUS: int = 0 # Only receive players within this many tiles, 0 = whole map
+    ONLINE_INTERP_DELAY: float = 0.1 # remote players are drawn this far in the past, interpolated between snapshots
+    ONLINE_EXTRAPOLATE_LIMIT: float = 1.25 # keep a moving remote player walking this long without news, > the 1s keepalive
+    ONLINE_DEAD_RECKONING: bool = True # only send our position when others can't predict it, False = every frame
     
 GameSettings = Settings()
\ No newline at end of file
@@ -0,0 +1,5 @@
+import os
+
+# the client modules initialise pygame on import, tests run without a display or sound card
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
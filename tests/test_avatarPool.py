@@ -0,0 +1,58 @@
+import pygame as pg
+import pytest
+
+import src.core # the game imports this first, src.sprites on its own is a circular import
+from src.sprites import avatar_pool
+from src.sprites.avatar_pool import AvatarPool
+from src.utils import GameSettings, PositionCamera
+
+
+@pytest.fixture(scope="module", autouse=True)
+def display():
+    pg.display.init()
+    pg.display.set_mode((1, 1)) # images are convert_alpha()ed
+    yield
+    pg.display.quit()
+
+
+def _player(pid: int, x: float, y: float = 0.0, map_name: str = "map.tmx", is_moving: bool = False) -> dict:
+    return {"id": pid, "x": x, "y": y, "map": map_name, "direction": "left", "is_moving": is_moving}
+
+
+def test_avatars_leaving_the_map_are_reused():
+    pool = AvatarPool()
+    camera = PositionCamera(0, 0)
+    pool.update([_player(1, 0.0), _player(2, 64.0)], "map.tmx", 1.0, camera, 0.016)
+    first = dict(pool.visible())
+
+    pool.update([_player(2, 64.0), _player(3, 0.0, map_name="house.tmx")], "map.tmx", 1.0, camera, 0.016)
+    assert [pid for pid, _ in pool.visible()] == [2] # 3 is on another map
+    pool.update([_player(2, 64.0), _player(4, 0.0)], "map.tmx", 1.0, camera, 0.016)
+    avatars = dict(pool.visible())
+    assert avatars[4] is first[1] # 1's avatar, not a new Animation
+    assert avatars[2] is first[2]
+    assert avatars[4].o_animations is avatars[2].o_animations # one frame set per sheet
+
+
+def test_spare_avatars_are_capped(monkeypatch):
+    monkeypatch.setattr(avatar_pool, "MAX_SPARE", 2)
+    pool = AvatarPool()
+    pool.update([_player(pid, 0.0) for pid in range(5)], "map.tmx", 1.0, PositionCamera(0, 0), 0.016)
+    pool.clear()
+    assert len(pool._spare) == 2
+    assert list(pool.visible()) == []
+
+
+def test_only_avatars_in_view_are_animated():
+    pool = AvatarPool()
+    far = GameSettings.SCREEN_WIDTH + avatar_pool.CULL_MARGIN + GameSettings.TILE_SIZE
+    near = GameSettings.SCREEN_WIDTH + avatar_pool.CULL_MARGIN // 2 # just off screen, inside the margin
+    players = [_player(1, 0.0, is_moving=True), _player(2, far, is_moving=True), _player(3, near, is_moving=True)]
+    pool.update(players, "map.tmx", 1.0, PositionCamera(0, 0), 0.1)
+    assert sorted(pid for pid, _ in pool.visible()) == [1, 3]
+    culled = pool._avatars[2]
+    assert culled.accumulator == 0 # not animated
+    assert pool._avatars[1].accumulator > 0
+
+    pool.update(players, "map.tmx", 1.0, PositionCamera(far, 0), 0.1) # camera moved over
+    assert 2 in dict(pool.visible())
@@ -0,0 +1,52 @@
+import threading
+
+from server.chatHandler import ChatHandler
+
+
+def _ids(messages):
+    return [m["id"] for m in messages]
+
+
+def test_ids_are_stable_and_increasing():
+    chat = ChatHandler()
+    assert chat.last_id == 0
+    assert [chat.post(1, f"hi {i}")["id"] for i in range(3)] == [1, 2, 3]
+    assert _ids(chat.list_messages()) == [1, 2, 3]
+    assert _ids(chat.list_messages(2)) == [3]
+    assert chat.list_messages(3) == []
+
+
+def test_ring_wraparound_keeps_ids():
+    chat = ChatHandler(max_messages=4)
+    for i in range(10):
+        chat.post(1, f"msg {i}")
+    assert chat.last_id == 10
+    assert _ids(chat.list_messages()) == [7, 8, 9, 10] # the rest fell off
+    assert _ids(chat.list_messages(2)) == [7, 8, 9, 10] # cursor older than the ring, everything we still have
+    assert _ids(chat.list_messages(8)) == [9, 10]
+    assert [m["text"] for m in chat.list_messages(8)] == ["msg 8", "msg 9"]
+
+
+def test_cursor_from_before_a_restart_starts_over():
+    chat = ChatHandler()
+    chat.post(1, "a")
+    chat.post(1, "b")
+    assert _ids(chat.list_messages(50)) == [1, 2]
+
+
+def test_load_continues_the_id_sequence():
+    chat = ChatHandler(max_messages=4)
+    for i in range(6):
+        chat.post(1, f"msg {i}")
+    restored = ChatHandler(max_messages=4)
+    restored.load(chat.dump())
+    assert _ids(restored.list_messages()) == [3, 4, 5, 6]
+    assert restored.post(2, "back")["id"] == 7
+    assert _ids(restored.list_messages(5)) == [6, 7]
+
+
+def test_wait_messages_wakes_up_on_post():
+    chat = ChatHandler()
+    threading.Timer(0.05, chat.post, (1, "hello")).start()
+    assert _ids(chat.wait_messages(0, 5.0)) == [1]
+    assert chat.wait_messages(1, 0.01) == []
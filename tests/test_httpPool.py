@@ -0,0 +1,73 @@
+import asyncio
+
+import pytest
+
+from src.core.managers.async_online_manager import HttpPool
+
+
+class FlakyServer:
+    """ Answers every request with 200 keep-alive, except that it drops the connection on the requests listed in `drop` """
+    def __init__(self, drop: set[int] = frozenset(), close_idle: bool = False):
+        self.drop = drop
+        self.close_idle = close_idle
+        self.requests: list[str] = []
+        self.connections = 0
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.connections += 1
+        try:
+            while head := await reader.readuntil(b"\r\n\r\n"):
+                length = next(int(line.split(b":")[1]) for line in head.split(b"\r\n") if line.lower().startswith(b"content-length"))
+                await reader.readexactly(length)
+                self.requests.append(head.split(b" ", 1)[0].decode())
+                if len(self.requests) in self.drop:
+                    break # got it, then died before answering
+                writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nok")
+                await writer.drain()
+                if self.close_idle:
+                    break
+        except asyncio.IncompleteReadError:
+            pass
+        writer.close()
+
+
+def _run(server: FlakyServer, requests: list[str]) -> list:
+    async def run():
+        srv = await asyncio.start_server(server.handle, "127.0.0.1", 0)
+        pool = HttpPool(f"http://127.0.0.1:{srv.sockets[0].getsockname()[1]}")
+        results = []
+        try:
+            for method in requests:
+                try:
+                    resp = await pool.request(method, "/chat", json_body={"text": "hi"} if method == "POST" else None)
+                    results.append(resp.status_code)
+                except ConnectionError as e:
+                    results.append(type(e))
+                await asyncio.sleep(0.05)
+        finally:
+            pool.close()
+            srv.close()
+        return results
+    return asyncio.run(run())
+
+
+def test_get_is_retried_when_a_reused_connection_dies():
+    server = FlakyServer(drop={2})
+    assert _run(server, ["GET", "GET"]) == [200, 200]
+    assert server.requests == ["GET", "GET", "GET"]
+    assert server.connections == 2
+
+
+def test_post_is_not_sent_twice():
+    server = FlakyServer(drop={2})
+    results = _run(server, ["GET", "POST", "GET"])
+    assert results[0] == 200 and issubclass(results[1], ConnectionError) and results[2] == 200
+    assert server.requests == ["GET", "POST", "GET"]
+
+
+@pytest.mark.parametrize("method", ["GET", "POST"])
+def test_connection_closed_while_idle_is_skipped(method):
+    server = FlakyServer(close_idle=True)
+    assert _run(server, ["GET", method]) == [200, 200]
+    assert server.requests == ["GET", method]
+    assert server.connections == 2
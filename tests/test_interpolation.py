@@ -0,0 +1,86 @@
+import pytest
+
+from src.utils.interpolation import RemotePlayerBuffer, WALK_SPEED, predict
+
+
+def _snapshot(t: float, *players: dict, full: bool = True, removed=()) -> dict:
+    return {"time": t, "full": full, "players": {str(p["id"]): p for p in players}, "removed": list(removed)}
+
+
+def _player(pid: int, x: float, y: float = 0.0, map_name: str = "map.tmx", direction: str = "right", is_moving: bool = True) -> dict:
+    return {"id": pid, "x": x, "y": y, "map": map_name, "direction": direction, "is_moving": is_moving}
+
+
+def _x(buffer: RemotePlayerBuffer, local_now: float, pid: int = 1) -> float:
+    return next(p["x"] for p in buffer.view.sample(local_now) if p["id"] == pid)
+
+
+def test_predict_walks_in_the_facing_direction():
+    assert predict(10.0, 20.0, "up", True, 0.5) == (10.0, 20.0 - WALK_SPEED * 0.5)
+    assert predict(10.0, 20.0, "up", False, 0.5) == (10.0, 20.0)
+
+
+def test_samples_are_interpolated_behind_the_server():
+    buffer = RemotePlayerBuffer(delay=0.1, extrapolate_limit=0.25)
+    buffer.push(_snapshot(100.0, _player(1, 0.0)), local_now=100.0)
+    buffer.push(_snapshot(100.1, _player(1, 10.0)), local_now=100.1)
+    assert _x(buffer, 100.0) == 0.0 # before the first sample, hold it
+    assert _x(buffer, 100.15) == pytest.approx(5.0)
+    assert _x(buffer, 100.2) == pytest.approx(10.0)
+
+
+def test_clock_offset_comes_from_the_least_delayed_snapshot():
+    buffer = RemotePlayerBuffer(delay=0.5, extrapolate_limit=0.0)
+    buffer.push(_snapshot(50.0, _player(1, 0.0)), local_now=1000.0)
+    buffer.push(_snapshot(50.1, _player(1, 10.0)), local_now=1000.3) # arrived late
+    assert buffer.view.offset == pytest.approx(950.0)
+    assert _x(buffer, 1000.55) == pytest.approx(5.0)
+
+
+def test_extrapolation_stops_at_the_limit():
+    buffer = RemotePlayerBuffer(delay=0.0, extrapolate_limit=0.25)
+    buffer.push(_snapshot(10.0, _player(1, 0.0)), local_now=10.0)
+    assert _x(buffer, 10.1) == pytest.approx(WALK_SPEED * 0.1)
+    assert _x(buffer, 12.0) == pytest.approx(WALK_SPEED * 0.25)
+
+    buffer.push(_snapshot(10.5, _player(1, 0.0, is_moving=False)), local_now=10.5)
+    assert _x(buffer, 12.0) == 0.0 # standing still isn't extrapolated
+
+
+def test_map_change_does_not_slide_between_maps():
+    buffer = RemotePlayerBuffer(delay=1.0, extrapolate_limit=0.0)
+    buffer.push(_snapshot(10.0, _player(1, 0.0)), local_now=10.0)
+    buffer.push(_snapshot(11.0, _player(1, 500.0, map_name="house.tmx")), local_now=11.0)
+    first = buffer.view.sample(11.5)[0]
+    assert (first["x"], first["map"]) == (0.0, "map.tmx")
+    later = buffer.view.sample(12.0)[0]
+    assert (later["x"], later["map"]) == (500.0, "house.tmx")
+
+
+def test_quiet_player_in_a_delta_is_dead_reckoned_until_the_previous_snapshot():
+    buffer = RemotePlayerBuffer(delay=1.0, extrapolate_limit=1.0)
+    buffer.push(_snapshot(10.0, _player(1, 0.0), _player(2, 0.0)), local_now=10.0)
+    buffer.push(_snapshot(10.5, _player(2, 5.0), full=False), local_now=10.5) # 1 said nothing
+    buffer.push(_snapshot(11.0, _player(1, WALK_SPEED * 0.5, is_moving=False), full=False), local_now=11.0)
+    # it kept walking until 10.5 as predicted, then stopped: no smearing over 10.0 .. 11.0
+    assert _x(buffer, 11.25) == pytest.approx(WALK_SPEED * 0.25)
+    assert _x(buffer, 11.75) == pytest.approx(WALK_SPEED * 0.5)
+
+
+def test_full_snapshots_and_removals_drop_players():
+    buffer = RemotePlayerBuffer(delay=0.0, extrapolate_limit=0.0)
+    buffer.push(_snapshot(1.0, _player(1, 0.0), _player(2, 0.0), _player(3, 0.0)), local_now=1.0, exclude=3)
+    assert {p["id"] for p in buffer.view.sample(1.0)} == {1, 2} # ourselves excluded
+    buffer.push(_snapshot(2.0, full=False, removed=[2]), local_now=2.0)
+    assert {p["id"] for p in buffer.view.sample(2.0)} == {1}
+    buffer.push(_snapshot(3.0, _player(4, 0.0)), local_now=3.0)
+    assert {p["id"] for p in buffer.view.sample(3.0)} == {4}
+
+
+def test_old_view_is_not_changed_by_a_push():
+    buffer = RemotePlayerBuffer(delay=0.0, extrapolate_limit=0.0)
+    buffer.push(_snapshot(1.0, _player(1, 0.0)), local_now=1.0)
+    view = buffer.view
+    buffer.push(_snapshot(2.0, _player(1, 10.0)), local_now=2.0)
+    assert view.sample(5.0)[0]["x"] == 0.0
+    assert buffer.view.sample(5.0)[0]["x"] == 10.0
@@ -0,0 +1,38 @@
+from server.metrics import Registry, Counter
+
+
+def test_counter_render_and_dict():
+    reg = Registry()
+    c = reg.counter("requests_total", "Requests", ("method", "code"))
+    c.inc(("GET", 200))
+    c.inc(("GET", 200), 2)
+    c.inc(("POST", 404))
+    text = reg.render()
+    assert "# TYPE requests_total counter" in text
+    assert 'requests_total{method="GET",code="200"} 3' in text
+    assert 'requests_total{method="POST",code="404"} 1' in text
+    assert reg.to_dict() == {"requests_total": {"GET,200": 3, "POST,404": 1}}
+
+
+def test_histogram_buckets_are_cumulative():
+    reg = Registry()
+    h = reg.histogram("latency_seconds", "Latency", ("route",), buckets=(0.1, 1.0))
+    for v in (0.05, 0.1, 0.5, 2.0):
+        h.observe(("/players",), v)
+    lines = reg.render().splitlines()
+    assert 'latency_seconds_bucket{route="/players",le="0.1"} 2' in lines # le is inclusive
+    assert 'latency_seconds_bucket{route="/players",le="1.0"} 3' in lines
+    assert 'latency_seconds_bucket{route="/players",le="+Inf"} 4' in lines
+    assert 'latency_seconds_count{route="/players"} 4' in lines
+    d = reg.to_dict()["latency_seconds"]["/players"]
+    assert d["count"] == 4 and abs(d["sum"] - 2.65) < 1e-9 and abs(d["avg"] - 2.65 / 4) < 1e-9
+
+
+def test_gauge_is_read_at_scrape_time_and_counters_register_once():
+    reg = Registry()
+    players = {("map.tmx",): 1}
+    reg.gauge("players_active", "Players", ("map",), lambda: players)
+    players[("map.tmx",)] = 5
+    assert 'players_active{map="map.tmx"} 5' in reg.render()
+    first = reg.counter("x_total", "X")
+    assert isinstance(first, Counter) and reg.counter("x_total", "X") is first
@@ -0,0 +1,238 @@
+import time
+
+import pytest
+
+from src.core.managers.online_manager import (
+    OnlineManager, ConnectionState, SYNC_CHAT_BATCH, DRIFT_THRESHOLD, KEEPALIVE_INTERVAL,
+    POLL_INTERVAL, POLL_IDLE, POLL_ALONE, NEARBY_DISTANCE, RECONNECT_DELAY, MAX_RECONNECT_DELAY, MAX_SEND_INTERVAL,
+)
+from src.utils import GameSettings
+from src.utils.interpolation import WALK_SPEED
+
+
+class FakeResponse:
+    def __init__(self, status_code: int, data: dict, headers: dict | None = None):
+        self.status_code = status_code
+        self._data = data
+        self.headers = headers or {}
+
+    def json(self) -> dict:
+        return self._data
+
+
+def _manager() -> OnlineManager:
+    om = OnlineManager()
+    om.player_id = 1
+    return om
+
+
+def _sync_reply(**chat) -> FakeResponse:
+    players = {"version": 1, "full": True, "players": {}, "removed": [], "time": time.time()}
+    return FakeResponse(200, {"players": players, "chat": {"messages": [], "last_id": 0, **chat}})
+
+
+def test_sync_sends_at_most_the_chat_burst():
+    om = _manager()
+    for i in range(8):
+        om.send_chat(f"msg {i}")
+    body, _, texts = om._sync_request()
+    assert body["chat"] == texts == [f"msg {i}" for i in range(SYNC_CHAT_BATCH)]
+    om._on_sync(_sync_reply(), None, texts)
+    assert om._sync_request()[2] == ["msg 5", "msg 6", "msg 7"]
+
+
+def test_sync_puts_rejected_chat_back_in_order():
+    om = _manager()
+    for i in range(4):
+        om.send_chat(f"msg {i}")
+    _, _, texts = om._sync_request()
+    om.send_chat("later")
+    om._on_sync(_sync_reply(rejected=2, retry_after=0.0), None, texts)
+    assert om._sync_request()[2] == ["msg 2", "msg 3", "later"]
+
+
+def test_sync_holds_chat_back_until_retry_after():
+    om = _manager()
+    om.send_chat("a")
+    om.send_chat("b")
+    _, _, texts = om._sync_request()
+    om._on_sync(_sync_reply(rejected=1, retry_after=30.0), None, texts)
+    body, _, texts = om._sync_request() # the position and the poll still go out
+    assert texts == [] and body["chat"] == []
+    om._chat_retry_at = 0.0
+    assert om._sync_request()[2] == ["b"]
+
+
+def test_failed_sync_keeps_update_and_chat():
+    om = _manager()
+    om.update(64.0, 0.0, "map.tmx")
+    om.send_chat("a")
+    _, update, texts = om._sync_request()
+    om.send_chat("b")
+    om._on_sync(FakeResponse(429, {"error": "rate_limited", "retry_after": 0.05}), update, texts)
+    _, again, texts = om._sync_request()
+    assert again == update
+    assert texts == ["a", "b"]
+
+
+def test_binary_updates_only_after_the_server_advertises_them(monkeypatch):
+    monkeypatch.setattr(GameSettings, "ONLINE_ENCODING", "binary")
+    om = OnlineManager()
+    om._on_register(FakeResponse(200, {"id": 3, "token": "t"})) # older server, no "encodings"
+    assert om._binary is False
+    om._on_register(FakeResponse(200, {"id": 3, "token": "t", "encodings": ["json", "binary"]}))
+    assert om._binary is True
+
+    monkeypatch.setattr(GameSettings, "ONLINE_ENCODING", "json")
+    om._on_register(FakeResponse(200, {"id": 3, "token": "t", "encodings": ["json", "binary"]}))
+    assert om._binary is False
+
+
+def test_rejected_binary_update_falls_back_to_json():
+    om = _manager()
+    om._binary = True
+    update = {"x": 1.0, "y": 2.0, "map": "m", "direction": "down", "is_moving": False}
+    assert om._on_update(FakeResponse(415, {}), update, binary=True) is False
+    assert om._binary is False
+    assert om._latest_update == update # goes out again, as JSON this time
+
+
+def test_stream_reconnects_after_an_unexpected_error(monkeypatch):
+    import contextlib
+    import src.core.managers.online_manager as online_manager
+
+    class FakeSocket:
+        def setsockopt(self, *args):
+            pass
+
+    monkeypatch.setattr(online_manager.socket, "create_connection", lambda *a, **kw: contextlib.nullcontext(FakeSocket()))
+    om = _manager()
+    sessions = []
+
+    def session(sock):
+        sessions.append(sock)
+        if len(sessions) == 1:
+            raise KeyError("id") # a message we couldn't handle
+        om._stop_event.set()
+
+    monkeypatch.setattr(om, "_stream_session", session)
+    monkeypatch.setattr(om, "_backoff_delay", lambda: 0.0)
+    om._stream_loop()
+    assert len(sessions) == 2
+    assert om._failures == 1
+
+
+def test_players_poll_echoes_the_etag_and_skips_a_304():
+    om = _manager()
+    snapshot = {"version": 3, "full": True, "players": {"2": {"id": 2, "x": 1.0, "y": 2.0, "map": "m"}}, "removed": [], "time": time.time()}
+    assert om._on_players(FakeResponse(200, snapshot, {"ETag": '"p3"'})) is False
+    assert om._players_request()[1]["If-None-Match"] == '"p3"'
+    players = om.get_list_players()
+
+    class NotModified(FakeResponse):
+        def json(self):
+            raise AssertionError("a 304 has no body")
+
+    assert om._on_players(NotModified(304, {})) is False
+    assert om.get_list_players() == players
+    assert om._players_request()[1]["If-None-Match"] == '"p3"'
+
+
+def test_chat_poll_keeps_its_etag_over_a_304():
+    om = _manager()
+    reply = {"messages": [{"id": 1, "from": 2, "text": "hi"}], "last_id": 1}
+    assert om._on_chat(FakeResponse(200, reply, {"ETag": '"c1"'})) is True
+    assert om._on_chat(FakeResponse(304, {})) is True
+    assert om._chat_etag == '"c1"'
+    assert [m["text"] for m in om.get_recent_chat()] == ["hi"]
+
+
+def _state(x: float, direction: str = "right", is_moving: bool = True, map_name: str = "map.tmx") -> dict:
+    return {"x": x, "y": 0.0, "map": map_name, "direction": direction, "is_moving": is_moving}
+
+
+def test_dead_reckoning_skips_what_others_can_predict():
+    om = _manager()
+    assert om._should_send(_state(0.0), 10.0) is True # nothing sent yet
+    om._sent_state = (_state(0.0), 10.0)
+    on_track = WALK_SPEED * 0.2
+    assert om._should_send(_state(on_track), 10.2) is False
+    assert om._should_send(_state(on_track + DRIFT_THRESHOLD * 0.9), 10.2) is False
+    assert om._should_send(_state(on_track + DRIFT_THRESHOLD * 1.1), 10.2) is True # bumped into something
+    assert om._should_send(_state(on_track, direction="up"), 10.2) is True
+    assert om._should_send(_state(on_track, is_moving=False), 10.2) is True
+    assert om._should_send(_state(on_track, map_name="house.tmx"), 10.2) is True
+    assert om._should_send(_state(WALK_SPEED * KEEPALIVE_INTERVAL), 10.0 + KEEPALIVE_INTERVAL) is True
+
+
+def test_update_only_queues_what_has_to_be_sent(monkeypatch):
+    monkeypatch.setattr(GameSettings, "ONLINE_DEAD_RECKONING", True)
+    om = _manager()
+    assert om.update(0.0, 0.0, "map.tmx", "down", False)
+    assert om._latest_update == _state(0.0, "down", False)
+    om._latest_update = None
+    assert om.update(0.0, 0.0, "map.tmx", "down", False) # standing still, predicted exactly
+    assert om._latest_update is None
+
+    monkeypatch.setattr(GameSettings, "ONLINE_DEAD_RECKONING", False)
+    assert om.update(0.0, 0.0, "map.tmx", "down", False)
+    assert om._latest_update == _state(0.0, "down", False)
+
+
+@pytest.mark.parametrize("failures, delay", [
+    (1, RECONNECT_DELAY), (2, RECONNECT_DELAY * 2), (3, RECONNECT_DELAY * 4), (50, MAX_RECONNECT_DELAY),
+])
+def test_backoff_doubles_with_jitter(failures, delay):
+    om = _manager()
+    om._failures = failures
+    delays = [om._backoff_delay() for _ in range(200)]
+    assert all(delay / 2 <= d <= delay for d in delays)
+    assert len(set(delays)) > 1 # clients don't retry in lockstep
+
+
+def _publish_players(om: OnlineManager, *players: dict) -> None:
+    with om._lock:
+        om._publish(players=players)
+
+
+def test_poll_delay_follows_activity_nearby():
+    om = _manager()
+    assert om._poll_delay() == POLL_ALONE
+    om._sent_state = (_state(0.0, is_moving=False), 0.0)
+    _publish_players(om, {"id": 2, **_state(64.0, is_moving=False)})
+    assert om._poll_delay() == POLL_IDLE
+    _publish_players(om, {"id": 2, **_state(NEARBY_DISTANCE * 2)}) # moving, but far away
+    assert om._poll_delay() == POLL_IDLE
+    _publish_players(om, {"id": 2, **_state(64.0)})
+    assert om._poll_delay() == POLL_INTERVAL
+    om._sent_state = (_state(0.0), 0.0) # we move, so what's near us changes
+    _publish_players(om, {"id": 2, **_state(64.0, is_moving=False)})
+    assert om._poll_delay() == POLL_INTERVAL
+
+    om._intervals["poll"] = 0.5 # stretched by 429s
+    assert om._poll_delay() == 0.5
+    om._failures = 1
+    assert om._poll_delay() <= RECONNECT_DELAY
+
+
+def test_429_stretches_the_interval_and_200_eases_it_back():
+    om = _manager()
+    assert om._rate_limited("poll", FakeResponse(429, {"retry_after": 0.2})) is True
+    assert om._intervals["poll"] == 0.2
+    assert om._rate_limited("poll", FakeResponse(429, {})) is True
+    assert om._intervals["poll"] == 1.0 # Retry-After header default, one second
+    assert om._rate_limited("poll", FakeResponse(429, {"retry_after": 90.0})) is True
+    assert om._intervals["poll"] == MAX_SEND_INTERVAL
+    assert om._rate_limited("poll", FakeResponse(200, {})) is False
+    assert om._intervals["poll"] == MAX_SEND_INTERVAL * 0.95
+
+
+def test_connection_state():
+    om = OnlineManager()
+    assert om.connection_state == ConnectionState.CONNECTING
+    om._on_register(FakeResponse(200, {"id": 4, "token": "t"}))
+    assert om.connection_state == ConnectionState.ONLINE
+    om._connection_failed(ConnectionError("refused"))
+    assert om.connection_state == ConnectionState.RECONNECTING
+    om._on_chat(FakeResponse(304, {}))
+    assert om.connection_state == ConnectionState.ONLINE
@@ -0,0 +1,230 @@
+import json
+import math
+
+import pytest
+
+import server.playerHandler as playerHandler
+from server.playerHandler import PlayerHandler, interest_radius
+from server.protocol import decode_snapshot
+
+
+def _remove(handler: PlayerHandler, pid: int) -> None:
+    with handler._lock: # what the cleaner does when a player times out
+        handler._remove(pid)
+
+
+def test_delta_lists_changes_and_removals_since():
+    h = PlayerHandler()
+    a, _ = h.register()
+    b, _ = h.register()
+    c, _ = h.register()
+    since = h.version
+
+    h.update(a, 64.0, 0.0, "map.tmx")
+    h.update(b, 0.0, 0.0, "") # no change, no new version
+    _remove(h, c)
+
+    delta = h.list_players_since(since)
+    assert delta["full"] is False
+    assert delta["version"] == h.version == since + 2
+    assert set(delta["players"]) == {a}
+    assert delta["players"][a]["x"] == 64.0
+    assert delta["removed"] == [c]
+    assert h.list_players_since(h.version)["players"] == {}
+
+
+def test_since_below_tombstone_floor_gets_a_full_snapshot(monkeypatch):
+    monkeypatch.setattr(playerHandler, "MAX_TOMBSTONES", 2)
+    h = PlayerHandler()
+    pids = [h.register()[0] for _ in range(5)]
+    since = h.version
+    for pid in pids[:3]:
+        _remove(h, pid) # the first tombstone falls off
+
+    delta = h.list_players_since(since)
+    assert delta["full"] is True
+    assert set(delta["players"]) == set(pids[3:])
+    assert delta["removed"] == []
+
+    # a cursor at the floor has seen the forgotten removal, it still gets a delta
+    delta = h.list_players_since(h._tombstone_floor)
+    assert delta["full"] is False
+    assert delta["removed"] == [pids[2], pids[1]] # newest first
+
+
+def test_since_from_the_future_gets_a_full_snapshot():
+    h = PlayerHandler()
+    h.register()
+    assert h.list_players_since(h.version + 10)["full"] is True
+
+
+def test_moving_back_and_forth_lists_a_player_once():
+    h = PlayerHandler()
+    pid, _ = h.register()
+    since = h.version
+    for x in (64.0, 128.0, 64.0):
+        h.update(pid, x, 0.0, "map.tmx")
+    delta = h.list_players_since(since)
+    assert list(delta["players"]) == [pid]
+    assert delta["players"][pid]["x"] == 64.0
+
+
+def test_list_players_near_reports_players_walking_out_of_range():
+    h = PlayerHandler()
+    me, _ = h.register()
+    other, _ = h.register()
+    h.update(me, 0.0, 0.0, "map.tmx")
+    h.update(other, 64.0, 0.0, "map.tmx")
+
+    first = h.list_players_near(me, 2, -1)
+    assert first["full"] is True and set(first["players"]) == {other}
+
+    h.update(other, 64.0 * 10, 0.0, "map.tmx")
+    delta = h.list_players_near(me, 2, first["version"])
+    assert delta["full"] is False
+    assert delta["players"] == {}
+    assert delta["removed"] == [other]
+
+    h.update(other, 64.0, 64.0, "map.tmx") # and back in
+    delta = h.list_players_near(me, 2, delta["version"])
+    assert set(delta["players"]) == {other} and delta["removed"] == []
+
+
+def test_list_players_near_only_sees_the_callers_map():
+    h = PlayerHandler()
+    me, _ = h.register()
+    same, _ = h.register()
+    elsewhere, _ = h.register()
+    h.update(me, 0.0, 0.0, "map.tmx")
+    h.update(same, 64.0 * 500, 64.0 * 500, "map.tmx") # far, but radius 0 is the whole map
+    h.update(elsewhere, 0.0, 0.0, "home.tmx")
+    assert set(h.list_players_near(me, 0, -1)["players"]) == {same}
+    assert h.list_players_near(me, 3, -1)["players"] == {}
+    assert h.list_players_near(12345, 3, -1) is None
+
+
+def test_query_matches_a_brute_force_scan():
+    h = PlayerHandler()
+    positions = [((i * 37) % 41 * 50.0 - 400.0, (i * 13) % 29 * 70.0 - 300.0) for i in range(200)]
+    for x, y in positions:
+        h.update(h.register()[0], x, y, "map.tmx")
+    for radius in (0.0, 1.0, 100.0, 500.0, 5000.0):
+        with h._lock:
+            found = h._query("map.tmx", 10.0, 20.0, radius)
+        expected = {pid for pid, (x, y) in enumerate(positions)
+                    if radius <= 0 or (x - 10.0) ** 2 + (y - 20.0) ** 2 <= radius ** 2}
+        assert found == expected
+
+
+def test_interest_radius_rejects_what_cell_of_cannot_take():
+    assert interest_radius("2.5") == 2.5
+    assert interest_radius(0) == 0.0
+    for bad in ("nan", "inf", -1, math.inf):
+        with pytest.raises(ValueError):
+            interest_radius(bad)
+
+
+def test_snapshot_is_immutable_and_rebuilt_on_change(monkeypatch):
+    monkeypatch.setattr(playerHandler, "SNAPSHOT_INTERVAL", 0.0)
+    h = PlayerHandler()
+    pid, _ = h.register()
+    h.update(pid, 64.0, 32.0, "map.tmx")
+
+    snap = h.snapshot()
+    assert snap.version == h.version
+    assert h.snapshot() is snap # nothing changed, same object
+    assert json.loads(snap.json)["players"] == {str(pid): h.list_players()[pid]}
+    assert decode_snapshot(snap.binary)["players"] == h.list_players()
+
+    h.update(pid, 128.0, 32.0, "map.tmx")
+    assert snap.players[pid]["x"] == 64.0 # readers holding the old one see the old world
+    new = h.snapshot()
+    assert new is not snap and new.players[pid]["x"] == 128.0
+
+
+def test_snapshot_is_rate_limited(monkeypatch):
+    monkeypatch.setattr(playerHandler, "SNAPSHOT_INTERVAL", 3600.0)
+    h = PlayerHandler() # builds the first, empty one
+    h.register()
+    snap = h.snapshot()
+    assert snap.version == 0 < h.version # rebuilt at most once per interval
+    assert snap.players == {}
+
+
+def test_expiry_only_removes_players_that_went_quiet():
+    h = PlayerHandler(timeout_seconds=10.0)
+    a, _ = h.register()
+    b, _ = h.register()
+    start = h.players[a].last_update
+    h.players[b].last_update = start + 5.0 # heard from later
+
+    with h._lock:
+        assert h._expire(start + 9.0) == 0
+        assert h._expire(start + 10.5) == 1
+        assert len(h._expiry) == 1 # b was pushed back to its real deadline
+    assert not h.exists(a) and h.exists(b)
+    assert h.heartbeat(a) is False
+
+    with h._lock:
+        assert h._expire(start + 15.5) == 1
+    assert h.list_players() == {}
+
+
+def test_expiry_work_is_proportional_to_what_came_due():
+    h = PlayerHandler(timeout_seconds=10.0)
+    pids = [h.register()[0] for _ in range(100)]
+    start = min(p.last_update for p in h.players.values())
+    with h._lock:
+        h._expire(start + 1.0)
+        assert len(h._expiry) == 100 # nothing due, nothing popped or re-pushed
+        h.players[pids[0]].last_update = start - 100.0
+        h._expiry[0] = (start - 90.0, pids[0]) # due now
+        assert h._expire(start + 1.0) == 1
+
+
+@pytest.mark.parametrize("version_gap", [True, False])
+def test_load_restores_players_and_skips_versions(version_gap):
+    h = PlayerHandler()
+    pid, token = h.register()
+    h.update(pid, 128.0, 64.0, "map.tmx", "left", True)
+    state = h.dump()
+    old_cursor = h.version
+
+    restored = PlayerHandler()
+    restored.load(state, version_gap=version_gap)
+    gap = playerHandler.RESTORE_VERSION_GAP if version_gap else 0
+    assert restored.version == state["version"] + gap
+    assert restored.list_players() == h.list_players()
+
+    # every cursor from before the load is below the floor, with the gap even one that matches the dump
+    delta = restored.list_players_since(old_cursor - 1)
+    assert delta["full"] is True
+    assert set(delta["players"]) == {pid}
+    assert restored.list_players_since(old_cursor)["full"] is version_gap
+
+    assert restored.register()[0] == pid + 1
+
+
+def test_token_resumes_a_removed_player():
+    h = PlayerHandler()
+    pid, token = h.register()
+    h.update(pid, 64.0, 32.0, "map.tmx")
+    since = h.version
+    _remove(h, pid)
+    assert h.register(token) == (pid, token)
+    assert h.list_players()[pid]["x"] == 64.0 # last position kept
+    delta = h.list_players_since(since)
+    assert pid in delta["players"]
+    assert delta["removed"] == []
+    assert h.register(token) == (pid, token) # still here, same player
+
+
+def test_unknown_or_expired_token_gets_a_new_player(monkeypatch):
+    h = PlayerHandler()
+    pid, token = h.register()
+    new, new_token = h.register("not-a-token")
+    assert new == pid + 1 and new_token != "not-a-token"
+
+    monkeypatch.setattr(playerHandler, "SESSION_GRACE_TIME", -1.0)
+    _remove(h, pid)
+    assert h.register(token)[0] == pid + 2
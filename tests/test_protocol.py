@@ -0,0 +1,94 @@
+import asyncio
+import json
+
+import pytest
+
+from server.protocol import (
+    TILE_SIZE, SUBTILE, MAX_QUANTIZED, ProtocolError,
+    _quantize, _dequantize, encode_snapshot, decode_snapshot, encode_update, decode_update,
+    encode_frame, decode_payload, read_frame, FrameReader, HEADER, MAX_FRAME_SIZE,
+)
+
+
+def _snapshot(**overrides):
+    data = {
+        "version": 42,
+        "full": False,
+        "players": {
+            1: {"id": 1, "x": 128.0, "y": 96.25, "map": "map.tmx", "direction": "left", "is_moving": True},
+            7: {"id": 7, "x": 0.0, "y": 640.0, "map": "home.tmx", "direction": "up", "is_moving": False},
+        },
+        "removed": [3, 9],
+        "time": 1700000000.5,
+    }
+    data.update(overrides)
+    return data
+
+
+def test_quantize_round_trips_on_the_grid():
+    step = TILE_SIZE / SUBTILE
+    for v in (0.0, step, 64.0, 1234.5, 100.0 * TILE_SIZE + 3 * step):
+        assert _dequantize(*_quantize(v)) == v
+
+
+def test_quantize_clamps_negative_and_huge_coordinates():
+    assert _quantize(-1.0) == (0, 0)
+    assert _quantize(-1e9) == (0, 0)
+    assert _quantize(1e12) == (MAX_QUANTIZED >> 8, MAX_QUANTIZED & 0xFF)
+
+
+def test_snapshot_round_trip():
+    data = _snapshot()
+    assert decode_snapshot(encode_snapshot(data)) == data
+
+
+def test_snapshot_negative_coordinates_come_back_clamped():
+    data = _snapshot(players={2: {"id": 2, "x": -50.0, "y": -0.1, "map": "m", "direction": "down", "is_moving": False}})
+    p = decode_snapshot(encode_snapshot(data))["players"][2]
+    assert (p["x"], p["y"]) == (0.0, 0.0)
+
+
+def test_empty_full_snapshot():
+    data = {"version": 0, "full": True, "players": {}, "removed": [], "time": 0.0}
+    assert decode_snapshot(encode_snapshot(data)) == data
+
+
+def test_update_round_trip():
+    update = {"x": 320.0, "y": 64.5, "map": "map.tmx", "direction": "right", "is_moving": True}
+    assert decode_update(encode_update(5, update)) == {"id": 5, **update}
+
+
+def test_decode_payload_json_and_binary():
+    assert decode_payload(json.dumps({"type": "hello"}).encode()) == {"type": "hello"}
+    update = {"x": 64.0, "y": 64.0, "map": "m", "direction": "down", "is_moving": False}
+    assert decode_payload(encode_update(2, update)) == {"type": "update", "id": 2, **update}
+    assert decode_payload(encode_snapshot(_snapshot()))["type"] == "snapshot"
+
+
+@pytest.mark.parametrize("payload", [b"{not json", b"[1, 2]", b"\x7f", b"\x02\x01"])
+def test_decode_payload_rejects_garbage(payload):
+    with pytest.raises(ProtocolError):
+        decode_payload(payload)
+
+
+def test_read_frame():
+    async def read(data: bytes):
+        reader = asyncio.StreamReader()
+        reader.feed_data(data)
+        reader.feed_eof()
+        return [await read_frame(reader) for _ in range(2)]
+
+    assert asyncio.run(read(encode_frame({"type": "chat", "text": "hi"}))) == [{"type": "chat", "text": "hi"}, None]
+    assert asyncio.run(read(b"\x00\x00")) == [None, None] # cut off mid header
+    assert asyncio.run(read(encode_frame({"type": "hello"})[:-1])) == [None, None] # and mid payload
+    with pytest.raises(ProtocolError):
+        asyncio.run(read(HEADER.pack(MAX_FRAME_SIZE + 1)))
+
+
+def test_frame_reader_reassembles_split_frames():
+    data = encode_frame({"type": "hello"}) + encode_frame({"type": "chat", "text": "hi"})
+    reader = FrameReader()
+    frames = []
+    for i in range(len(data)):
+        frames += reader.feed(data[i:i + 1])
+    assert frames == [{"type": "hello"}, {"type": "chat", "text": "hi"}]
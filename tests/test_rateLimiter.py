@@ -0,0 +1,55 @@
+import pytest
+
+import server.rateLimiter as rateLimiter
+from server.rateLimiter import RateLimiter, TokenBucket, LIMITED
+
+
+def test_bucket_spends_its_burst_then_refills():
+    bucket = TokenBucket(rate=2.0, burst=3.0, now=0.0)
+    assert [bucket.take(0.0) for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert bucket.take(0.0) == pytest.approx(0.5) # one token at 2/s
+    assert bucket.take(0.5) == 0.0
+    assert bucket.take(100.0, cost=3.0) == 0.0 # refill stops at the burst
+    assert bucket.take(100.0) == pytest.approx(0.5)
+
+
+def test_rejected_take_costs_nothing():
+    bucket = TokenBucket(rate=1.0, burst=2.0, now=0.0)
+    assert bucket.take(0.0, cost=1.5) == 0.0
+    assert bucket.take(0.0, cost=1.0) == pytest.approx(0.5)
+    assert bucket.take(0.5, cost=1.0) == 0.0
+
+
+def test_cost_above_the_burst_is_never_allowed():
+    bucket = TokenBucket(rate=1.0, burst=2.0, now=0.0)
+    assert bucket.take(1000.0, cost=3.0) == pytest.approx(1.0)
+
+
+def test_limiter_keeps_keys_and_kinds_apart(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(rateLimiter.time, "monotonic", lambda: now[0])
+    limiter = RateLimiter({"chat": (1.0, 2.0), "poll": (10.0, 1.0)})
+    before = LIMITED.to_dict().get("chat", 0)
+
+    assert limiter.check(1, "chat") == 0.0
+    assert limiter.check(1, "chat") == 0.0
+    assert limiter.check(1, "chat") == pytest.approx(1.0)
+    assert limiter.check(2, "chat") == 0.0
+    assert limiter.check(1, "poll") == 0.0
+    assert LIMITED.to_dict().get("chat", 0) == before + 1
+
+    now[0] = 1.0
+    assert limiter.check(1, "chat") == 0.0
+
+
+def test_idle_buckets_are_pruned(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(rateLimiter.time, "monotonic", lambda: now[0])
+    limiter = RateLimiter({"chat": (1.0, 1.0)})
+    limiter.check(1, "chat")
+    now[0] = rateLimiter.IDLE_TIME / 2
+    limiter.check(2, "chat")
+
+    now[0] = rateLimiter.IDLE_TIME + 1.0
+    limiter.check(2, "chat")
+    assert set(limiter._buckets) == {(2, "chat")}
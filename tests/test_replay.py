@@ -0,0 +1,81 @@
+import http.client
+import json
+import threading
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+from server.chatHandler import ChatHandler
+from server.playerHandler import PlayerHandler
+from server.protocol import encode_update
+from server.rateLimiter import RateLimiter
+from server.recorder import Recorder, read_records
+from server.replay import Replayer, load_app
+from server.udpServer import UdpServer, encode_datagram, udp_key
+
+
+@pytest.fixture
+def recorded_server(tmp_path):
+    """ server.py's Handler on a free port, recording to a file like --record does """
+    app = load_app()
+    app.PLAYER_HANDLER = PlayerHandler() # not started, nobody expires mid-test
+    app.CHAT_HANDLER = ChatHandler()
+    app.RATE_LIMITER = RateLimiter()
+    app.RECORDER = Recorder(str(tmp_path / "traffic.rec"))
+    app.RECORDER.start(app.PLAYER_HANDLER, app.CHAT_HANDLER)
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), app.Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield app, httpd.server_address[1]
+    httpd.shutdown()
+    httpd.server_close()
+    app.RECORDER.stop()
+
+
+def _request(port, method, path, body=None):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+    try:
+        data = json.dumps(body).encode("utf-8") if body is not None else None
+        conn.request(method, path, data, {"Content-Type": "application/json"} if data else {})
+        resp = conn.getresponse()
+        return resp.status, resp.read()
+    finally:
+        conn.close()
+
+
+def test_recorded_session_replays_clean(recorded_server):
+    app, port = recorded_server
+    players = []
+    for _ in range(2):
+        status, body = _request(port, "GET", "/register")
+        assert status == 200
+        players.append(json.loads(body))
+    a, b = players
+
+    for step in range(5):
+        assert _request(port, "POST", "/players", {"id": a["id"], "x": 64.0 * step, "y": -32.0, "map": "map.tmx"})[0] == 200
+    assert _request(port, "GET", f"/players?id={b['id']}")[0] == 200
+    assert _request(port, "POST", "/players", {"id": 999, "x": 0, "y": 0, "map": "map.tmx"})[0] == 404
+    assert _request(port, "POST", "/players", {"id": a["id"]})[0] == 400
+    statuses = [_request(port, "POST", "/chat", {"id": b["id"], "text": f"hi {i}"})[0] for i in range(7)]
+    assert statuses.count(429) == 2 # burst of 5
+
+    # what UdpServer._loop does with every datagram
+    datagram = encode_datagram(udp_key(b["token"]), 1, 1,
+                               encode_update(b["id"], {"x": 128.0, "y": 64.0, "map": "map.tmx", "direction": "up", "is_moving": True}))
+    app.RECORDER.record_udp(datagram)
+    assert UdpServer(app.PLAYER_HANDLER).handle_datagram(datagram) == "accepted"
+    expected = app.PLAYER_HANDLER.list_players()
+    app.RECORDER.stop()
+
+    replayer = Replayer()
+    try:
+        with open(app.RECORDER.path, "rb") as f:
+            result = replayer.run(read_records(f))
+        assert result.sessions == 1
+        assert result.requests == {"http": 17, "udp": 1}
+        assert result.mismatches == {}
+        assert result.id_mismatches == 0
+        assert result.unlimited_429s == 2 # limiter is off when replaying as fast as possible
+        assert replayer.players.list_players() == expected
+    finally:
+        replayer.close()
@@ -0,0 +1,219 @@
+import http.client
+import json
+import socket
+import threading
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+from server.chatHandler import ChatHandler
+from server.playerHandler import PlayerHandler
+from server.protocol import BINARY_CONTENT_TYPE, encode_update
+from server.rateLimiter import RateLimiter, LIMITS
+from server.replay import load_app
+
+
+@pytest.fixture
+def app():
+    app = load_app()
+    app.PLAYER_HANDLER = PlayerHandler()
+    app.CHAT_HANDLER = ChatHandler()
+    app.RATE_LIMITER = RateLimiter()
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), app.Handler)
+    threading.Thread(target=httpd.serve_forever, args=(0.05,), daemon=True).start()
+    app.port = httpd.server_address[1]
+    yield app
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture
+def port(app):
+    return app.port
+
+
+def _raw(port: int, request: bytes) -> bytes:
+    with socket.create_connection(("127.0.0.1", port), timeout=5) as sock:
+        sock.sendall(request)
+        chunks = []
+        while chunk := sock.recv(65536):
+            chunks.append(chunk)
+    return b"".join(chunks)
+
+
+@pytest.mark.parametrize("length", [b"abc", b"-5", b"1e3"])
+def test_malformed_content_length_is_a_400(port, length):
+    for method, path in ((b"POST", b"/players"), (b"POST", b"/nowhere"), (b"GET", b"/players")):
+        reply = _raw(port, method + b" " + path + b" HTTP/1.1\r\nHost: x\r\nContent-Length: " + length + b"\r\n\r\n{}")
+        assert reply.startswith(b"HTTP/1.1 400 ")
+        assert b"Connection: close" in reply
+        assert b"invalid_content_length" in reply
+    assert _raw(port, b"GET / HTTP/1.1\r\nHost: x\r\nConnection: close\r\n\r\n").startswith(b"HTTP/1.1 200 ")
+
+
+def _json(port: int, method: str, path: str, body=None, headers=None) -> tuple[int, dict, dict]:
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+    try:
+        data = json.dumps(body).encode("utf-8") if body is not None else None
+        conn.request(method, path, data, {"Content-Type": "application/json", **(headers or {})} if data else headers or {})
+        resp = conn.getresponse()
+        raw = resp.read()
+        return resp.status, dict(resp.getheaders()), json.loads(raw) if raw else {}
+    finally:
+        conn.close()
+
+
+def test_sync_rejects_only_the_chat_over_the_limit(app, port):
+    pid = _json(port, "GET", "/register")[2]["id"]
+    body = {"id": pid, "update": {"x": 64.0, "y": 0.0, "map": "map.tmx"}, "chat": [f"msg {i}" for i in range(8)],
+            "since": -1, "chat_after": 0}
+    status, _, data = _json(port, "POST", "/sync", body)
+    assert status == 200
+    assert [m["text"] for m in data["chat"]["messages"]] == [f"msg {i}" for i in range(5)] # the burst
+    assert data["chat"]["rejected"] == 3
+    assert data["chat"]["retry_after"] > 0
+    assert app.PLAYER_HANDLER.list_players()[pid]["x"] == 64.0
+
+    # the rest of the sync keeps working while chat is over the limit
+    body.update(update={"x": 128.0, "y": 0.0, "map": "map.tmx"}, chat=["again"], chat_after=data["chat"]["last_id"])
+    status, _, data = _json(port, "POST", "/sync", body)
+    assert status == 200 and data["chat"]["rejected"] == 1
+    assert app.PLAYER_HANDLER.list_players()[pid]["x"] == 128.0
+
+
+def test_sync_over_the_poll_limit_is_a_429(port):
+    pid = _json(port, "GET", "/register")[2]["id"]
+    body = {"id": pid, "update": None, "chat": [], "since": -1}
+    for _ in range(10 * int(LIMITS["poll"][1])): # the bucket refills while we go
+        status, headers, data = _json(port, "POST", "/sync", body)
+        if status != 200:
+            break
+    assert status == 429
+    assert data["error"] == "rate_limited" and data["retry_after"] > 0
+    assert int(headers["Retry-After"]) >= 1
+
+
+# query value, the same as a JSON literal (Python's json reads NaN and Infinity)
+BAD_RADII = {"nan": "NaN", "inf": "Infinity", "-inf": "-Infinity", "-1": "-1", "abc": '"abc"'}
+
+
+@pytest.mark.parametrize("radius", BAD_RADII)
+def test_bad_radius_is_a_400(port, radius):
+    pid = _json(port, "GET", "/register")[2]["id"]
+    status, _, data = _json(port, "GET", f"/players?id={pid}&radius={radius}")
+    assert (status, data) == (400, {"error": "invalid_query"})
+
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+    try:
+        conn.request("POST", "/sync", f'{{"id": {pid}, "radius": {BAD_RADII[radius]}}}', {"Content-Type": "application/json"})
+        resp = conn.getresponse()
+        assert (resp.status, json.loads(resp.read())) == (400, {"error": "invalid_query"})
+    finally:
+        conn.close()
+    assert _json(port, "GET", f"/players?id={pid}&radius=2.5")[0] == 200
+
+
+def test_register_advertises_binary_updates(app, port):
+    data = _json(port, "GET", "/register")[2]
+    assert "binary" in data["encodings"]
+    update = {"x": 64.0, "y": 128.0, "map": "map.tmx", "direction": "left", "is_moving": True}
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+    try:
+        conn.request("POST", "/players", encode_update(data["id"], update), {"Content-Type": BINARY_CONTENT_TYPE})
+        assert conn.getresponse().status == 200
+    finally:
+        conn.close()
+    assert app.PLAYER_HANDLER.list_players()[data["id"]] == {"id": data["id"], **update}
+
+
+def test_sync_does_a_whole_tick_in_one_round_trip(app, port):
+    me = _json(port, "GET", "/register")[2]["id"]
+    other = _json(port, "GET", "/register")[2]["id"]
+    app.PLAYER_HANDLER.update(other, 64.0, 0.0, "map.tmx")
+
+    body = {"id": me, "update": {"x": 0.0, "y": 0.0, "map": "map.tmx", "direction": "up", "is_moving": True},
+            "chat": ["hello"], "since": -1, "radius": 0, "chat_after": 0}
+    status, _, data = _json(port, "POST", "/sync", body)
+    assert status == 200
+    assert data["players"]["full"] is True
+    assert list(data["players"]["players"]) == [str(other)]
+    assert [m["text"] for m in data["chat"]["messages"]] == ["hello"]
+    assert app.PLAYER_HANDLER.list_players()[me]["direction"] == "up"
+
+    # the next one is a delta, and no update is a heartbeat
+    body.update(update=None, chat=[], since=data["players"]["version"], chat_after=data["chat"]["last_id"])
+    status, _, data = _json(port, "POST", "/sync", body)
+    assert status == 200
+    assert data["players"]["full"] is False and data["players"]["players"] == {}
+    assert data["chat"]["messages"] == []
+
+
+def test_sync_errors(port):
+    assert _json(port, "POST", "/sync", {"id": 999, "update": None})[0] == 404
+    assert _json(port, "POST", "/sync", {"update": None})[0] == 400
+    pid = _json(port, "GET", "/register")[2]["id"]
+    assert _json(port, "POST", "/sync", {"id": pid, "update": {"x": 1.0}})[0] == 400
+
+
+def test_metrics_count_requests(port):
+    before = _json(port, "GET", "/metrics?format=json")[2]["http_requests_total"].get("GET,/register,200", 0)
+    _json(port, "GET", "/register")
+    _json(port, "GET", "/nowhere/123")
+    status, _, data = _json(port, "GET", "/metrics?format=json")
+    assert status == 200
+    assert data["http_requests_total"]["GET,/register,200"] == before + 1
+    assert data["http_requests_total"]["GET,other,404"] >= 1 # unknown paths share one label
+    assert data["http_request_duration_seconds"]["/register"]["count"] >= 1
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+    try:
+        conn.request("GET", "/metrics")
+        resp = conn.getresponse()
+        assert resp.getheader("Content-Type").startswith("text/plain")
+        assert b"# TYPE http_requests_total counter" in resp.read()
+    finally:
+        conn.close()
+
+
+def test_register_with_a_token_resumes(port):
+    _, _, first = _json(port, "GET", "/register")
+    _, _, again = _json(port, "GET", f"/register?token={first['token']}")
+    assert (again["id"], again["token"]) == (first["id"], first["token"])
+    _, _, other = _json(port, "GET", "/register?token=bogus")
+    assert other["id"] != first["id"]
+
+
+def test_unchanged_players_poll_is_a_304(app, port):
+    _, _, me = _json(port, "GET", "/register")
+    _, _, other = _json(port, "GET", "/register")
+    status, headers, data = _json(port, "GET", f"/players?id={me['id']}&since=-1")
+    etag = headers["ETag"]
+    assert status == 200 and etag == f'"p{data["version"]}"'
+
+    query = f"/players?id={me['id']}&since={data['version']}"
+    status, _, _ = _json(port, "GET", query, headers={"If-None-Match": etag})
+    assert status == 304
+    assert _json(port, "GET", query, headers={"If-None-Match": '"p0"'})[0] == 200 # tag for another version
+
+    app.PLAYER_HANDLER.update(other["id"], 64.0, 0.0, "", "left", True)
+    status, _, delta = _json(port, "GET", query, headers={"If-None-Match": etag})
+    assert status == 200 and str(other["id"]) in delta["players"]
+
+
+def test_unchanged_snapshot_is_a_304(app, port):
+    _json(port, "GET", "/register")
+    status, headers, _ = _json(port, "GET", "/players")
+    assert status == 200
+    assert _json(port, "GET", "/players", headers={"If-None-Match": headers["ETag"]})[0] == 304
+
+
+def test_unchanged_chat_poll_is_a_304(app, port):
+    _, _, me = _json(port, "GET", "/register")
+    status, headers, data = _json(port, "GET", "/chat?after=0")
+    assert status == 200 and data["messages"] == []
+    etag = headers["ETag"]
+    assert _json(port, "GET", "/chat?after=0", headers={"If-None-Match": etag})[0] == 304
+
+    app.CHAT_HANDLER.post(me["id"], "hi")
+    status, headers, data = _json(port, "GET", "/chat?after=0", headers={"If-None-Match": etag})
+    assert status == 200 and [m["text"] for m in data["messages"]] == ["hi"]
+    assert headers["ETag"] != etag
@@ -0,0 +1,121 @@
+import time
+
+import pytest
+
+from server.sharedTable import SharedPlayerHandler, SharedRateLimiter, _CTX
+
+
+@pytest.fixture
+def shared():
+    h = SharedPlayerHandler(capacity=128, timeout_seconds=10.0)
+    yield h
+    h.close()
+
+
+def _in_worker(target) -> None:
+    """ Run target in a forked process, like run_workers does """
+    proc = _CTX.Process(target=target)
+    proc.start()
+    proc.join(5.0)
+    assert proc.exitcode == 0
+
+
+def _last_update(h: SharedPlayerHandler, pid: int) -> float:
+    return h._read(h._slot_of(pid))[7]
+
+
+def test_delta_sees_what_another_worker_wrote(shared):
+    a, _ = shared.register()
+    since = shared.version
+
+    def worker():
+        assert shared.update(a, 64.0, 32.0, "map.tmx", "left", True)
+        shared.register()
+    _in_worker(worker)
+
+    delta = shared.list_players_since(since)
+    assert delta["full"] is False
+    assert delta["players"][a] == {"id": a, "x": 64.0, "y": 32.0, "map": "map.tmx", "direction": "left", "is_moving": True}
+    assert set(delta["players"]) == {a, a + 1} # registered in the worker
+    assert shared.list_players_since(shared.version)["players"] == {}
+
+
+def test_expiry_follows_refreshes_from_other_workers(shared):
+    a, _ = shared.register()
+    b, _ = shared.register()
+    start = max(_last_update(shared, a), _last_update(shared, b))
+    assert shared._expire(start + 1.0) == 0
+
+    def worker(): # heard from b later, the cleaner's heap doesn't know
+        slot = shared._slot_of(b)
+        with shared._lock:
+            rec = shared._read(slot)
+            shared._write(slot, *rec[1:7], rec[7] + 5.0, rec[8], rec[9])
+    _in_worker(worker)
+
+    since = shared.version
+    assert shared._expire(start + 10.5) == 1
+    assert not shared.exists(a) and shared.exists(b)
+    assert shared.list_players_since(since)["removed"] == [a]
+    assert shared._expire(start + 15.5) == 1
+    assert shared.list_players() == {}
+
+
+def test_expiry_only_reads_slots_that_came_due(shared, monkeypatch):
+    pids = [shared.register()[0] for _ in range(100)]
+    start = min(_last_update(shared, pid) for pid in pids)
+    shared._expire(start + 1.0) # first call picks up every slot
+
+    reads = []
+    read = shared._read
+    monkeypatch.setattr(shared, "_read", lambda slot: reads.append(slot) or read(slot))
+    assert shared._expire(start + 1.0) == 0
+    assert reads == []
+
+    shared.register()
+    reads.clear() # register() scans, the cleaner shouldn't
+    assert shared._expire(start + 1.0) == 0
+    assert reads == [100] # only the new slot
+
+
+def test_rate_limits_are_shared_between_workers():
+    limiter = SharedRateLimiter({"chat": (1.0, 5.0), "poll": (75.0, 40.0)}, capacity=8)
+    try:
+        def worker():
+            assert all(limiter.check(7, "chat") == 0 for _ in range(5))
+        _in_worker(worker)
+
+        assert limiter.check(7, "chat") > 0 # burst already spent in the other worker
+        assert limiter.check(8, "chat") == 0
+        assert limiter.check(7, "poll") == 0
+        with limiter._lock:
+            assert limiter._prune(time.monotonic()) == 3
+        assert limiter.check(7, "chat") > 0 # pruning keeps active buckets
+    finally:
+        limiter.close()
+
+
+def test_full_rate_limit_table_lets_new_keys_through():
+    limiter = SharedRateLimiter({"chat": (1.0, 1.0)}, capacity=4)
+    try:
+        for key in range(limiter._mask // 2 + 1):
+            assert limiter.check(key, "chat") == 0
+        assert limiter.check(0, "chat") > 0
+        assert limiter.check(1000, "chat") == 0
+        assert limiter.check(1000, "chat") == 0 # not tracked
+    finally:
+        limiter.close()
+
+
+def test_token_resumes_a_player_expired_in_another_worker(shared):
+    pid, token = shared.register()
+    start = _last_update(shared, pid)
+    assert shared._expire(start + 10.5) == 1
+    assert not shared.exists(pid)
+
+    def worker():
+        assert shared.register(token) == (pid, token)
+    _in_worker(worker)
+
+    assert shared.exists(pid)
+    assert shared.register("not-a-token")[0] == pid + 1
@@ -0,0 +1,71 @@
+import json
+import time
+
+import pytest
+
+from server.chatHandler import ChatHandler
+from server.playerHandler import PlayerHandler
+from server.sharedTable import SharedChatHandler, SharedPlayerHandler
+from server.stateStore import StateStore
+
+
+def _session():
+    players, chat = PlayerHandler(), ChatHandler()
+    pid, _ = players.register()
+    players.update(pid, 32.0, 96.0, "map.tmx", "up", False)
+    chat.post(pid, "hello")
+    return players, chat, pid
+
+
+def test_save_and_load_round_trip(tmp_path):
+    path = str(tmp_path / "saves" / "state.json")
+    players, chat, pid = _session()
+    StateStore(path, players, chat).save()
+
+    restored_players, restored_chat = PlayerHandler(), ChatHandler()
+    assert StateStore(path, restored_players, restored_chat).load() is True
+    assert restored_players.list_players() == players.list_players()
+    assert restored_chat.list_messages() == chat.list_messages()
+    assert restored_players.register()[0] == pid + 1
+    assert [p.name for p in tmp_path.joinpath("saves").iterdir()] == ["state.json"] # no temp file left behind
+
+
+def test_load_into_the_shared_table(tmp_path):
+    path = str(tmp_path / "state.json")
+    players, chat, pid = _session()
+    StateStore(path, players, chat).save()
+
+    shared_players, shared_chat = SharedPlayerHandler(capacity=8), SharedChatHandler(max_messages=8)
+    try:
+        assert StateStore(path, shared_players, shared_chat).load() is True
+        assert shared_players.list_players() == players.list_players()
+        assert shared_chat.list_messages() == chat.list_messages()
+        assert shared_players.register()[0] == pid + 1
+    finally:
+        shared_players.close()
+        shared_chat.close()
+
+
+def test_stale_snapshot_keeps_ids_but_not_players(tmp_path):
+    path = tmp_path / "state.json"
+    players, chat, pid = _session()
+    StateStore(str(path), players, chat).save()
+    state = json.loads(path.read_text())
+    state["saved_at"] = time.time() - players.timeout - 1.0
+    path.write_text(json.dumps(state))
+
+    restored_players, restored_chat = PlayerHandler(), ChatHandler()
+    assert StateStore(str(path), restored_players, restored_chat).load() is True
+    assert restored_players.list_players() == {}
+    assert restored_players.register()[0] == pid + 1
+    assert restored_chat.list_messages() == chat.list_messages()
+
+
+@pytest.mark.parametrize("content", [None, "{not json", '{"format": 99}', '{"format": 1}'])
+def test_missing_or_bad_snapshot_is_ignored(tmp_path, content):
+    path = tmp_path / "state.json"
+    if content is not None:
+        path.write_text(content)
+    players = PlayerHandler()
+    assert StateStore(str(path), players, ChatHandler()).load() is False
+    assert players.list_players() == {} and players.register()[0] == 0
@@ -0,0 +1,106 @@
+import asyncio
+
+import pytest
+
+from server.chatHandler import ChatHandler
+from server.playerHandler import PlayerHandler
+from server.protocol import ProtocolError, FrameReader, encode_frame
+from server.streamServer import StreamServer, Connection
+
+
+class FakeTransport:
+    def get_write_buffer_size(self) -> int:
+        return 0
+
+
+class FakeWriter:
+    def __init__(self):
+        self.data = bytearray()
+        self.closed = False
+        self.transport = FakeTransport()
+
+    def write(self, data: bytes) -> None:
+        self.data += data
+
+    def close(self) -> None:
+        self.closed = True
+
+    def is_closing(self) -> bool:
+        return self.closed
+
+    def get_extra_info(self, name, default=None):
+        return default
+
+    def frames(self) -> list[dict]:
+        return FrameReader().feed(bytes(self.data))
+
+
+@pytest.fixture
+def server():
+    return StreamServer(PlayerHandler(), ChatHandler())
+
+
+@pytest.mark.parametrize("hello", [
+    {"radius": "abc"}, {"radius": None}, {"radius": float("nan")}, {"radius": -1},
+    {"chat_after": "x"}, {"chat_after": None}, {"token": ["not", "a", "token"]},
+])
+def test_bad_hello_is_a_protocol_error(server, hello):
+    with pytest.raises(ProtocolError):
+        server._on_message(Connection(FakeWriter()), {"type": "hello", **hello})
+    assert server.players.list_players() == {}
+
+
+def _client(server, data: bytes) -> FakeWriter:
+    async def run():
+        reader = asyncio.StreamReader()
+        reader.feed_data(data)
+        reader.feed_eof()
+        await server._handle_client(reader, writer)
+
+    writer = FakeWriter()
+    asyncio.run(run())
+    return writer
+
+
+def test_client_closing_mid_frame_is_an_eof(server):
+    hello = encode_frame({"type": "hello", "token": None})
+    writer = _client(server, hello + encode_frame({"type": "chat", "text": "hi"})[:-2])
+    assert writer.closed
+    assert writer.frames()[0]["type"] == "welcome"
+    assert server.connections == set()
+
+
+def test_bad_hello_only_drops_that_client(server):
+    writer = _client(server, encode_frame({"type": "hello", "radius": "far"}))
+    assert writer.closed and writer.data == b""
+
+
+def test_broadcast_survives_a_failing_connection(server, monkeypatch):
+    good, bad = Connection(FakeWriter()), Connection(FakeWriter())
+    server._on_message(good, {"type": "hello"})
+    server._on_message(bad, {"type": "hello"})
+    near = server.players.list_players_near
+
+    def list_players_near(pid, radius, since):
+        if pid == bad.pid:
+            raise ValueError("cannot encode")
+        return near(pid, radius, since)
+
+    monkeypatch.setattr(server.players, "list_players_near", list_players_near)
+    server._broadcast()
+    assert bad.writer.closed and bad not in server.connections
+    assert [f["type"] for f in good.writer.frames()] == ["welcome", "snapshot"]
+    server._broadcast() # and the next tick still runs
+    assert good in server.connections
+
+
+def test_hello_resumes_by_token_only(server):
+    pid, token = server.players.register()
+    thief = Connection(FakeWriter())
+    server._on_message(thief, {"type": "hello", "id": pid})
+    assert thief.pid != pid
+
+    conn = Connection(FakeWriter())
+    server._on_message(conn, {"type": "hello", "token": token})
+    assert conn.pid == pid
+    assert conn.writer.frames()[0] == {"type": "welcome", "id": pid, "token": token, "encoding": "json"}